@@ -0,0 +1,102 @@
+"""Maintenance commands, run as ``python -m app.cli <command>``."""
+import argparse
+import asyncio
+import json
+import os
+import sys
+
+from alembic import command
+from alembic.config import Config
+from sqlalchemy import inspect
+
+from app.models.core import Base
+from app.models.database import SessionLocal, engine
+from app.services import catalog_import as import_service
+from app.services import counters as counter_service
+
+
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "alembic.ini")
+
+# Revisions matching the schemas the app used to create at startup: the
+# original tables, and the ones with timestamps and counter triggers.
+BASELINE_REVISION = "0000"
+INITIAL_REVISION = "0001"
+
+
+def alembic_config(connection=None):
+    config = Config(ALEMBIC_INI)
+    if connection is not None:
+        config.attributes["connection"] = connection
+    return config
+
+
+def _migrate(connection, revision):
+    config = alembic_config(connection)
+    if connection.dialect.name == "sqlite":
+        # The revisions are PostgreSQL DDL.  SQLite (local runs and
+        # benchmarks) gets the current tables and triggers from the models.
+        if revision != "head":
+            raise SystemExit("SQLite databases can only be migrated to head")
+        Base.metadata.create_all(connection)
+        command.stamp(config, "head")
+        return
+    inspector = inspect(connection)
+    if inspector.has_table("menus") and not inspector.has_table("alembic_version"):
+        # Created by create_all before migrations existed: adopt it at the
+        # revision it matches and upgrade from there.
+        columns = {column["name"] for column in inspector.get_columns("menus")}
+        command.stamp(config, INITIAL_REVISION if "updated_at" in columns else BASELINE_REVISION)
+    command.upgrade(config, revision)
+
+
+async def migrate(args):
+    # One transaction: PostgreSQL DDL is transactional, a failed upgrade leaves nothing behind.
+    async with engine.begin() as connection:
+        await connection.run_sync(_migrate, args.revision)
+
+
+async def recount(args):
+    async with SessionLocal() as db:
+        await counter_service.recount(db)
+    print("counters recomputed")
+
+
+async def import_catalog(args):
+    format = args.format or ("csv" if args.path.endswith(".csv") else "json")
+    with open(args.path, "rb") as file:
+        async with SessionLocal() as db:
+            report = await import_service.import_catalog(db, file, format, args.dry_run)
+    print(json.dumps(report, indent=2))
+    if report["errors"]:
+        sys.exit(1)
+
+
+async def run(args):
+    try:
+        await args.func(args)
+    finally:
+        await engine.dispose()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m app.cli")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    migrate_parser = commands.add_parser("migrate", help="upgrade the database schema")
+    migrate_parser.add_argument("revision", nargs="?", default="head", help="target revision (default: head)")
+    migrate_parser.set_defaults(func=migrate)
+
+    commands.add_parser("recount", help="recompute submenu and dish counters").set_defaults(func=recount)
+
+    import_parser = commands.add_parser("import", help="bulk load a catalog from a JSON or CSV file")
+    import_parser.add_argument("path")
+    import_parser.add_argument("--format", choices=sorted(import_service.PARSERS), help="default: from the file extension")
+    import_parser.add_argument("--dry-run", action="store_true", help="validate and roll back")
+    import_parser.set_defaults(func=import_catalog)
+
+    args = parser.parse_args(argv)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,34 +1,44 @@
-from fastapi import FastAPI, APIRouter
+from contextlib import asynccontextmanager
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import FastAPI
 
 from typing import List, Dict
 
-import app.models.core
-from app.models.database import engine
-
-app.models.core.Base.metadata.create_all(bind=engine)
+from app import metrics
+from app.models.database import engine, replica_engines
+from app.models.replicas import ReplicaMiddleware, replica_set
 
 from app.routers.menus import menu_router
 from app.routers.dishes import dish_router
 from app.routers.submenus import submenu_router
-from app.models import core as models
+from app.routers.stats import stats_router
+from app.routers.catalog import catalog_router
+from app.routers.search import search_router
+from app.routers.metrics import metrics_router
+
+
+# Startup does no DDL: the schema is managed by `python -m app.cli migrate`,
+# which runs once per deploy instead of once per worker.
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    yield
+    await engine.dispose()
+    await replica_set.dispose()
 
-app = FastAPI()
+
+app = FastAPI(lifespan=lifespan)
 
 app.include_router(menu_router)
 app.include_router(dish_router)
 app.include_router(submenu_router)
-
-def reset_database():
-    try:
-        with Session(engine) as db:
-            db.query(models.Submenu).delete()
-            db.query(models.Menu).delete()
-            db.query(models.Dish).delete()
-            db.commit()
-    except Exception as e:
-        print(f"An exception occurred while resetting the database: {e}")
-
-reset_database()
+app.include_router(stats_router)
+app.include_router(catalog_router)
+app.include_router(search_router)
+app.include_router(metrics_router)
+
+# Inside the metrics middleware, which sees a read retried on the primary once.
+app.add_middleware(ReplicaMiddleware)
+app.add_middleware(metrics.MetricsMiddleware)
+metrics.instrument(engine.sync_engine)
+for replica_engine in replica_engines:
+    metrics.instrument(replica_engine.sync_engine)
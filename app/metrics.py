@@ -0,0 +1,132 @@
+"""Prometheus metrics for HTTP requests and the SQL they issue.
+
+``MetricsMiddleware`` is a plain ASGI middleware: per route template it counts
+responses by status, observes latency and tracks requests in flight.  Each
+request also gets a ``RequestSQL`` tally in a context variable, which the
+cursor events installed by ``instrument`` fill in, so statement counts and DB
+time are attributed to the request that caused them.  ``GET /metrics``
+exposes everything in the Prometheus text format, along with the reads
+coalesced by ``app.services.singleflight``.
+
+Routes are labelled with their template (``/api/v1/menus/{menu_id}``), never
+the raw path, to keep the number of series bounded.  Paths outside the API
+schema (redirects to the trailing-slash form, ``/metrics``) share one label.
+"""
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+from prometheus_client import Counter, Gauge, Histogram
+from sqlalchemy import event
+from starlette.routing import compile_path
+
+
+UNMATCHED = "unmatched"
+
+REQUESTS = Counter(
+    "http_requests", "HTTP responses by route and status.", ["method", "route", "status"]
+)
+LATENCY = Histogram(
+    "http_request_duration_seconds", "Time to send the whole response.", ["method", "route"],
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10),
+)
+IN_PROGRESS = Gauge(
+    "http_requests_in_progress", "Requests being handled.", ["method", "route"]
+)
+SQL_STATEMENTS = Histogram(
+    "http_request_sql_statements", "SQL statements issued per request.", ["method", "route"],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+SQL_SECONDS = Histogram(
+    "http_request_sql_duration_seconds", "Time spent executing SQL per request.", ["method", "route"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5),
+)
+# Labelled by the kind of cache key (``menu``, ``dishes``...), not the key.
+COALESCED = Counter(
+    "coalesced_reads", "Reads that joined an identical load already in flight.", ["key"]
+)
+
+
+# BEGIN never reaches the cursor with asyncpg but does on SQLite, and
+# savepoints do everywhere; none of them is counted, so the numbers compare.
+TRANSACTION_CONTROL = ("BEGIN", "SAVEPOINT", "RELEASE SAVEPOINT", "ROLLBACK TO SAVEPOINT")
+
+
+def is_transaction_control(statement):
+    return statement.startswith(TRANSACTION_CONTROL)
+
+
+class RequestSQL:
+    __slots__ = ("request", "statements", "seconds")
+
+    def __init__(self, request):
+        self.request = request
+        self.statements = 0
+        self.seconds = 0.0
+
+
+current_sql: ContextVar[Optional[RequestSQL]] = ContextVar("current_sql", default=None)
+
+
+def instrument(engine):
+    """Attribute the statements run on ``engine`` (a sync Engine) to the current request."""
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if context is not None:
+            context._metrics_started = time.perf_counter()
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        tally = current_sql.get()
+        if tally is not None and context is not None and not is_transaction_control(statement):
+            tally.statements += 1
+            tally.seconds += time.perf_counter() - context._metrics_started
+
+
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self._routes = None
+
+    def _route(self, scope):
+        if self._routes is None:
+            # Built on the first request, once every router is included, from
+            # the OpenAPI paths, which list the templates in matching order.
+            self._routes = [(compile_path(path)[0], path) for path in scope["app"].openapi()["paths"]]
+        path = scope["path"]
+        for regex, template in self._routes:
+            if regex.match(path):
+                return template
+        return UNMATCHED
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        method = scope["method"]
+        route = self._route(scope)
+        status = 500
+
+        async def send_with_status(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        tally = RequestSQL(f"{method} {route}")
+        token = current_sql.set(tally)
+        in_progress = IN_PROGRESS.labels(method, route)
+        in_progress.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            in_progress.dec()
+            current_sql.reset(token)
+            REQUESTS.labels(method, route, str(status)).inc()
+            LATENCY.labels(method, route).observe(elapsed)
+            SQL_STATEMENTS.labels(method, route).observe(tally.statements)
+            SQL_SECONDS.labels(method, route).observe(tally.seconds)
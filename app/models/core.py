@@ -1,60 +1,107 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, Numeric, event
+from sqlalchemy import DDL, Column, Computed, Index, Integer, String, Float, ForeignKey, Numeric, Uuid, event, func
 from sqlalchemy.ext.declarative import declarative_base
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 from sqlalchemy.ext.hybrid import hybrid_property
-from sqlalchemy.dialects.postgresql import UUID
+from sqlalchemy.dialects.postgresql import TSVECTOR
 from uuid import uuid4
+from datetime import datetime, timezone
 from app.models.database import get_db as db
+from app.models import search
+from app.models import triggers
+from app.models.types import UTCDateTime
 
 Base = declarative_base()
 
 
+def utcnow():
+    return datetime.now(timezone.utc)
+
+
 
 class Menu(Base):
     __tablename__ = "menus"
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
-    title = Column(String, index=True, unique=False)
-    description = Column(String, index=True)
-    submenus_count = Column(Integer, default=0)
-    dishes_count = Column(Integer, default=0)
-    submenus = relationship("Submenu", back_populates="menu", cascade="all, delete")
+    id = Column(Uuid, primary_key=True, default=uuid4)
+    title = Column(String, unique=False)
+    description = Column(String)
+    # Maintained by the triggers in app.models.triggers, never written here.
+    submenus_count = Column(Integer, default=0, server_default="0", nullable=False)
+    dishes_count = Column(Integer, default=0, server_default="0", nullable=False)
+    # Creation order drives keyset pagination, see app.services.pagination.
+    created_at = Column(UTCDateTime, default=utcnow, server_default=func.now(), nullable=False)
+    # Bumped by the triggers on any change to the row or its children; the
+    # ETag of every GET is derived from it, see app.services.conditional.
+    updated_at = Column(UTCDateTime, default=utcnow, server_default=func.now(), nullable=False)
+    # Bumped by every PATCH, and only then; PATCH can require the version the
+    # client edited, see app.services.conditional.update_row.
+    version = Column(Integer, default=1, server_default="1", nullable=False)
+    # Children are removed by ON DELETE CASCADE, the ORM never loads them for a delete.
+    submenus = relationship(
+        "Submenu", back_populates="menu", cascade="all, delete", passive_deletes=True, order_by="Submenu.created_at"
+    )
 
+    __table_args__ = (
+        Index("ix_menus_created_at_id", "created_at", "id"),
+    )
 
-    def get_submenus_and_dishes_count(self, session):
-    
-        submenus_count = (
-            session.query(Submenu)
-            .filter(Submenu.menu_id == self.id)
-            .count()
-        )
-        dishes_count = (
-            session.query(Dish)
-            .join(Submenu, Dish.submenu_id == Submenu.id)
-            .filter(Submenu.menu_id == self.id)
-            .count()
-        )
-        return submenus_count, dishes_count
 
 
 class Submenu(Base):
     __tablename__ = "submenus"
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
-    title = Column(String, index=True, unique=False)
+    id = Column(Uuid, primary_key=True, default=uuid4)
+    title = Column(String, unique=False)
     description = Column(String, nullable=True, unique=False)
-    dishes_count = Column(Integer, default=0)
-    menu_id = Column(UUID(as_uuid=True), ForeignKey("menus.id"))
+    # Generated by the database, only read by app.services.search.
+    search_vector = deferred(Column(
+        TSVECTOR, Computed(search.SEARCH_VECTOR, persisted=True), info={search.POSTGRESQL_ONLY: True}
+    ))
+    dishes_count = Column(Integer, default=0, server_default="0", nullable=False)
+    menu_id = Column(Uuid, ForeignKey("menus.id", ondelete="CASCADE"))
+    created_at = Column(UTCDateTime, default=utcnow, server_default=func.now(), nullable=False)
+    updated_at = Column(UTCDateTime, default=utcnow, server_default=func.now(), nullable=False)
+    version = Column(Integer, default=1, server_default="1", nullable=False)
     
     menu = relationship("Menu", back_populates="submenus")
-    dishes = relationship("Dish", back_populates="submenu", cascade="all, delete")
+    dishes = relationship(
+        "Dish", back_populates="submenu", cascade="all, delete", passive_deletes=True, order_by="Dish.created_at"
+    )
+
+    __table_args__ = (
+        Index("ix_submenus_menu_id_created_at_id", "menu_id", "created_at", "id"),
+        # Path checks of nested routes (id under menu_id), index-only.
+        Index("ix_submenus_menu_id_id", "menu_id", "id"),
+        Index("ix_submenus_search_vector", "search_vector", postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+    # Do not fetch search_vector back with every INSERT.
+    __mapper_args__ = {"eager_defaults": False}
 
     
 
 class Dish(Base):
     __tablename__ = "dishes"
-    id = Column(UUID(as_uuid=True), primary_key=True, default=uuid4)
-    title = Column(String, index=True)
-    description = Column(String, index=True)
+    id = Column(Uuid, primary_key=True, default=uuid4)
+    title = Column(String)
+    description = Column(String)
+    search_vector = deferred(Column(
+        TSVECTOR, Computed(search.SEARCH_VECTOR, persisted=True), info={search.POSTGRESQL_ONLY: True}
+    ))
     price = Column(Numeric(10, 2), nullable=False)
     
-    submenu_id = Column(UUID(as_uuid=True), ForeignKey("submenus.id"))
+    submenu_id = Column(Uuid, ForeignKey("submenus.id", ondelete="CASCADE"))
+    created_at = Column(UTCDateTime, default=utcnow, server_default=func.now(), nullable=False)
+    updated_at = Column(UTCDateTime, default=utcnow, server_default=func.now(), nullable=False)
+    version = Column(Integer, default=1, server_default="1", nullable=False)
     submenu = relationship("Submenu", back_populates="dishes")
+
+    __table_args__ = (
+        Index("ix_dishes_submenu_id_created_at_id", "submenu_id", "created_at", "id"),
+        Index("ix_dishes_submenu_id_id", "submenu_id", "id"),
+        Index("ix_dishes_search_vector", "search_vector", postgresql_using="gin").ddl_if(dialect="postgresql"),
+    )
+    __mapper_args__ = {"eager_defaults": False}
+
+
+for statement in triggers.POSTGRESQL + search.POSTGRESQL:
+    event.listen(Base.metadata, "after_create", DDL(statement).execute_if(dialect="postgresql"))
+for statement in triggers.SQLITE:
+    # DDL applies %-formatting, the strftime patterns need escaping.
+    event.listen(Base.metadata, "after_create", DDL(statement.replace("%", "%%")).execute_if(dialect="sqlite"))
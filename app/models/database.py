@@ -1,20 +1,131 @@
-from sqlalchemy import create_engine, event
-from sqlalchemy.orm import sessionmaker, Session
+import os
+from contextvars import ContextVar
+from typing import Optional
 
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.pool import AsyncAdaptedQueuePool, StaticPool
 
-SQLALCHEMY_DATABASE_URL = "postgresql://postgres:postgres@db:5432/app_db"
+from app.models.pool import InstrumentedPool, instrument
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL
+
+def _async_url(url):
+    # docker-compose passes a plain postgresql:// URL; the app always talks
+    # asyncpg, or aiosqlite for local tests and benchmarks.
+    url = make_url(url)
+    if url.drivername in ("postgres", "postgresql", "postgresql+psycopg2", "postgresql+psycopg"):
+        url = url.set(drivername="postgresql+asyncpg")
+    elif url.drivername in ("sqlite", "sqlite+pysqlite"):
+        url = url.set(drivername="sqlite+aiosqlite")
+    return url
+
+
+SQLALCHEMY_DATABASE_URL = _async_url(
+    os.environ.get("SQLALCHEMY_DATABASE_URL", "postgresql+asyncpg://postgres:postgres@db:5432/app_db")
 )
 
+# Comma-separated read replicas of the primary; GET requests read from them
+# (see app.models.replicas).  Empty: everything goes to the primary.
+SQLALCHEMY_REPLICA_URLS = [
+    _async_url(url.strip()) for url in os.environ.get("SQLALCHEMY_REPLICA_URLS", "").split(",") if url.strip()
+]
+# How long a client's reads stay on the primary after its last write, unless
+# a replica has replayed the write earlier.
+REPLICA_PIN_SECONDS = float(os.environ.get("REPLICA_PIN_SECONDS", "5"))
+# How long a replica that failed stays out of the pool.
+REPLICA_EJECT_SECONDS = float(os.environ.get("REPLICA_EJECT_SECONDS", "30"))
+
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+DB_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+DB_POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "-1"))
+DB_POOL_PRE_PING = os.environ.get("DB_POOL_PRE_PING", "false").lower() in ("1", "true", "yes")
+# Milliseconds, 0 disables the limit.
+DB_STATEMENT_TIMEOUT = int(os.environ.get("DB_STATEMENT_TIMEOUT", "0"))
+
+
+def _connect_args(url):
+    if url.get_driver_name() == "asyncpg" and DB_STATEMENT_TIMEOUT:
+        return {"server_settings": {"statement_timeout": str(DB_STATEMENT_TIMEOUT)}}
+    return {}
+
+
+def _pool_args(url, poolclass):
+    if url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:"):
+        # Every connection to :memory: is a new, empty database: share one.
+        return {"poolclass": StaticPool}
+    return {
+        "poolclass": poolclass,
+        "pool_size": DB_POOL_SIZE,
+        "max_overflow": DB_MAX_OVERFLOW,
+        "pool_timeout": DB_POOL_TIMEOUT,
+        "pool_recycle": DB_POOL_RECYCLE,
+        "pool_pre_ping": DB_POOL_PRE_PING,
+    }
+
+
+def _sqlite(engine):
+    """Foreign keys (for ON DELETE CASCADE) and real transactions on SQLite.
+
+    The driver's own transaction handling does not support SAVEPOINT, so it
+    is turned off and SQLAlchemy emits BEGIN itself.
+    """
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        cursor = dbapi_connection.cursor()
+        cursor.execute("PRAGMA foreign_keys = ON")
+        cursor.close()
+
+    @event.listens_for(engine, "begin")
+    def on_begin(connection):
+        connection.exec_driver_sql("BEGIN")
+
+
+def create_engine(url, poolclass=AsyncAdaptedQueuePool):
+    engine = create_async_engine(url, connect_args=_connect_args(url), **_pool_args(url, poolclass))
+    if engine.dialect.name == "sqlite":
+        _sqlite(engine.sync_engine)
+    return engine
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, InstrumentedPool)
+instrument(engine.sync_engine)
+# Their pools are not counted in pool_stats, which describes the primary's.
+replica_engines = [create_engine(url) for url in SQLALCHEMY_REPLICA_URLS]
+
+
+
+# Objects stay usable after commit: lazy refreshes are not possible on an
+# AsyncSession, services refresh explicitly where they need server values.
+SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, autoflush=False, expire_on_commit=False)
+
+
+class Route:
+    """Where the current request reads: a replica engine, or the primary (``None``).
+
+    ``pinned`` requests read the primary for read-your-writes and bypass the
+    shared cache.
+    """
+
+    __slots__ = ("replica", "pinned")
+
+    def __init__(self, replica: Optional[AsyncEngine] = None, pinned: bool = False):
+        self.replica = replica
+        self.pinned = pinned
+
 
+# Set per request by app.models.replicas.ReplicaMiddleware.
+current_route: ContextVar[Optional[Route]] = ContextVar("current_route", default=None)
 
-SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
-def get_db():
-    db = SessionLocal()
-    try:
-        yield db
-    finally:
-        db.close()
+async def get_db():
+    route = current_route.get()
+    if route is None or route.replica is None:
+        async with SessionLocal() as db:
+            yield db
+    else:
+        async with SessionLocal(bind=route.replica) as db:
+            yield db
@@ -0,0 +1,88 @@
+"""Connection pool with acquisition telemetry.
+
+``InstrumentedPool`` times every checkout from the moment a session asks for
+a connection until it gets one, which is the number that shows pool
+starvation.  The rest comes from SQLAlchemy pool events.  Counters live in the
+module-level ``pool_stats`` so they survive ``engine.dispose()``, which
+replaces the pool object.
+"""
+import time
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+
+
+class PoolStats:
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.checkouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+        self.timeouts = 0
+        self.connects = 0
+        self.invalidations = 0
+        self.soft_invalidations = 0
+
+    def record_wait(self, seconds):
+        self.wait_seconds_total += seconds
+        if seconds > self.wait_seconds_max:
+            self.wait_seconds_max = seconds
+
+    def snapshot(self, pool):
+        snapshot = {}
+        if isinstance(pool, QueuePool):
+            # The SQLite in-memory engine uses a StaticPool, which has no queue.
+            snapshot = {
+                "size": pool.size(),
+                "checked_out": pool.checkedout(),
+                "checked_in": pool.checkedin(),
+                # QueuePool counts overflow from -size up; only the excess is overflow.
+                "overflow": max(pool.overflow(), 0),
+                "max_overflow": pool._max_overflow,
+            }
+        return {
+            **snapshot,
+            "checkouts": self.checkouts,
+            "wait_seconds_total": self.wait_seconds_total,
+            "wait_seconds_max": self.wait_seconds_max,
+            "wait_seconds_avg": self.wait_seconds_total / self.checkouts if self.checkouts else 0.0,
+            "timeouts": self.timeouts,
+            "connects": self.connects,
+            "invalidations": self.invalidations,
+            "soft_invalidations": self.soft_invalidations,
+        }
+
+
+pool_stats = PoolStats()
+
+
+class InstrumentedPool(AsyncAdaptedQueuePool):
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            pool_stats.timeouts += 1
+            raise
+        finally:
+            pool_stats.record_wait(time.perf_counter() - started)
+        pool_stats.checkouts += 1
+        return connection
+
+
+def instrument(engine):
+    """Hook the pool events of ``engine`` (a sync Engine) into ``pool_stats``."""
+
+    @event.listens_for(engine, "connect")
+    def on_connect(dbapi_connection, connection_record):
+        pool_stats.connects += 1
+
+    @event.listens_for(engine, "invalidate")
+    def on_invalidate(dbapi_connection, connection_record, exception):
+        pool_stats.invalidations += 1
+
+    @event.listens_for(engine, "soft_invalidate")
+    def on_soft_invalidate(dbapi_connection, connection_record, exception):
+        pool_stats.soft_invalidations += 1
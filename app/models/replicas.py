@@ -0,0 +1,212 @@
+"""Read replicas: GET requests read from them, writes and everything else from the primary.
+
+``ReplicaMiddleware`` is a plain ASGI middleware like ``MetricsMiddleware``.
+For a GET or HEAD it picks a healthy replica round-robin and sets
+``current_route``, which makes ``get_db`` open the request's session on it.
+Without ``SQLALCHEMY_REPLICA_URLS`` it does nothing.
+
+Read-your-writes: a successful write answers with a ``read_primary`` cookie
+holding the primary's WAL position after the write, valid for
+``REPLICA_PIN_SECONDS``.  While a client sends it, its reads go to the
+primary, unless a replica has replayed that position already.  On databases
+without a WAL position (SQLite) the pin simply lasts for the whole window.
+Pinned reads also bypass the shared cache, which replicas may have filled
+with data from before the write.
+
+A replica that fails with a connection error, including while checking its
+position, is ejected for ``REPLICA_EJECT_SECONDS``.  A read that failed on it
+before sending anything is retried on the primary.
+"""
+import asyncio
+import math
+import re
+import time
+from typing import List, Optional
+
+from sqlalchemy import exc, text
+from sqlalchemy.ext.asyncio import AsyncEngine
+from starlette.requests import cookie_parser
+
+from app.models.database import (
+    REPLICA_EJECT_SECONDS, REPLICA_PIN_SECONDS, Route, current_route, engine, replica_engines,
+)
+
+
+PIN_COOKIE = "read_primary"
+READ_METHODS = ("GET", "HEAD")
+LSN = re.compile(r"[0-9A-F]{1,8}/[0-9A-F]{1,8}")
+
+
+def is_connection_error(error: BaseException):
+    """Whether ``error`` means the database is unreachable or unusable, not that the query is wrong."""
+    if isinstance(error, exc.DBAPIError):
+        return error.connection_invalidated or isinstance(error, (exc.OperationalError, exc.InterfaceError))
+    return isinstance(error, (OSError, asyncio.TimeoutError))
+
+
+class Replica:
+    def __init__(self, engine: AsyncEngine):
+        self.engine = engine
+        self.reads = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+        self.last_error: Optional[str] = None
+
+    @property
+    def healthy(self):
+        return self.ejected_until <= time.monotonic()
+
+    async def caught_up(self, lsn: str):
+        """Whether the replica has replayed the primary up to ``lsn``; never for a non-standby."""
+        async with self.engine.connect() as conn:
+            return bool(await conn.scalar(
+                text("SELECT pg_last_wal_replay_lsn() >= CAST(CAST(:lsn AS text) AS pg_lsn)"), {"lsn": lsn}
+            ))
+
+    def stats(self):
+        return {
+            "url": self.engine.url.render_as_string(hide_password=True),
+            "healthy": self.healthy,
+            "ejected_for": max(self.ejected_until - time.monotonic(), 0.0),
+            "reads": self.reads,
+            "ejections": self.ejections,
+            "last_error": self.last_error,
+        }
+
+
+class ReplicaSet:
+    def __init__(self, engines: List[AsyncEngine], eject_seconds: float = REPLICA_EJECT_SECONDS):
+        self.replicas = [Replica(engine) for engine in engines]
+        self.eject_seconds = eject_seconds
+        self.primary_reads = 0
+        self.pinned_reads = 0
+        self._next = 0
+
+    def _healthy(self):
+        """Healthy replicas, starting one further at every call."""
+        count = len(self.replicas)
+        start, self._next = self._next, (self._next + 1) % count
+        ordered = (self.replicas[(start + i) % count] for i in range(count))
+        return [replica for replica in ordered if replica.healthy]
+
+    def eject(self, replica: Replica, error: BaseException):
+        replica.ejected_until = time.monotonic() + self.eject_seconds
+        replica.ejections += 1
+        replica.last_error = f"{type(error).__name__}: {error}"
+
+    async def choose(self, pin: Optional[str]):
+        """The replica to read from, or ``None`` for the primary.
+
+        ``pin`` is the client's ``read_primary`` position: ``None`` when the
+        client is not pinned, ``""`` when there is no position to compare.
+        """
+        if pin == "":
+            return None
+        for replica in self._healthy():
+            if pin is None:
+                return replica
+            try:
+                if await replica.caught_up(pin):
+                    return replica
+            except Exception as error:
+                if not is_connection_error(error):
+                    raise
+                self.eject(replica, error)
+        return None
+
+    async def primary_position(self):
+        """The primary's current WAL position, ``""`` where there is none."""
+        if engine.dialect.name != "postgresql":
+            return ""
+        try:
+            async with engine.connect() as conn:
+                return await conn.scalar(text("SELECT pg_current_wal_lsn()::text"))
+        except Exception as error:
+            # The write is committed already: fall back to pinning for the window.
+            if not is_connection_error(error):
+                raise
+            return ""
+
+    async def dispose(self):
+        for replica in self.replicas:
+            await replica.engine.dispose()
+
+    def stats(self):
+        return {
+            "primary_reads": self.primary_reads,
+            "pinned_reads": self.pinned_reads,
+            "replicas": [replica.stats() for replica in self.replicas],
+        }
+
+
+replica_set = ReplicaSet(replica_engines)
+
+
+def _pin(scope):
+    for name, value in scope["headers"]:
+        if name == b"cookie":
+            pin = cookie_parser(value.decode("latin-1")).get(PIN_COOKIE)
+            if pin is not None:
+                # "-" (no position) or anything malformed: pinned for the window.
+                return pin if LSN.fullmatch(pin) else ""
+    return None
+
+
+class ReplicaMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        replicas = replica_set
+        if scope["type"] != "http" or not replicas.replicas:
+            await self.app(scope, receive, send)
+        elif scope["method"] in READ_METHODS:
+            await self._read(replicas, scope, receive, send)
+        else:
+            await self._write(replicas, scope, receive, send)
+
+    async def _read(self, replicas, scope, receive, send):
+        pin = _pin(scope)
+        replica = await replicas.choose(pin)
+        if replica is not None:
+            started = False
+
+            async def send_and_track(message):
+                nonlocal started
+                started = True
+                await send(message)
+
+            token = current_route.set(Route(replica.engine))
+            try:
+                replica.reads += 1
+                await self.app(scope, receive, send_and_track)
+                return
+            except Exception as error:
+                if started or not is_connection_error(error):
+                    raise
+                replicas.eject(replica, error)
+            finally:
+                current_route.reset(token)
+
+        if pin is None:
+            replicas.primary_reads += 1
+        else:
+            replicas.pinned_reads += 1
+        token = current_route.set(Route(pinned=pin is not None))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            current_route.reset(token)
+
+    async def _write(self, replicas, scope, receive, send):
+        async def send_with_pin(message):
+            if message["type"] == "http.response.start" and message["status"] < 400:
+                position = await replicas.primary_position() or "-"
+                cookie = (
+                    f"{PIN_COOKIE}={position}; Max-Age={math.ceil(REPLICA_PIN_SECONDS)}; "
+                    "Path=/; HttpOnly; SameSite=lax"
+                )
+                message = {**message, "headers": [*message.get("headers", []), (b"set-cookie", cookie.encode("latin-1"))]}
+            await send(message)
+
+        await self.app(scope, receive, send_with_pin)
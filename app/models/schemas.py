@@ -1,4 +1,4 @@
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 from pydantic import BaseModel, validator
 from decimal import Decimal
 
@@ -15,6 +15,7 @@ class DishCreate(DishBase):
 class Dish(DishBase):
     id:  UUID
     price: Decimal  # Custom field to represent price as a formatted string
+    version: int = 1
 
     class Config:
         orm_mode = True
@@ -22,6 +23,8 @@ class Dish(DishBase):
 
 class DishUpdate(DishBase):
     price: Decimal  # Assuming that the price is stored as a Decimal type
+    # The version being edited: the update only applies while it is current.
+    version: Optional[int] = None
 
 
 
@@ -35,6 +38,7 @@ class SubmenuCreate(SubmenuBase):
 class Submenu(SubmenuBase):
     id: UUID   
     dishes_count: int = 0
+    version: int = 1
     
     class Config:
         orm_mode = True
@@ -44,6 +48,7 @@ class Submenu(SubmenuBase):
 class SubmenuUpdate(BaseModel):
     title: str
     description: str
+    version: Optional[int] = None
 
 
 class MenuBase(BaseModel):
@@ -57,6 +62,7 @@ class MenuCreate(MenuBase):
 class MenuUpdate(BaseModel):
     title: str
     description: str
+    version: Optional[int] = None
 
 class Menu(BaseModel):
     id: UUID
@@ -64,6 +70,45 @@ class Menu(BaseModel):
     description: Optional[str] = None
     submenus_count: int
     dishes_count: int
+    version: int = 1
+
+
+class SubmenuTree(Submenu):
+    dishes: List[Dish]
+
+
+class MenuTree(Menu):
+    submenus: List[SubmenuTree]
+
+
+class SearchPath(BaseModel):
+    menu_id: UUID
+    menu_title: Optional[str] = None
+    submenu_id: Optional[UUID] = None
+    submenu_title: Optional[str] = None
+
+
+class SearchResult(BaseModel):
+    kind: str  # "submenu" or "dish"
+    id: UUID
+    title: Optional[str] = None
+    description: Optional[str] = None
+    price: Optional[Decimal] = None
+    rank: float
+    path: SearchPath
+
+
+class BatchItemResult(BaseModel):
+    index: int
+    status: int
+    id: Optional[UUID] = None
+    errors: Optional[List[Dict[str, Any]]] = None
+
+
+class BatchResult(BaseModel):
+    created: int
+    failed: int
+    results: List[BatchItemResult]
 
 
 class MenuResponse(Menu):
@@ -0,0 +1,55 @@
+"""Database objects backing ``GET /api/v1/search``.
+
+Submenus and dishes carry a stored ``search_vector`` generated from their
+title (weight A) and description (weight B) with a GIN index for full-text
+matches.  Typo tolerance comes from ``pg_trgm`` word similarity on the title,
+which is only installed when the server ships the extension; the search
+service checks for it at runtime and falls back to full-text matches alone.
+
+Other databases (SQLite, for local tests) get neither the column nor its
+indexes; the search service matches titles and descriptions with LIKE there.
+"""
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.schema import CreateColumn
+
+
+TEXT_SEARCH_CONFIG = "english"
+
+SEARCH_VECTOR = (
+    f"setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(title, '')), 'A') || "
+    f"setweight(to_tsvector('{TEXT_SEARCH_CONFIG}', coalesce(description, '')), 'B')"
+)
+
+TRIGRAM_INDEXES = {"ix_submenus_title_trgm", "ix_dishes_title_trgm"}
+
+POSTGRESQL = [
+    """
+    DO $$
+    BEGIN
+        IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+            CREATE EXTENSION IF NOT EXISTS pg_trgm;
+            CREATE INDEX IF NOT EXISTS ix_submenus_title_trgm ON submenus USING gin (title gin_trgm_ops);
+            CREATE INDEX IF NOT EXISTS ix_dishes_title_trgm ON dishes USING gin (title gin_trgm_ops);
+        END IF;
+    EXCEPTION WHEN insufficient_privilege THEN
+        RAISE NOTICE 'pg_trgm not installed, search runs without typo tolerance';
+    END
+    $$
+    """,
+]
+
+
+# Set in Column.info on columns that only exist on PostgreSQL.
+POSTGRESQL_ONLY = "postgresql_only"
+
+
+@compiles(CreateColumn)
+def _create_column(element, compiler, **kw):
+    if element.element.info.get(POSTGRESQL_ONLY) and compiler.dialect.name != "postgresql":
+        return None
+    return compiler.visit_create_column(element, **kw)
+
+
+def include_object(object, name, type_, reflected, compare_to):
+    """Alembic filter: the trigram indexes exist outside the metadata on purpose."""
+    return not (type_ == "index" and reflected and name in TRIGRAM_INDEXES)
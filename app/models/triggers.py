@@ -0,0 +1,315 @@
+"""Database triggers keeping the denormalized counters exact.
+
+``submenus.dishes_count``, ``menus.submenus_count`` and ``menus.dishes_count``
+are only ever written from here.  Every change is an atomic
+``count = count + delta`` on the parent row, so concurrent writers cannot lose
+increments, and ORM flushes, bulk statements and FK cascades are all covered
+because the work happens inside the database.
+
+Inserts and deletes use statement-level triggers with transition tables so a
+multi-row statement costs one grouped UPDATE per parent table instead of one
+per row.  Moves between parents are rare and use row-level triggers.
+
+``updated_at`` is bumped on every UPDATE of a row and propagated to the
+parents: counter updates already touch them on inserts, deletes and moves, the
+``*_touch_*`` triggers cover plain edits.  Each bump is strictly greater than
+the previous value so the column works as a version marker for ETags.
+
+``SQLITE`` is the same behaviour for the SQLite backend used by local tests
+and benchmarks, with row-level triggers (SQLite has no statement-level ones)
+and ``updated_at`` rewritten by an AFTER trigger since SQLite cannot assign
+to ``NEW``.  Timestamps there are text in SQLAlchemy's storage format
+(``YYYY-MM-DD HH:MM:SS.ffffff``, UTC), bumped through integer microseconds.
+"""
+from sqlalchemy import literal_column
+
+
+POSTGRESQL = [
+    # Apply per-submenu dish deltas and roll them up into the owning menus.
+    # Deltas for submenus that no longer exist (cascaded deletes) match
+    # nothing; the submenu delete trigger accounts for those dishes.
+    """
+    CREATE OR REPLACE FUNCTION apply_dishes_count_delta(p_submenu_ids uuid[], p_deltas bigint[])
+    RETURNS void LANGUAGE sql AS $$
+        WITH delta AS (
+            SELECT submenu_id, n FROM unnest(p_submenu_ids, p_deltas) AS d(submenu_id, n)
+            WHERE n <> 0
+        ),
+        touched AS (
+            UPDATE submenus SET dishes_count = submenus.dishes_count + delta.n
+            FROM delta
+            WHERE submenus.id = delta.submenu_id
+            RETURNING submenus.menu_id, delta.n
+        )
+        UPDATE menus SET dishes_count = menus.dishes_count + t.n
+        FROM (SELECT menu_id, sum(n) AS n FROM touched GROUP BY menu_id) AS t
+        WHERE menus.id = t.menu_id;
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION apply_submenus_count_delta(
+        p_menu_ids uuid[], p_submenu_deltas bigint[], p_dish_deltas bigint[]
+    )
+    RETURNS void LANGUAGE sql AS $$
+        UPDATE menus SET
+            submenus_count = menus.submenus_count + d.submenus,
+            dishes_count = menus.dishes_count + d.dishes
+        FROM unnest(p_menu_ids, p_submenu_deltas, p_dish_deltas) AS d(menu_id, submenus, dishes)
+        WHERE menus.id = d.menu_id;
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION dishes_counts_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM apply_dishes_count_delta(array_agg(submenu_id), array_agg(n))
+        FROM (SELECT submenu_id, count(*) AS n FROM new_rows GROUP BY submenu_id) AS d;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION dishes_counts_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM apply_dishes_count_delta(array_agg(submenu_id), array_agg(n))
+        FROM (SELECT submenu_id, -count(*) AS n FROM old_rows GROUP BY submenu_id) AS d;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION dishes_counts_move() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM apply_dishes_count_delta(ARRAY[OLD.submenu_id, NEW.submenu_id], ARRAY[-1, 1]::bigint[]);
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION submenus_counts_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM apply_submenus_count_delta(array_agg(menu_id), array_agg(submenus), array_agg(dishes))
+        FROM (
+            SELECT menu_id, count(*) AS submenus, sum(dishes_count) AS dishes
+            FROM new_rows GROUP BY menu_id
+        ) AS d;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION submenus_counts_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM apply_submenus_count_delta(array_agg(menu_id), array_agg(submenus), array_agg(dishes))
+        FROM (
+            SELECT menu_id, -count(*) AS submenus, -sum(dishes_count) AS dishes
+            FROM old_rows GROUP BY menu_id
+        ) AS d;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION submenus_counts_move() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM apply_submenus_count_delta(
+            ARRAY[OLD.menu_id, NEW.menu_id],
+            ARRAY[-1, 1]::bigint[],
+            ARRAY[-OLD.dishes_count, NEW.dishes_count]::bigint[]
+        );
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.updated_at := greatest(clock_timestamp(), OLD.updated_at + interval '1 microsecond');
+        RETURN NEW;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION dishes_touch_submenus() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE submenus SET updated_at = clock_timestamp()
+        WHERE id IN (SELECT submenu_id FROM new_rows);
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION submenus_touch_menus() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE menus SET updated_at = clock_timestamp()
+        WHERE id IN (SELECT menu_id FROM new_rows);
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE TRIGGER dishes_counts_insert AFTER INSERT ON dishes
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION dishes_counts_insert()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER dishes_counts_delete AFTER DELETE ON dishes
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION dishes_counts_delete()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER dishes_counts_move AFTER UPDATE OF submenu_id ON dishes
+    FOR EACH ROW WHEN (OLD.submenu_id IS DISTINCT FROM NEW.submenu_id)
+    EXECUTE FUNCTION dishes_counts_move()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER submenus_counts_insert AFTER INSERT ON submenus
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION submenus_counts_insert()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER submenus_counts_delete AFTER DELETE ON submenus
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION submenus_counts_delete()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER submenus_counts_move AFTER UPDATE OF menu_id ON submenus
+    FOR EACH ROW WHEN (OLD.menu_id IS DISTINCT FROM NEW.menu_id)
+    EXECUTE FUNCTION submenus_counts_move()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER menus_updated_at BEFORE UPDATE ON menus
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER submenus_updated_at BEFORE UPDATE ON submenus
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER dishes_updated_at BEFORE UPDATE ON dishes
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER dishes_touch_submenus AFTER UPDATE ON dishes
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION dishes_touch_submenus()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER submenus_touch_menus AFTER UPDATE ON submenus
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION submenus_touch_menus()
+    """,
+]
+
+
+# Microseconds since the epoch, of now (millisecond precision) and of a stored timestamp.
+_SQLITE_NOW_US = "CAST(strftime('%s', 'now') AS INTEGER) * 1000000 + CAST(substr(strftime('%f', 'now'), 4) AS INTEGER) * 1000"
+_SQLITE_US = "CAST(strftime('%s', {0}) AS INTEGER) * 1000000 + CAST(substr({0}, 21, 6) AS INTEGER)"
+
+
+def _sqlite_bumped(updated_at):
+    return f"""(
+        SELECT strftime('%Y-%m-%d %H:%M:%S', us / 1000000, 'unixepoch') || printf('.%06d', us % 1000000)
+        FROM (SELECT max({_SQLITE_NOW_US}, {_SQLITE_US.format(updated_at)} + 1) AS us)
+    )"""
+
+
+# Only when the statement left updated_at alone: see ``bump_updated_at``.
+def _sqlite_touch(table):
+    return f"""
+    CREATE TRIGGER IF NOT EXISTS {table}_updated_at AFTER UPDATE ON {table}
+    WHEN NEW.updated_at IS OLD.updated_at
+    BEGIN
+        UPDATE {table} SET updated_at = {_sqlite_bumped("OLD.updated_at")}
+        WHERE id = NEW.id;
+    END
+    """
+
+
+def bump_updated_at(dialect):
+    """Extra SET values for an ``UPDATE ... RETURNING`` of a whole row.
+
+    On PostgreSQL the BEFORE trigger sets ``updated_at`` and RETURNING sees
+    it.  SQLite's AFTER trigger runs too late for RETURNING, so there the
+    statement bumps the column itself, with the same expression, and the
+    trigger stands aside.
+    """
+    if dialect.name == "sqlite":
+        return {"updated_at": literal_column(_sqlite_bumped("updated_at"))}
+    return {}
+
+
+SQLITE = [
+    """
+    CREATE TRIGGER IF NOT EXISTS dishes_counts_insert AFTER INSERT ON dishes
+    BEGIN
+        UPDATE submenus SET dishes_count = dishes_count + 1 WHERE id = NEW.submenu_id;
+        UPDATE menus SET dishes_count = dishes_count + 1
+        WHERE id = (SELECT menu_id FROM submenus WHERE id = NEW.submenu_id);
+    END
+    """,
+    # Within a cascaded delete the submenu is already gone and both UPDATEs
+    # match nothing; the submenu delete trigger accounts for those dishes.
+    """
+    CREATE TRIGGER IF NOT EXISTS dishes_counts_delete AFTER DELETE ON dishes
+    BEGIN
+        UPDATE submenus SET dishes_count = dishes_count - 1 WHERE id = OLD.submenu_id;
+        UPDATE menus SET dishes_count = dishes_count - 1
+        WHERE id = (SELECT menu_id FROM submenus WHERE id = OLD.submenu_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS dishes_counts_move AFTER UPDATE OF submenu_id ON dishes
+    WHEN OLD.submenu_id IS NOT NEW.submenu_id
+    BEGIN
+        UPDATE submenus SET dishes_count = dishes_count - 1 WHERE id = OLD.submenu_id;
+        UPDATE menus SET dishes_count = dishes_count - 1
+        WHERE id = (SELECT menu_id FROM submenus WHERE id = OLD.submenu_id);
+        UPDATE submenus SET dishes_count = dishes_count + 1 WHERE id = NEW.submenu_id;
+        UPDATE menus SET dishes_count = dishes_count + 1
+        WHERE id = (SELECT menu_id FROM submenus WHERE id = NEW.submenu_id);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS submenus_counts_insert AFTER INSERT ON submenus
+    BEGIN
+        UPDATE menus SET submenus_count = submenus_count + 1, dishes_count = dishes_count + NEW.dishes_count
+        WHERE id = NEW.menu_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS submenus_counts_delete AFTER DELETE ON submenus
+    BEGIN
+        UPDATE menus SET submenus_count = submenus_count - 1, dishes_count = dishes_count - OLD.dishes_count
+        WHERE id = OLD.menu_id;
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS submenus_counts_move AFTER UPDATE OF menu_id ON submenus
+    WHEN OLD.menu_id IS NOT NEW.menu_id
+    BEGIN
+        UPDATE menus SET submenus_count = submenus_count - 1, dishes_count = dishes_count - OLD.dishes_count
+        WHERE id = OLD.menu_id;
+        UPDATE menus SET submenus_count = submenus_count + 1, dishes_count = dishes_count + NEW.dishes_count
+        WHERE id = NEW.menu_id;
+    END
+    """,
+    _sqlite_touch("menus"),
+    _sqlite_touch("submenus"),
+    _sqlite_touch("dishes"),
+    # Edits touch the parents directly: the updated_at rewrites above are
+    # not in the column lists, so they do not fire these again.
+    """
+    CREATE TRIGGER IF NOT EXISTS dishes_touch_submenus AFTER UPDATE OF title, description, price, submenu_id ON dishes
+    BEGIN
+        UPDATE submenus SET updated_at = updated_at WHERE id IN (OLD.submenu_id, NEW.submenu_id);
+        UPDATE menus SET updated_at = updated_at
+        WHERE id IN (SELECT menu_id FROM submenus WHERE id IN (OLD.submenu_id, NEW.submenu_id));
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS submenus_touch_menus AFTER UPDATE OF title, description, menu_id ON submenus
+    BEGIN
+        UPDATE menus SET updated_at = updated_at WHERE id IN (OLD.menu_id, NEW.menu_id);
+    END
+    """,
+]
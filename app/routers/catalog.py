@@ -0,0 +1,58 @@
+import tempfile
+from typing import Optional
+from uuid import UUID
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models.database import get_db
+from app.services import catalog_export as export_service
+from app.services import catalog_import as import_service
+from app.services import menus as menu_service
+
+
+catalog_router = APIRouter(prefix='/api/v1')
+
+# Uploads larger than this are spooled to disk while they are received.
+SPOOL_SIZE = 1024 * 1024
+
+
+@catalog_router.post("/import")
+async def import_catalog(
+    request: Request,
+    format: str = Query("json", pattern="^(json|csv)$"),
+    dry_run: bool = False,
+    db: AsyncSession = Depends(get_db),
+):
+    with tempfile.SpooledTemporaryFile(max_size=SPOOL_SIZE) as file:
+        async for chunk in request.stream():
+            file.write(chunk)
+        file.seek(0)
+        try:
+            report = await import_service.import_catalog(db, file, format, dry_run)
+        except import_service.CatalogImportError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+
+    return JSONResponse(content=report, status_code=422 if report["errors"] else 200)
+
+
+@catalog_router.get("/export")
+async def export_catalog(
+    request: Request,
+    format: str = Query("ndjson", pattern="^(ndjson|csv)$"),
+    menu_id: Optional[UUID] = None,
+    db: AsyncSession = Depends(get_db),
+):
+    if menu_id is not None and not await menu_service.menu_exists(db, menu_id):
+        raise HTTPException(status_code=404, detail="menu not found")
+
+    gzip = export_service.accepts_gzip(request.headers.get("accept-encoding", ""))
+    headers = {"Content-Disposition": f'attachment; filename="catalog.{format}"', "Vary": "Accept-Encoding"}
+    if gzip:
+        headers["Content-Encoding"] = "gzip"
+    return StreamingResponse(
+        export_service.export_catalog(db, format, menu_id, gzip),
+        media_type=export_service.FORMATS[format],
+        headers=headers,
+    )
@@ -1,5 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from typing import List, Dict
 
@@ -13,48 +13,94 @@ from app.models import core
 
 from starlette.status import HTTP_200_OK
 from starlette.status import HTTP_201_CREATED
+from starlette.status import HTTP_207_MULTI_STATUS
 
 from app.services import dishes as dish_service
+from app.services import batch
+from app.services import conditional
+from app.services import pagination
+from app.services.serialization import ORJSONBytesResponse
+from app.services import submenus as submenu_service
 
 from fastapi.encoders import jsonable_encoder
-from typing import List, Optional
-from app.models import core as models
+from typing import Any, List, Optional
+
 dish_router = APIRouter(prefix='/api/v1/menus')
 
 
 @dish_router.post("/{menu_id}/submenus/{submenu_id}/dishes", response_model=schemas.Dish, status_code=201)
-def create_dish(menu_id: UUID, submenu_id: UUID, dish: schemas.DishCreate, db: Session = Depends(get_db)):
-    return dish_service.create_dish(db, dish, submenu_id)
+async def create_dish(menu_id: UUID, submenu_id: UUID, dish: schemas.DishCreate, db: AsyncSession = Depends(get_db)):
+    db_dish = await dish_service.create_dish(db, dish, menu_id, submenu_id)
+    if db_dish is None:
+        raise HTTPException(status_code=404, detail="submenu not found")
+    return db_dish
+
+
+@dish_router.post("/{menu_id}/submenus/{submenu_id}/dishes:batch", response_model=schemas.BatchResult, status_code=HTTP_201_CREATED)
+async def create_dishes(
+    menu_id: UUID,
+    submenu_id: UUID,
+    response: Response,
+    items: List[Dict[str, Any]] = Body(..., max_length=batch.MAX_ITEMS),
+    db: AsyncSession = Depends(get_db),
+):
+    result = await dish_service.create_dishes(db, items, menu_id, submenu_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="submenu not found")
+    if result["failed"]:
+        response.status_code = HTTP_207_MULTI_STATUS
+    return result
 
 
 @dish_router.patch("/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}", response_model=schemas.Dish)
-def update_dish(submenu_id: UUID, dish_id: UUID, dish_update: schemas.DishUpdate, db: Session = Depends(get_db)):
-    
-    return dish_service.update_dish(db, dish_id, dish_update)
+async def update_dish(menu_id: UUID, submenu_id: UUID, dish_id: UUID, dish_update: schemas.DishUpdate, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    if "If-Match" in request.headers:
+        conditional.check_if_match(request, await dish_service.dish_version(db, menu_id, submenu_id, dish_id, lock=True))
+    db_dish = await dish_service.update_dish(db, menu_id, submenu_id, dish_id, dish_update)
+    response.headers.update(conditional.version(db_dish.updated_at, db_dish.id).headers())
+    return db_dish
 
 
 @dish_router.get("/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}", response_model=schemas.Dish, status_code=HTTP_200_OK)
-def get_dish(menu_id: UUID, submenu_id: UUID, dish_id: Optional[UUID], db: Session = Depends(get_db)):
-
-    dish = dish_service.get_dish(db, submenu_id=submenu_id, dish_id=dish_id)
+async def get_dish(menu_id: UUID, submenu_id: UUID, dish_id: Optional[UUID], request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    version = await dish_service.dish_version(db, menu_id, submenu_id, dish_id)
+    if not_modified := conditional.respond(request, response, version):
+        return not_modified
+    dish = await dish_service.get_dish(db, menu_id, submenu_id, dish_id, version) if version else None
     if dish is None:
         raise HTTPException(status_code=404, detail="dish not found")
     
     return dish
 
 
-@dish_router.get("/{menu_id}/submenus/{submenu_id}/dishes", response_model=List[schemas.Dish])
-def get_dishes(menu_id: UUID, submenu_id: UUID, db: Session = Depends(get_db)):
-    dishes = dish_service.get_dishes(db, submenu_id=submenu_id)
-    return dishes
+# Sent with orjson, without response_model validation, like the menu list.
+@dish_router.get("/{menu_id}/submenus/{submenu_id}/dishes", response_model=None, responses={200: {"model": List[schemas.Dish]}})
+async def get_dishes(
+    menu_id: UUID,
+    submenu_id: UUID,
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    db: AsyncSession = Depends(get_db),
+):
+    # Any change to a dish bumps the submenu.
+    version = await submenu_service.submenu_version(db, menu_id, submenu_id, "dishes", cursor, limit)
+    if not_modified := conditional.respond(request, response, version):
+        return not_modified
+    if version is None:
+        # No such submenu under this menu: an empty list, as for a missing menu's submenus.
+        return ORJSONBytesResponse(content=[])
+    page = await dish_service.get_dishes(db, submenu_id, cursor, limit, version)
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return ORJSONBytesResponse(content=page["items"], headers=response.headers)
 
 
 @dish_router.delete("/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
-def delete_dish(menu_id: UUID, submenu_id: UUID, dish_id: UUID, db: Session = Depends(get_db)):
-    db_dish = db.query(models.Dish).filter(models.Dish.id == dish_id).first()
+async def delete_dish(menu_id: UUID, submenu_id: UUID, dish_id: UUID, db: AsyncSession = Depends(get_db)):
+    db_dish = await dish_service.delete_dish(db, menu_id, submenu_id, dish_id)
     if db_dish:
-        db.delete(db_dish)
-        db.commit()
         return {"status": True, "message": "The dish has been deleted"}
 
     return {"status": False, "message": "dish not found"}
@@ -1,6 +1,5 @@
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from typing import List, Dict
 
@@ -8,7 +7,7 @@ from app.models.database import get_db
 #from starlette.status import HTTP_400_BAD_REQUEST
 
 from app.models import core
-from uuid import UUID, uuid4
+from uuid import UUID
 
 #from models.schemas import Menu, MenuCreate, MenuUpdate, Message
 
@@ -18,51 +17,91 @@ from starlette.status import HTTP_200_OK
 from starlette.status import HTTP_201_CREATED
 
 from app.services import menus as menu_service
+from app.services import conditional
+from app.services import pagination
+from app.services.serialization import ORJSONBytesResponse
 from app.models import schemas
 from typing import List, Optional
 
 
 menu_router = APIRouter(prefix='/api/v1/menus')
 
-@menu_router.get("/", response_model=List[schemas.Menu])
-def get_menus(db: Session = Depends(get_db)):
-    return menu_service.get_menus(db)
+# The list and tree routes skip response_model validation: the services
+# already build JSON-ready dicts, and validating thousands of rows would
+# dominate.  They are encoded with orjson.
+@menu_router.get("/", response_model=None, responses={200: {"model": List[schemas.Menu]}})
+async def get_menus(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    db: AsyncSession = Depends(get_db),
+):
+    version = await menu_service.menus_version(db, cursor, limit)
+    if not_modified := conditional.respond(request, response, version):
+        return not_modified
+    page = await menu_service.get_menus(db, cursor, limit, version)
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return ORJSONBytesResponse(content=page["items"], headers=response.headers)
+
+@menu_router.get("/tree", response_model=None, responses={200: {"model": List[schemas.MenuTree]}})
+async def get_menu_trees(
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_TREE_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    db: AsyncSession = Depends(get_db),
+):
+    version = await menu_service.menus_version(db, "tree", cursor, limit)
+    if not_modified := conditional.respond(request, response, version):
+        return not_modified
+    page = await menu_service.get_menu_trees(db, cursor, limit)
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return ORJSONBytesResponse(content=page["items"], headers=response.headers)
+
+@menu_router.get("/{menu_id}/tree", response_model=None, responses={200: {"model": schemas.MenuTree}})
+async def get_menu_tree(menu_id: UUID, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    version = await menu_service.menu_version(db, menu_id, "tree")
+    if not_modified := conditional.respond(request, response, version):
+        return not_modified
+    tree = await menu_service.get_menu_tree(db, menu_id)
+    if tree is None:
+        raise HTTPException(status_code=404, detail="menu not found")
+    return ORJSONBytesResponse(content=tree, headers=response.headers)
 
 @menu_router.get("/{menu_id}", response_model=schemas.Menu)
-def get_menu(menu_id: Optional[UUID], db: Session = Depends(get_db)):
-    
-    menu = menu_service.get_menu(db, menu_id)
+async def get_menu(menu_id: Optional[UUID], request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    version = await menu_service.menu_version(db, menu_id)
+    if not_modified := conditional.respond(request, response, version):
+        return not_modified
+    menu = await menu_service.get_menu(db, menu_id, version) if version else None
     if menu is None:
         raise HTTPException(status_code=404, detail=f'menu not found')
 
     return menu
 
 @menu_router.post("/", response_model=schemas.Menu, status_code=HTTP_201_CREATED)
-def create_menu(menu: schemas.MenuCreate, db: Session = Depends(get_db)):
-    db_menu = menu_service.create_menu(db, menu)
-    db.refresh(db_menu)
-
-    response_model = schemas.Menu(
-        id=uuid4(),
-        title=db_menu.title,
-        description=db_menu.description,
-        submenus_count=0,
-        dishes_count=0
-    )
-    return db_menu
+async def create_menu(menu: schemas.MenuCreate, db: AsyncSession = Depends(get_db)):
+    return await menu_service.create_menu(db, menu)
 
 @menu_router.patch("/{menu_id}", response_model=schemas.Menu)
-def update_menu(menu_id: UUID, menu_update: schemas.MenuUpdate, db: Session = Depends(get_db)):
-    db_menu = menu_service.update_menu(db, menu_id, menu_update)
+async def update_menu(menu_id: UUID, menu_update: schemas.MenuUpdate, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    if "If-Match" in request.headers:
+        # The row lock keeps the version until the update commits.
+        conditional.check_if_match(request, await menu_service.menu_version(db, menu_id, lock=True))
+    db_menu = await menu_service.update_menu(db, menu_id, menu_update)
     if db_menu:
+        response.headers.update(conditional.version(db_menu.updated_at, db_menu.id).headers())
         return db_menu
     else:
         raise HTTPException(status_code=404, detail="menu not found")
 
 
 @menu_router.delete("/{menu_id}")
-def delete_menu(menu_id: UUID, db: Session = Depends(get_db)):
-    response = menu_service.delete_menu(db, menu_id)
+async def delete_menu(menu_id: UUID, db: AsyncSession = Depends(get_db)):
+    response = await menu_service.delete_menu(db, menu_id)
     if response:
         # Return a 200 status code when the menu is successfully deleted
         return {"status": True, "message": "The menu has been deleted"}
@@ -0,0 +1,26 @@
+from typing import List, Optional
+
+from fastapi import APIRouter, Depends, Query, Response
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import schemas
+from app.models.database import get_db
+from app.services import pagination
+from app.services import search as search_service
+
+
+search_router = APIRouter(prefix='/api/v1/search')
+
+
+@search_router.get("/", response_model=List[schemas.SearchResult])
+async def search(
+    response: Response,
+    q: str = Query(..., min_length=1, max_length=search_service.MAX_QUERY_LENGTH),
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    db: AsyncSession = Depends(get_db),
+):
+    page = await search_service.search(db, q, cursor, limit)
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return page["items"]
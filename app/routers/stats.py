@@ -0,0 +1,24 @@
+from fastapi import APIRouter
+
+from app.models.database import engine
+from app.models import replicas
+from app.models.pool import pool_stats
+from app.services import cache
+
+
+stats_router = APIRouter(prefix='/api/v1/stats')
+
+
+@stats_router.get("/cache")
+async def get_cache_stats():
+    return {**cache.cache.stats(), "flights": cache.flights.stats()}
+
+
+@stats_router.get("/pool")
+async def get_pool_stats():
+    return pool_stats.snapshot(engine.pool)
+
+
+@stats_router.get("/replicas")
+async def get_replica_stats():
+    return replicas.replica_set.stats()
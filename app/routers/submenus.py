@@ -1,8 +1,8 @@
 
-from fastapi import APIRouter, Depends, HTTPException
-from sqlalchemy.orm import Session
+from fastapi import APIRouter, Body, Depends, HTTPException, Query, Request, Response
+from sqlalchemy.ext.asyncio import AsyncSession
 
-from typing import List
+from typing import Any, Dict, List, Optional
 from fastapi.responses import JSONResponse
 
 
@@ -12,8 +12,13 @@ from uuid import UUID
 
 from starlette.status import HTTP_200_OK
 from starlette.status import HTTP_201_CREATED
+from starlette.status import HTTP_207_MULTI_STATUS
 
 from app.services import submenus as submenu_service
+from app.services import batch
+from app.services import conditional
+from app.services import pagination
+from app.services.serialization import ORJSONBytesResponse
 from app.models import schemas
 from app.services import menus as menu_service
 
@@ -21,33 +26,73 @@ from app.services import menus as menu_service
 submenu_router = APIRouter(prefix='/api/v1/menus')
 
 
-@submenu_router.get("/{menu_id}/submenus", response_model=list[schemas.Submenu])
-def get_submenus(menu_id: UUID, db: Session = Depends(get_db)):
-    return submenu_service.get_submenus(db, menu_id)
-
-
-@submenu_router.get("/{menu_id}/submenus/{submenu_id}")
-def get_submenu(menu_id: UUID, submenu_id: UUID, db: Session = Depends(get_db)):
-    submenu = submenu_service.get_submenu(db, submenu_id)
+# Sent with orjson, without response_model validation, like the menu list.
+@submenu_router.get("/{menu_id}/submenus", response_model=None, responses={200: {"model": list[schemas.Submenu]}})
+async def get_submenus(
+    menu_id: UUID,
+    request: Request,
+    response: Response,
+    cursor: Optional[str] = None,
+    limit: int = Query(pagination.DEFAULT_LIMIT, ge=1, le=pagination.MAX_LIMIT),
+    db: AsyncSession = Depends(get_db),
+):
+    # Any change to a submenu bumps the menu.
+    version = await menu_service.menu_version(db, menu_id, "submenus", cursor, limit)
+    if not_modified := conditional.respond(request, response, version):
+        return not_modified
+    page = await submenu_service.get_submenus(db, menu_id, cursor, limit, version)
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    return ORJSONBytesResponse(content=page["items"], headers=response.headers)
+
+
+@submenu_router.get("/{menu_id}/submenus/{submenu_id}", response_model=schemas.Submenu)
+async def get_submenu(menu_id: UUID, submenu_id: UUID, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    version = await submenu_service.submenu_version(db, menu_id, submenu_id)
+    if not_modified := conditional.respond(request, response, version):
+        return not_modified
+    submenu = await submenu_service.get_submenu(db, menu_id, submenu_id, version) if version else None
     if not submenu:
         return JSONResponse(content={"detail":"submenu not found"}, status_code=404)
 
     return submenu
 
 @submenu_router.post("/{menu_id}/submenus", response_model=schemas.Submenu, status_code=HTTP_201_CREATED)
-def post_submenu(menu_id: UUID, submenu: schemas.SubmenuCreate, db: Session = Depends(get_db)):
-    return submenu_service.create_submenu(db, submenu, menu_id)
+async def post_submenu(menu_id: UUID, submenu: schemas.SubmenuCreate, db: AsyncSession = Depends(get_db)):
+    db_submenu = await submenu_service.create_submenu(db, submenu, menu_id)
+    if db_submenu is None:
+        raise HTTPException(status_code=404, detail="menu not found")
+    return db_submenu
+
+
+@submenu_router.post("/{menu_id}/submenus:batch", response_model=schemas.BatchResult, status_code=HTTP_201_CREATED)
+async def post_submenus(
+    menu_id: UUID,
+    response: Response,
+    items: List[Dict[str, Any]] = Body(..., max_length=batch.MAX_ITEMS),
+    db: AsyncSession = Depends(get_db),
+):
+    result = await submenu_service.create_submenus(db, items, menu_id)
+    if result is None:
+        raise HTTPException(status_code=404, detail="menu not found")
+    if result["failed"]:
+        response.status_code = HTTP_207_MULTI_STATUS
+    return result
 
 
 @submenu_router.patch("/{menu_id}/submenus/{submenu_id}", response_model=schemas.Submenu)
-def update_submenu(menu_id: UUID, submenu_id: UUID, submenu_update: schemas.SubmenuUpdate, db: Session = Depends(get_db)):
-    return submenu_service.update_submenu(db, submenu_id, submenu_update)
+async def update_submenu(menu_id: UUID, submenu_id: UUID, submenu_update: schemas.SubmenuUpdate, request: Request, response: Response, db: AsyncSession = Depends(get_db)):
+    if "If-Match" in request.headers:
+        conditional.check_if_match(request, await submenu_service.submenu_version(db, menu_id, submenu_id, lock=True))
+    db_submenu = await submenu_service.update_submenu(db, menu_id, submenu_id, submenu_update)
+    response.headers.update(conditional.version(db_submenu.updated_at, db_submenu.id).headers())
+    return db_submenu
 
 
 
 @submenu_router.delete("/{menu_id}/submenus/{submenu_id}")
-def delete_submenu(menu_id: UUID, submenu_id: UUID, db: Session = Depends(get_db)):
-    deleted = submenu_service.delete_submenu(db, submenu_id)
+async def delete_submenu(menu_id: UUID, submenu_id: UUID, db: AsyncSession = Depends(get_db)):
+    deleted = await submenu_service.delete_submenu(db, menu_id, submenu_id)
     if deleted:
         return {"status": True, "message": "The submenu has been deleted"}
         
@@ -0,0 +1,76 @@
+"""Shared pieces of the ``:batch`` create endpoints.
+
+A batch is validated in one pass; items that fail validation are reported
+with their errors and the valid ones are inserted together, so one bad row
+does not sink the rest of the upload.
+
+The valid items are inserted by ``insert_under`` in one statement that also
+checks the parent, so a parent deleted meanwhile means nothing is inserted
+rather than a foreign key error.
+"""
+from datetime import timedelta
+from typing import Any, Dict, List
+from uuid import uuid4
+
+from pydantic import BaseModel, ValidationError
+from sqlalchemy import column, exists, insert, literal, select, values
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.status import HTTP_201_CREATED
+
+from app.models.core import utcnow
+
+
+MAX_ITEMS = 1000
+
+
+def validate(items: List[Dict[str, Any]], schema: type[BaseModel]):
+    """Split raw items into validated models and per-item error results.
+
+    Returns ``(valid, results)`` where ``valid`` pairs each item's index with
+    its model and ``results`` holds the failures, indexed like the input.
+    """
+    valid = []
+    results = []
+    for index, item in enumerate(items):
+        try:
+            valid.append((index, schema.model_validate(item)))
+        except ValidationError as e:
+            errors = e.errors(include_url=False, include_context=False, include_input=False)
+            results.append({"index": index, "status": 422, "errors": errors})
+    return valid, results
+
+
+async def insert_under(db: AsyncSession, model, items: List[Dict[str, Any]], parent: Dict[str, Any], *path):
+    """Insert ``items`` with ``parent``'s columns, only if the ``path`` criteria hold.
+
+    One ``WITH items AS (VALUES ...) INSERT ... SELECT ... FROM items WHERE
+    EXISTS (path) RETURNING``.  Ids and creation times are set here, the times a
+    microsecond apart so that lists keep the batch order.  Returns the rows
+    in ``items`` order, or ``[]`` when the parent is not there.
+    """
+    now = utcnow()
+    rows = [
+        {**item, "id": uuid4(), "created_at": now + timedelta(microseconds=i), "updated_at": now}
+        for i, item in enumerate(items)
+    ]
+    table = model.__table__
+    names = list(rows[0])
+    data = values(*(column(name, table.c[name].type) for name in names), name="items")
+    # A CTE: SQLite cannot name the columns of a VALUES subquery.
+    data = data.data([tuple(row[name] for name in names) for row in rows]).cte("items")
+    query = select(*data.c, *(literal(value, table.c[name].type) for name, value in parent.items()))
+    inserted = await db.scalars(
+        insert(model).from_select([*names, *parent], query.where(exists().where(*path))).returning(model)
+    )
+    by_id = {row.id: row for row in inserted}
+    return [by_id[row["id"]] for row in rows] if by_id else []
+
+
+def report(valid, rows, failures):
+    """Merge inserted ``rows`` (in ``valid`` order) with the validation failures."""
+    results = failures + [
+        {"index": index, "status": HTTP_201_CREATED, "id": row.id}
+        for (index, _), row in zip(valid, rows)
+    ]
+    results.sort(key=lambda result: result["index"])
+    return {"created": len(rows), "failed": len(failures), "results": results}
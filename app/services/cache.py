@@ -0,0 +1,395 @@
+"""Read-through cache for the menu hierarchy.
+
+Services cache the JSON-ready payload of a GET (what the router would send)
+under the keys built below, and every write drops the exact keys it affects,
+parents' counters included.  The backend is chosen with ``CACHE_URL``:
+``memory://`` (default) keeps a TTL/LRU dict in the process, ``redis://...``
+talks to any server speaking the Redis protocol, ``none://`` disables caching.
+A write only invalidates the memory cache of the process that made it, so
+``memory://`` is refused when ``WEB_CONCURRENCY`` asks for several workers.
+
+Payloads are stored with the ETag they were served under and only reused
+for the same ETag, so a stale entry is reloaded as soon as the version lookup
+that precedes every GET sees a newer row.
+
+Loads go through ``flights`` (see ``app.services.singleflight``): concurrent
+misses of the same key and page run one load, whatever the backend.
+
+With read replicas (``app.models.replicas``), requests pinned to the primary
+after a write skip the cache and flights, and store nothing: such a load may
+have started before another client's write, and no flight tells it that its
+result is stale.  Loads from a replica do not store keys invalidated in this
+process during the last ``REPLICA_PIN_SECONDS``, when the replica may not
+have the write yet.
+"""
+import os
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Iterable, Optional
+
+from pydantic import TypeAdapter
+
+from app.models.database import REPLICA_PIN_SECONDS, current_route
+from app.services import serialization
+from app.services import singleflight
+
+
+CACHE_URL = os.environ.get("CACHE_URL", "memory://")
+CACHE_TTL = float(os.environ.get("CACHE_TTL", "60"))
+CACHE_MAXSIZE = int(os.environ.get("CACHE_MAXSIZE", "10000"))
+# Worker processes, as uvicorn and gunicorn read it.
+WEB_CONCURRENCY = int(os.environ.get("WEB_CONCURRENCY", "1"))
+
+
+def menus_key():
+    return "menus"
+
+
+def menu_key(menu_id):
+    return f"menu:{menu_id}"
+
+
+def submenus_key(menu_id):
+    return f"submenus:{menu_id}"
+
+
+def submenu_key(submenu_id):
+    return f"submenu:{submenu_id}"
+
+
+def dishes_key(submenu_id):
+    return f"dishes:{submenu_id}"
+
+
+def dish_key(submenu_id, dish_id):
+    return f"dish:{submenu_id}:{dish_id}"
+
+
+def path_field(menu_id):
+    """Field of the version lookups of submenus and dishes, which check their path under ``menu_id``."""
+    return f"version:{menu_id}"
+
+
+class Cache:
+    """Backend interface plus the hit/miss bookkeeping shared by all backends.
+
+    Values are stored with the ``marker`` (the ETag) of the representation
+    they were built for.  A lookup with another marker is a miss: the entry
+    predates a change the database already shows, e.g. one made by another
+    worker or committed just before its invalidation.
+    """
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+
+    def _entry_value(self, entry, marker):
+        if entry is None:
+            self.misses += 1
+            return None
+        if entry["marker"] != marker:
+            self.misses += 1
+            self.stale += 1
+            return None
+        self.hits += 1
+        return entry["value"]
+
+    async def get(self, key: str, marker: Optional[str] = None) -> Optional[Any]:
+        return self._entry_value(await self._get(key), marker)
+
+    async def set(self, key: str, value: Any, marker: Optional[str] = None):
+        await self._set(key, {"marker": marker, "value": value})
+
+    async def get_field(self, key: str, field: str, marker: Optional[str] = None) -> Optional[Any]:
+        """Like ``get`` for one field of a key holding several values.
+
+        Paginated lists keep all their pages under the list's key so that
+        deleting the key invalidates every page at once.
+        """
+        return self._entry_value(await self._get_field(key, field), marker)
+
+    async def set_field(self, key: str, field: str, value: Any, marker: Optional[str] = None):
+        await self._set_field(key, field, {"marker": marker, "value": value})
+
+    async def delete(self, *keys: str):
+        if keys:
+            await self._delete(keys)
+
+    async def clear(self):
+        raise NotImplementedError
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "backend": type(self).__name__,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_ratio": self.hits / lookups if lookups else 0.0,
+        }
+
+    async def _get(self, key):
+        raise NotImplementedError
+
+    async def _set(self, key, value):
+        raise NotImplementedError
+
+    async def _delete(self, keys):
+        raise NotImplementedError
+
+    async def _get_field(self, key, field):
+        raise NotImplementedError
+
+    async def _set_field(self, key, field, value):
+        raise NotImplementedError
+
+
+class NullCache(Cache):
+    async def _get(self, key):
+        return None
+
+    async def _set(self, key, value):
+        pass
+
+    async def _delete(self, keys):
+        pass
+
+    async def _get_field(self, key, field):
+        return None
+
+    async def _set_field(self, key, field, value):
+        pass
+
+    async def clear(self):
+        pass
+
+
+class MemoryCache(Cache):
+    """Per-process cache with a TTL on every entry and LRU eviction."""
+
+    def __init__(self, ttl: float = CACHE_TTL, maxsize: int = CACHE_MAXSIZE):
+        super().__init__()
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()
+
+    async def _get(self, key):
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, value = entry
+        if expires_at < time.monotonic():
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return value
+
+    async def _set(self, key, value):
+        self._entries[key] = (time.monotonic() + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    async def _delete(self, keys):
+        for key in keys:
+            self._entries.pop(key, None)
+
+    async def _get_field(self, key, field):
+        fields = await self._get(key)
+        return None if fields is None else fields.get(field)
+
+    async def _set_field(self, key, field, value):
+        fields = await self._get(key)
+        if fields is None:
+            await self._set(key, {field: value})
+        else:
+            fields[field] = value
+
+    async def clear(self):
+        self._entries.clear()
+
+    def stats(self):
+        return {**super().stats(), "size": len(self._entries), "maxsize": self.maxsize}
+
+
+class RedisCache(Cache):
+    """Cache stored in a Redis-protocol server.
+
+    ``client`` is anything exposing the ``redis.asyncio`` methods used here
+    (``get``, ``set``, ``delete``, ``hget``, ``hset``, ``pexpire`` and
+    ``scan_iter``), which keeps the backend
+    testable against a local stand-in.
+    """
+
+    def __init__(self, client, ttl: float = CACHE_TTL, prefix: str = "menu-api:"):
+        super().__init__()
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+
+    async def _get(self, key):
+        raw = await self.client.get(self.prefix + key)
+        return None if raw is None else serialization.loads(raw)
+
+    async def _set(self, key, value):
+        await self.client.set(self.prefix + key, serialization.dumps(value), px=int(self.ttl * 1000))
+
+    async def _delete(self, keys):
+        await self.client.delete(*(self.prefix + key for key in keys))
+
+    async def _get_field(self, key, field):
+        raw = await self.client.hget(self.prefix + key, field)
+        return None if raw is None else serialization.loads(raw)
+
+    async def _set_field(self, key, field, value):
+        await self.client.hset(self.prefix + key, field, serialization.dumps(value))
+        # The TTL starts with the first field, later pages do not extend it.
+        await self.client.pexpire(self.prefix + key, int(self.ttl * 1000), nx=True)
+
+    async def clear(self):
+        keys = [key async for key in self.client.scan_iter(match=self.prefix + "*")]
+        if keys:
+            await self.client.delete(*keys)
+
+
+def create_cache(url: str = CACHE_URL, workers: int = WEB_CONCURRENCY) -> Cache:
+    if url.startswith("memory://"):
+        if workers > 1:
+            raise ValueError(
+                f"CACHE_URL=memory:// is per process and would serve stale entries with {workers} workers; "
+                "use redis://... or none://"
+            )
+        return MemoryCache()
+    if url.startswith("none://"):
+        return NullCache()
+    if url.startswith(("redis://", "rediss://", "unix://")):
+        import redis.asyncio
+
+        return RedisCache(redis.asyncio.from_url(url))
+    raise ValueError(f"unsupported CACHE_URL: {url}")
+
+
+cache = create_cache()
+flights = singleflight.Group()
+# Key -> time.monotonic() of its last invalidation, for replica reads;
+# clear() invalidates every key.
+_written = {}
+_cleared = float("-inf")
+
+
+def _pinned():
+    route = current_route.get()
+    return route is not None and route.pinned
+
+
+def _may_store(key, flight):
+    if _pinned() or flight.stale:
+        # Pinned reads run outside flights, so no write can mark them stale.
+        return False
+    route = current_route.get()
+    if route is None or route.replica is None:
+        return True
+    return time.monotonic() - max(_written.get(key, _cleared), _cleared) > REPLICA_PIN_SECONDS
+
+
+async def _load(key, field, build):
+    if _pinned():
+        return await build(None)
+    return await flights.do(key, field, build)
+
+
+def _flight_field(field, marker):
+    # Only loads for the same version are shared: one started before a write
+    # must not answer a request that already saw the write's version.
+    return field if marker is None else f"{field}@{marker}"
+
+
+async def cached(key: str, adapter: TypeAdapter, load: Callable[[], Awaitable[Any]], marker: Optional[str] = None):
+    """Return the cached payload for ``key`` or build it with ``load``.
+
+    ``load`` returns ORM objects; they are dumped through ``adapter`` into the
+    JSON-ready form that is both stored and returned.  Misses that load
+    ``None`` are not cached so a later create is visible immediately.
+    ``marker`` is the ETag the caller serves (see ``Cache``).
+    """
+    if not _pinned():
+        value = await cache.get(key, marker)
+        if value is not None:
+            return value
+
+    async def build(flight):
+        result = await load()
+        if result is None:
+            return None
+        value = adapter.dump_python(adapter.validate_python(result, from_attributes=True), mode="json")
+        if _may_store(key, flight):
+            await cache.set(key, value, marker)
+        return value
+
+    return await _load(key, _flight_field("", marker), build)
+
+
+async def cached_rows(key: str, page: str, load: Callable[[], Awaitable[Any]], marker: Optional[str] = None):
+    """Like ``cached`` for one page of a paginated list stored under ``key``.
+
+    ``load`` returns the page's rows, already as plain dicts, and the next
+    cursor; the payload is ``{"items": [...], "next_cursor": ...}``.  The dicts
+    may hold ``UUID`` and ``Decimal`` values: they are kept as is in memory
+    and encoded by ``serialization`` for Redis and the response.
+    """
+    if not _pinned():
+        value = await cache.get_field(key, page, marker)
+        if value is not None:
+            return value
+
+    async def build(flight):
+        items, next_cursor = await load()
+        value = {"items": items, "next_cursor": next_cursor}
+        if _may_store(key, flight):
+            await cache.set_field(key, page, value, marker)
+        return value
+
+    return await _load(key, _flight_field(page, marker), build)
+
+
+async def coalesced(key: str, field: str, load: Callable[[], Awaitable[Any]]):
+    """Run ``load`` once for concurrent calls, without caching the result.
+
+    For the version lookups that precede every GET: ``key`` is the cache key
+    the write paths invalidate when the version changes.
+    """
+    return await _load(key, field, lambda flight: load())
+
+
+async def invalidate(keys: Iterable[str]):
+    keys = set(keys)
+    flights.forget(keys)
+    now = time.monotonic()
+    if len(_written) > CACHE_MAXSIZE:
+        for key, written in list(_written.items()):
+            if now - written > REPLICA_PIN_SECONDS:
+                del _written[key]
+    _written.update(dict.fromkeys(keys, now))
+    await cache.delete(*keys)
+
+
+async def invalidate_subtree(menu_id, keys: Iterable[str]):
+    """``invalidate`` for a delete that cascades to children under ``menu_id``.
+
+    The children's own entries are left to expire: their reads look up the
+    version under the full path first, find nothing and answer 404 without
+    reaching the cache, and the entries are only served for the ETag they
+    were stored with.  Only the version lookups in flight under ``menu_id``
+    are detached, so that no read joins one that started before the delete.
+    """
+    flights.forget_field(path_field(menu_id))
+    await invalidate(keys)
+
+
+async def clear():
+    global _cleared
+    flights.forget_all()
+    _written.clear()
+    _cleared = time.monotonic()
+    await cache.clear()
@@ -0,0 +1,155 @@
+"""Streaming catalog export.
+
+The catalog is read with one joined query through a server-side cursor
+(``yield_per``), turned into NDJSON or CSV line by line and optionally gzipped
+on the fly, so the memory used does not depend on the size of the catalog.
+
+NDJSON emits one object per line, parents before their children::
+
+    {"type": "menu", "id": ..., "title": ..., "description": ...}
+    {"type": "submenu", "id": ..., "menu_id": ..., "title": ..., "description": ...}
+    {"type": "dish", "id": ..., "submenu_id": ..., "title": ..., "description": ..., "price": "9.99"}
+
+CSV uses the flat format accepted by the catalog import, so an export can be
+loaded back as is.
+
+The rows are read through the request's session, so the export goes to the
+replica the request was routed to (see ``app.models.replicas``).
+"""
+import csv
+import io
+import json
+import zlib
+from typing import AsyncIterator, Optional
+from uuid import UUID
+
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import core as models
+from app.services.catalog_import import CSV_COLUMNS
+
+
+FORMATS = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+YIELD_PER = 1000
+# Output is flushed to the client in chunks of about this size.
+CHUNK_BYTES = 64 * 1024
+
+
+def _query(menu_id: Optional[UUID]):
+    query = (
+        select(
+            models.Menu.id, models.Menu.title, models.Menu.description,
+            models.Submenu.id, models.Submenu.title, models.Submenu.description,
+            models.Dish.id, models.Dish.title, models.Dish.description, models.Dish.price,
+        )
+        .select_from(models.Menu)
+        .outerjoin(models.Submenu, models.Submenu.menu_id == models.Menu.id)
+        .outerjoin(models.Dish, models.Dish.submenu_id == models.Submenu.id)
+        .order_by(
+            models.Menu.created_at, models.Menu.id,
+            models.Submenu.created_at, models.Submenu.id,
+            models.Dish.created_at, models.Dish.id,
+        )
+        .execution_options(yield_per=YIELD_PER)
+    )
+    if menu_id is not None:
+        query = query.where(models.Menu.id == menu_id)
+    return query
+
+
+def _ndjson_lines(rows):
+    menu_id = submenu_id = None
+    for m_id, m_title, m_description, s_id, s_title, s_description, d_id, d_title, d_description, price in rows:
+        if m_id != menu_id:
+            menu_id = m_id
+            yield {"type": "menu", "id": str(m_id), "title": m_title, "description": m_description}
+        if s_id is not None and s_id != submenu_id:
+            submenu_id = s_id
+            yield {
+                "type": "submenu", "id": str(s_id), "menu_id": str(m_id),
+                "title": s_title, "description": s_description,
+            }
+        if d_id is not None:
+            yield {
+                "type": "dish", "id": str(d_id), "submenu_id": str(s_id),
+                "title": d_title, "description": d_description, "price": str(price),
+            }
+
+
+async def _encode_ndjson(rows) -> AsyncIterator[str]:
+    async for partition in rows.partitions():
+        yield "".join(json.dumps(line) + "\n" for line in _ndjson_lines(partition))
+
+
+async def _encode_csv(rows) -> AsyncIterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    async for partition in rows.partitions():
+        for m_id, m_title, m_description, s_id, s_title, s_description, d_id, d_title, d_description, price in partition:
+            writer.writerow([
+                m_id, m_title, m_description,
+                s_id or "", s_title or "", s_description,
+                d_id or "", d_title or "", d_description, "" if price is None else price,
+            ])
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+
+
+ENCODERS = {"ndjson": _encode_ndjson, "csv": _encode_csv}
+
+
+def accepts_gzip(accept_encoding: str) -> bool:
+    """Whether an ``Accept-Encoding`` header allows a gzipped response.
+
+    ``gzip`` (or ``x-gzip``, else ``*``) must be listed with a non-zero
+    quality: ``gzip;q=0`` refuses it.
+    """
+    qualities = {}
+    for item in accept_encoding.split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        if not coding:
+            continue
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        qualities[coding.lower()] = quality
+    for coding in ("gzip", "x-gzip", "*"):
+        if coding in qualities:
+            return qualities[coding] > 0
+    return False
+
+
+async def export_catalog(
+    db: AsyncSession, format: str, menu_id: Optional[UUID] = None, gzip: bool = False
+) -> AsyncIterator[bytes]:
+    """Yield the encoded export in chunks of about ``CHUNK_BYTES``.
+
+    ``db`` is the request's session: FastAPI only closes it once the
+    streaming response has been sent.
+    """
+    compressor = zlib.compressobj(wbits=31) if gzip else None
+    pending = []
+    size = 0
+    rows = await db.stream(_query(menu_id))
+    async for text in ENCODERS[format](rows):
+        data = text.encode()
+        if compressor is not None:
+            data = compressor.compress(data)
+        pending.append(data)
+        size += len(data)
+        if size >= CHUNK_BYTES:
+            yield b"".join(pending)
+            pending.clear()
+            size = 0
+    if compressor is not None:
+        pending.append(compressor.flush())
+    yield b"".join(pending)
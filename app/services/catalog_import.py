@@ -0,0 +1,335 @@
+"""Bulk catalog import.
+
+A catalog arrives either as nested JSON (a list of menus with ``submenus``
+and ``dishes``, the shape of ``GET /api/v1/menus/tree``) or as flat CSV with
+one row per dish::
+
+    menu_id,menu_title,menu_description,submenu_id,submenu_title,submenu_description,dish_id,dish_title,dish_description,dish_price
+
+The ``*_id`` columns are optional; rows with an id update the existing
+object, rows without one create a new object.  A row may stop after the menu
+or submenu columns to declare an empty parent.
+
+The input is parsed as a stream into bounded chunks, loaded with ``COPY`` into
+temporary staging tables and merged into ``menus``/``submenus``/``dishes``
+with three set-based statements in the same transaction.  Memory use is
+bounded by the chunk size plus one entry per menu/submenu (CSV only): once
+the input has an error nothing will be written, so the rest is only
+validated and counted.  Parsing (csv, ijson and reading the file) is
+synchronous and runs in a worker thread, one chunk at a time, so the event
+loop keeps serving other requests.  A dry run performs the whole load and
+rolls it back.
+"""
+import asyncio
+import csv
+import io
+import time
+from itertools import islice
+from decimal import Decimal, InvalidOperation
+from typing import IO, Iterator, Optional
+from uuid import UUID, uuid4
+
+import ijson
+from sqlalchemy import text
+from sqlalchemy.exc import DBAPIError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.services import cache
+
+
+CHUNK_SIZE = 5000
+MAX_ERRORS = 100
+
+CSV_COLUMNS = (
+    "menu_id", "menu_title", "menu_description",
+    "submenu_id", "submenu_title", "submenu_description",
+    "dish_id", "dish_title", "dish_description", "dish_price",
+)
+MENU_COLUMNS = ("ref", "id", "title", "description")
+SUBMENU_COLUMNS = ("ref", "menu_ref", "id", "title", "description")
+DISH_COLUMNS = ("ref", "submenu_ref", "id", "title", "description", "price")
+
+STAGING_TABLES = [
+    """
+    CREATE TEMP TABLE import_menus (
+        ref bigint PRIMARY KEY, id uuid NOT NULL, title text NOT NULL, description text
+    ) ON COMMIT DROP
+    """,
+    """
+    CREATE TEMP TABLE import_submenus (
+        ref bigint PRIMARY KEY, menu_ref bigint NOT NULL, id uuid NOT NULL,
+        title text NOT NULL, description text
+    ) ON COMMIT DROP
+    """,
+    """
+    CREATE TEMP TABLE import_dishes (
+        ref bigint PRIMARY KEY, submenu_ref bigint NOT NULL, id uuid NOT NULL,
+        title text NOT NULL, description text, price numeric(10, 2) NOT NULL
+    ) ON COMMIT DROP
+    """,
+]
+
+# created_at is spaced by the staging ref so imported objects keep the order
+# of the input in the paginated lists.
+MERGE = [
+    """
+    INSERT INTO menus (id, title, description, created_at)
+    SELECT id, title, description, now() + ref * interval '1 microsecond'
+    FROM import_menus
+    ON CONFLICT (id) DO UPDATE SET title = EXCLUDED.title, description = EXCLUDED.description
+    """,
+    """
+    INSERT INTO submenus (id, title, description, menu_id, created_at)
+    SELECT s.id, s.title, s.description, m.id, now() + s.ref * interval '1 microsecond'
+    FROM import_submenus s JOIN import_menus m ON m.ref = s.menu_ref
+    ON CONFLICT (id) DO UPDATE
+    SET title = EXCLUDED.title, description = EXCLUDED.description, menu_id = EXCLUDED.menu_id
+    """,
+    """
+    INSERT INTO dishes (id, title, description, price, submenu_id, created_at)
+    SELECT d.id, d.title, d.description, d.price, s.id, now() + d.ref * interval '1 microsecond'
+    FROM import_dishes d JOIN import_submenus s ON s.ref = d.submenu_ref
+    ON CONFLICT (id) DO UPDATE
+    SET title = EXCLUDED.title, description = EXCLUDED.description,
+        price = EXCLUDED.price, submenu_id = EXCLUDED.submenu_id
+    """,
+]
+
+
+class CatalogImportError(ValueError):
+    pass
+
+
+class _Parser:
+    """Turns raw values into staging records, collecting validation errors."""
+
+    def __init__(self):
+        self.refs = 0
+        self.errors = []
+
+    def next_ref(self):
+        self.refs += 1
+        return self.refs
+
+    def error(self, where, message):
+        if len(self.errors) < MAX_ERRORS:
+            self.errors.append({"at": where, "error": message})
+
+    def id(self, where, value) -> UUID:
+        if value in (None, ""):
+            return uuid4()
+        try:
+            return UUID(str(value))
+        except ValueError:
+            self.error(where, f"invalid id {value!r}")
+            return uuid4()
+
+    def title(self, where, value) -> str:
+        if not isinstance(value, str) or not value:
+            self.error(where, "title is required")
+            return ""
+        return value
+
+    def description(self, where, value) -> Optional[str]:
+        if value is None or isinstance(value, str):
+            return value or None
+        self.error(where, "description must be a string")
+        return None
+
+    def price(self, where, value) -> Decimal:
+        try:
+            price = Decimal(str(value))
+        except (InvalidOperation, ValueError):
+            self.error(where, f"invalid price {value!r}")
+            return Decimal(0)
+        if not price.is_finite() or price.as_tuple().exponent < -2 or abs(price) >= 10 ** 8:
+            self.error(where, f"price {value!r} does not fit numeric(10, 2)")
+            return Decimal(0)
+        return price
+
+
+def parse_csv(file: IO[bytes], parser: _Parser) -> Iterator[tuple]:
+    """Yield ``(kind, record)`` pairs from a flat CSV catalog."""
+    lines = io.TextIOWrapper(file, encoding="utf-8", newline="")
+    try:
+        yield from _parse_csv_rows(csv.DictReader(lines), parser)
+    finally:
+        # Leave the caller's file open.
+        lines.detach()
+
+
+def _parse_csv_rows(reader, parser):
+    menus = {}
+    submenus = {}
+    for line, row in enumerate(reader, start=2):
+        where = f"line {line}"
+        menu_key = row.get("menu_id") or row.get("menu_title")
+        if not menu_key:
+            parser.error(where, "menu_id or menu_title is required")
+            continue
+        menu_ref = menus.get(menu_key)
+        if menu_ref is None:
+            menu_ref = menus[menu_key] = parser.next_ref()
+            yield "menu", (
+                menu_ref,
+                parser.id(where, row.get("menu_id")),
+                parser.title(where, row.get("menu_title")),
+                parser.description(where, row.get("menu_description")),
+            )
+
+        submenu_key = row.get("submenu_id") or row.get("submenu_title")
+        if not submenu_key:
+            continue
+        submenu_ref = submenus.get((menu_key, submenu_key))
+        if submenu_ref is None:
+            submenu_ref = submenus[(menu_key, submenu_key)] = parser.next_ref()
+            yield "submenu", (
+                submenu_ref,
+                menu_ref,
+                parser.id(where, row.get("submenu_id")),
+                parser.title(where, row.get("submenu_title")),
+                parser.description(where, row.get("submenu_description")),
+            )
+
+        if not (row.get("dish_id") or row.get("dish_title")):
+            continue
+        yield "dish", (
+            parser.next_ref(),
+            submenu_ref,
+            parser.id(where, row.get("dish_id")),
+            parser.title(where, row.get("dish_title")),
+            parser.description(where, row.get("dish_description")),
+            parser.price(where, row.get("dish_price")),
+        )
+
+
+_JSON_LEVELS = {
+    "item": "menu",
+    "item.submenus.item": "submenu",
+    "item.submenus.item.dishes.item": "dish",
+}
+_JSON_FIELDS = {
+    "menu": {"id", "title", "description"},
+    "submenu": {"id", "title", "description"},
+    "dish": {"id", "title", "description", "price"},
+}
+
+
+def parse_json(file: IO[bytes], parser: _Parser) -> Iterator[tuple]:
+    """Yield ``(kind, record)`` pairs from a nested JSON catalog.
+
+    Objects are emitted when they close, so only the fields of the objects on
+    the current path are held in memory, never a whole menu.
+    """
+    stack = []
+    for prefix, event, value in ijson.parse(file):
+        kind = _JSON_LEVELS.get(prefix)
+        if kind is not None and event == "start_map":
+            parent_ref = stack[-1]["ref"] if stack else None
+            stack.append({"kind": kind, "ref": parser.next_ref(), "parent": parent_ref, "fields": {}})
+        elif kind is not None and event == "end_map":
+            node = stack.pop()
+            fields = node["fields"]
+            where = f"{kind} #{node['ref']}"
+            record = (
+                node["ref"],
+                *(() if kind == "menu" else (node["parent"],)),
+                parser.id(where, fields.get("id")),
+                parser.title(where, fields.get("title")),
+                parser.description(where, fields.get("description")),
+                *((parser.price(where, fields.get("price")),) if kind == "dish" else ()),
+            )
+            yield kind, record
+        elif stack and event in ("string", "number", "boolean", "null"):
+            parent, _, field = prefix.rpartition(".")
+            node = stack[-1]
+            if _JSON_LEVELS.get(parent) == node["kind"] and field in _JSON_FIELDS[node["kind"]]:
+                node["fields"][field] = value
+
+
+PARSERS = {"csv": parse_csv, "json": parse_json}
+
+
+async def _copy(db: AsyncSession, table: str, columns, records):
+    if not records:
+        return
+    connection = await db.connection()
+    raw = await connection.get_raw_connection()
+    await raw.driver_connection.copy_records_to_table(table, records=records, columns=columns)
+
+
+async def import_catalog(db: AsyncSession, file: IO[bytes], format: str, dry_run: bool = False):
+    """Load a catalog from ``file`` and return the import report.
+
+    Nothing is written when the input has validation errors or when
+    ``dry_run`` is set; the report then tells what the import would do.
+    """
+    if format not in PARSERS:
+        raise CatalogImportError(f"unsupported format: {format}")
+    if db.bind.dialect.driver != "asyncpg":
+        raise CatalogImportError("catalog import requires PostgreSQL with asyncpg")
+
+    started = time.perf_counter()
+    parser = _Parser()
+    counts = {"menu": 0, "submenu": 0, "dish": 0}
+    buffers = {"menu": [], "submenu": [], "dish": []}
+    targets = {
+        "menu": ("import_menus", MENU_COLUMNS),
+        "submenu": ("import_submenus", SUBMENU_COLUMNS),
+        "dish": ("import_dishes", DISH_COLUMNS),
+    }
+
+    for statement in STAGING_TABLES:
+        await db.execute(text(statement))
+
+    records = PARSERS[format](file, parser)
+    try:
+        while chunk := await asyncio.to_thread(list, islice(records, CHUNK_SIZE)):
+            for kind, record in chunk:
+                counts[kind] += 1
+                if parser.errors:
+                    # Nothing will be written: drop what is buffered, keep validating.
+                    for buffer in buffers.values():
+                        buffer.clear()
+                    continue
+                buffer = buffers[kind]
+                buffer.append(record)
+                if len(buffer) >= CHUNK_SIZE:
+                    await _copy(db, *targets[kind], buffer)
+                    buffer.clear()
+    except (ijson.JSONError, csv.Error, UnicodeDecodeError) as e:
+        parser.error("input", f"malformed {format}: {e}")
+
+    if not parser.errors:
+        try:
+            for kind, buffer in buffers.items():
+                await _copy(db, *targets[kind], buffer)
+            for statement in MERGE:
+                await db.execute(text(statement))
+        except DBAPIError as e:
+            # e.g. the same id twice in the input
+            parser.error("merge", str(e.orig))
+
+    if dry_run or parser.errors:
+        await db.rollback()
+    else:
+        # Dropped here rather than by ON COMMIT DROP alone: a session joined
+        # to an outer transaction (the test suite's) commits to a savepoint.
+        await db.execute(text("DROP TABLE import_menus, import_submenus, import_dishes"))
+        await db.commit()
+        # Imports touch arbitrary parts of the tree, start from a cold cache.
+        await cache.clear()
+
+    seconds = time.perf_counter() - started
+    rows = sum(counts.values())
+    return {
+        "dry_run": dry_run,
+        "imported": not (dry_run or parser.errors),
+        "menus": counts["menu"],
+        "submenus": counts["submenu"],
+        "dishes": counts["dish"],
+        "rows": rows,
+        "seconds": round(seconds, 3),
+        "rows_per_second": round(rows / seconds) if seconds else rows,
+        "errors": parser.errors,
+    }
@@ -0,0 +1,114 @@
+"""Conditional requests for the menu hierarchy.
+
+Every GET carries a strong ``ETag`` and ``Last-Modified`` derived from the
+``updated_at`` marker of the object (or of the parent, for lists), which the
+triggers bump whenever the object or one of its children changes.  Routes look
+the marker up first with a single indexed query and answer ``If-None-Match``
+with 304 without loading or serializing the body.  ``If-Modified-Since`` is
+ignored: every representation has an ETag, and the date has whole-second
+precision and does not move when a menu is deleted from the list.
+Otherwise the body comes from the cache only if it was stored for the same
+ETag, so the two never disagree.
+PATCH routes check ``If-Match`` against the same marker and answer 412 when
+the client edited a stale representation.
+
+PATCH bodies can instead carry the ``version`` the client edited.
+``update_row`` then makes the UPDATE itself conditional
+(``WHERE id = ? AND version = ?``) and answers 409 when another writer got
+there first, without holding a row lock between the read and the write.
+"""
+import hashlib
+from datetime import datetime
+from email.utils import format_datetime
+from typing import NamedTuple, Optional
+
+from fastapi import HTTPException, Request, Response
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from starlette.status import HTTP_304_NOT_MODIFIED, HTTP_409_CONFLICT, HTTP_412_PRECONDITION_FAILED
+
+from app.models import triggers
+
+
+class Version(NamedTuple):
+    etag: str
+    last_modified: datetime
+
+    def headers(self):
+        return {"ETag": self.etag, "Last-Modified": format_datetime(self.last_modified, usegmt=True)}
+
+
+def version(updated_at: Optional[datetime], *parts) -> Optional[Version]:
+    """The version of a representation last changed at ``updated_at``.
+
+    ``parts`` tell apart representations sharing a marker (e.g. the pages of a
+    list).  Returns ``None`` when there is no marker, i.e. nothing to serve.
+    """
+    if updated_at is None:
+        return None
+    digest = hashlib.blake2b(repr((updated_at.isoformat(), *map(str, parts))).encode(), digest_size=16)
+    return Version(f'"{digest.hexdigest()}"', updated_at)
+
+
+def marker(current: Optional[Version]) -> Optional[str]:
+    """What cached payloads served under ``current`` are stored with (see ``app.services.cache``)."""
+    return None if current is None else current.etag
+
+
+def _etags(header: str):
+    return [tag.strip().removeprefix("W/") for tag in header.split(",")]
+
+
+def _not_modified(request: Request, current: Version) -> bool:
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match is None:
+        return False
+    tags = _etags(if_none_match)
+    return "*" in tags or current.etag in tags
+
+
+def respond(request: Request, response: Response, current: Optional[Version]) -> Optional[Response]:
+    """Return the 304 answer for ``request``, or tag ``response`` and return ``None``."""
+    if current is None:
+        return None
+    if _not_modified(request, current):
+        return Response(status_code=HTTP_304_NOT_MODIFIED, headers=current.headers())
+    response.headers.update(current.headers())
+    return None
+
+
+def check_if_match(request: Request, current: Optional[Version]):
+    """Raise 412 when ``If-Match`` does not name the current version."""
+    if_match = request.headers.get("If-Match")
+    if if_match is None:
+        return
+    tags = [tag.strip() for tag in if_match.split(",")]
+    # If-Match uses the strong comparison: weak tags never match.
+    if current is None or not ("*" in tags or current.etag in tags):
+        raise HTTPException(status_code=HTTP_412_PRECONDITION_FAILED, detail="precondition failed")
+
+
+async def update_row(db: AsyncSession, model, where, values: dict, expected_version: Optional[int] = None):
+    """``UPDATE ... RETURNING`` of the row of ``model`` selected by ``where``, bumping its ``version``.
+
+    ``where`` is a tuple of criteria: the id, plus the path for nested rows.
+    With ``expected_version`` the row is only updated while it is still at
+    that version.  Returns the updated entity, or ``None`` when the row does
+    not exist; raises 409 when it exists at another version.  Does not commit.
+    """
+    query = update(model).where(*where)
+    if expected_version is not None:
+        query = query.where(model.version == expected_version)
+    row = await db.scalar(
+        query.values(**values, version=model.version + 1, **triggers.bump_updated_at(db.bind.dialect))
+        .returning(model)
+    )
+    if row is None and expected_version is not None:
+        # Only on a miss: tell a stale version from a missing row.
+        current = await db.scalar(select(model.version).where(*where))
+        if current is not None:
+            raise HTTPException(
+                status_code=HTTP_409_CONFLICT,
+                detail=f"version conflict: expected {expected_version}, current {current}",
+            )
+    return row
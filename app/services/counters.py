@@ -0,0 +1,44 @@
+from sqlalchemy import func, select, text, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import core as models
+from app.services import cache
+
+
+async def recount(db: AsyncSession):
+    """Recompute every denormalized counter from the rows it summarizes.
+
+    The triggers keep the counters exact during normal operation; this is the
+    repair path for data loaded with triggers disabled or restored from dumps.
+    Cached payloads carry the old counters, so the cache is emptied too.
+    """
+    if db.bind.dialect.name == "postgresql":
+        # Keep writers out so no trigger increment lands between the count
+        # and the write-back.
+        await db.execute(text("LOCK TABLE menus, submenus, dishes IN SHARE ROW EXCLUSIVE MODE"))
+
+    await db.execute(
+        update(models.Submenu).values(
+            dishes_count=(
+                select(func.count(models.Dish.id))
+                .where(models.Dish.submenu_id == models.Submenu.id)
+                .scalar_subquery()
+            )
+        )
+    )
+    await db.execute(
+        update(models.Menu).values(
+            submenus_count=(
+                select(func.count(models.Submenu.id))
+                .where(models.Submenu.menu_id == models.Menu.id)
+                .scalar_subquery()
+            ),
+            dishes_count=(
+                select(func.coalesce(func.sum(models.Submenu.dishes_count), 0))
+                .where(models.Submenu.menu_id == models.Menu.id)
+                .scalar_subquery()
+            ),
+        )
+    )
+    await db.commit()
+    await cache.clear()
@@ -1,72 +1,155 @@
-from sqlalchemy import select
-from sqlalchemy.orm import Session
-from starlette.status import HTTP_400_BAD_REQUEST
+from fastapi import HTTPException
+from sqlalchemy import delete, exists, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
 
 from app.models import core as models
-from fastapi.responses import JSONResponse
 
 from app.models import schemas
 
 from uuid import UUID
 
-from app.models.database import get_db
+from typing import List
+
+from pydantic import TypeAdapter
+
 from app.models import schemas
+from app.services import batch
+from app.services import cache
+from app.services import conditional
+from app.services import pagination
 from app.services import menus as menu_service
+from app.services import submenus as submenu_service
+
+
+dish_adapter = TypeAdapter(schemas.Dish)
+# Fields of a list row, in the order of schemas.Dish.
+DISH_FIELDS = ("title", "description", "id", "price", "version")
+
+
+async def _load_dishes(db: AsyncSession, submenu_id: UUID, cursor, limit):
+    query = (
+        select(*(getattr(models.Dish, field) for field in DISH_FIELDS), models.Dish.created_at)
+        .where(models.Dish.submenu_id == submenu_id)
+    )
+    rows, next_cursor = await pagination.fetch_rows(db, query, models.Dish, cursor, limit)
+    return [dict(zip(DISH_FIELDS, row)) for row in rows], next_cursor
+
+
+def in_submenu(menu_id: UUID, submenu_id: UUID, dish_id: UUID):
+    """Criteria selecting ``dish_id`` only under ``submenu_id`` of ``menu_id``, like ``submenus.in_menu``.
+
+    The submenu check is an uncorrelated EXISTS, evaluated once per statement.
+    """
+    return (
+        models.Dish.id == dish_id,
+        models.Dish.submenu_id == submenu_id,
+        exists().where(*submenu_service.in_menu(menu_id, submenu_id)),
+    )
+
+
+async def _load_dish(db: AsyncSession, menu_id: UUID, submenu_id: UUID, dish_id: UUID):
+    result = await db.execute(select(models.Dish).where(*in_submenu(menu_id, submenu_id, dish_id)))
+    return result.scalars().first()
+
+
+async def dish_version(db: AsyncSession, menu_id: UUID, submenu_id: UUID, dish_id: UUID, lock: bool = False):
+    """Version of the dish, ``None`` when it does not exist under this path."""
+    query = select(models.Dish.updated_at).where(*in_submenu(menu_id, submenu_id, dish_id))
+    if lock:
+        return conditional.version(await db.scalar(query.with_for_update()), dish_id)
+    updated_at = await cache.coalesced(
+        cache.dish_key(submenu_id, dish_id), cache.path_field(menu_id), lambda: db.scalar(query)
+    )
+    return conditional.version(updated_at, dish_id)
+
+
+async def get_dishes(db: AsyncSession, submenu_id: UUID, cursor=None, limit=pagination.DEFAULT_LIMIT, version=None):
+    return await cache.cached_rows(
+        cache.dishes_key(submenu_id), pagination.page_key(cursor, limit),
+        lambda: _load_dishes(db, submenu_id, cursor, limit), conditional.marker(version),
+    )
 
 
-def get_dishes(db: Session, submenu_id: UUID):
-    dishes = db.query(models.Dish).filter(models.Dish.submenu_id == submenu_id).all()
-    return dishes
+async def get_dish(db: AsyncSession, menu_id: UUID, submenu_id: UUID, dish_id: UUID, version=None):
+    # Keyed without the menu: routes check the path with dish_version first.
+    return await cache.cached(
+        cache.dish_key(submenu_id, dish_id), dish_adapter, lambda: _load_dish(db, menu_id, submenu_id, dish_id),
+        conditional.marker(version),
+    )
+
 
+def _counted_keys(menu_id: UUID, submenu_id: UUID):
+    """Keys whose payload changes when a dish of ``submenu_id`` is added or removed."""
+    return [cache.submenu_key(submenu_id), cache.dishes_key(submenu_id)] + submenu_service.counted_keys(menu_id)
 
-def get_dish(db: Session, submenu_id: UUID, dish_id: UUID):
-    dish = db.query(models.Dish).filter(models.Dish.submenu_id == submenu_id, models.Dish.id == dish_id).first()
 
-    return dish
+async def create_dish(db: AsyncSession, dish: schemas.DishCreate, menu_id: UUID, submenu_id: UUID):
+    """Insert the dish with a single ``INSERT ... SELECT ... RETURNING``, like ``submenus.create_submenu``.
 
-def create_dish(db: Session, dish: schemas.DishCreate, submenu_id: UUID):
-    db_dish = models.Dish(
-        title=dish.title,
-        description=dish.description,
-        price=dish.price,
-        submenu_id=submenu_id
+    The SELECT reads the submenu under ``menu_id``, so nothing is inserted
+    and ``None`` is returned when the submenu does not exist there.
+    """
+    submenu = (
+        select(literal(dish.title), literal(dish.description), literal(dish.price, models.Dish.price.type), models.Submenu.id)
+        .where(*submenu_service.in_menu(menu_id, submenu_id))
     )
-    db.add(db_dish)
-    db.commit()
-    db.refresh(db_dish)
+    db_dish = await db.scalar(
+        insert(models.Dish).from_select(["title", "description", "price", "submenu_id"], submenu).returning(models.Dish)
+    )
+    await db.commit()
+    if db_dish:
+        await cache.invalidate(_counted_keys(menu_id, submenu_id))
     return db_dish
 
 
-def update_dish(db: Session, dish_id: UUID, dish_update: schemas.DishUpdate):
-    db_dish = db.query(models.Dish).filter(models.Dish.id == dish_id).first()
-    if not db_dish:
-        return JSONResponse(status_code=404, detail="dish not found")
+async def create_dishes(db: AsyncSession, items: List[dict], menu_id: UUID, submenu_id: UUID):
+    """Create a batch of dishes with a single INSERT that checks the path (see ``batch.insert_under``).
 
-    # Check if the Dish is linked to a Submenu
-    if db_dish.submenu_id is None:
-        return JSONResponse(status_code=400, detail="Dish cannot be linked directly to a Menu")
+    Returns the batch report, or ``None`` when the submenu does not exist
+    under ``menu_id``.
+    """
+    valid, failures = batch.validate(items, schemas.DishCreate)
+    if not valid:
+        # Nothing to write: only the path check is left.
+        found = await submenu_service.submenu_exists(db, menu_id, submenu_id)
+        return batch.report(valid, [], failures) if found else None
 
-    for key, value in dish_update.dict(exclude_unset=True).items():
-        setattr(db_dish, key, value)
+    rows = await batch.insert_under(
+        db, models.Dish, [dish.model_dump() for _, dish in valid], {"submenu_id": submenu_id},
+        *submenu_service.in_menu(menu_id, submenu_id),
+    )
+    await db.commit()
+    if not rows:
+        return None
+    await cache.invalidate(_counted_keys(menu_id, submenu_id))
+    return batch.report(valid, rows, failures)
 
-    # Check if the Dish is already linked to another Submenu
-    if 'submenu_id' in dish_update and dish_update.submenu_id != db_dish.submenu_id:
-        existing_dish = db.query(models.Dish).filter(models.Dish.submenu_id == dish_update.submenu_id).first()
-        if existing_dish:
-            return JSONResponse(status_code=400, detail="Dish already exists in another Submenu")
 
-    db.commit()
-    db.refresh(db_dish)
+async def update_dish(db: AsyncSession, menu_id: UUID, submenu_id: UUID, dish_id: UUID, dish_update: schemas.DishUpdate):
+    values = dish_update.model_dump(exclude_unset=True, exclude={"version"})
+    db_dish = await conditional.update_row(
+        db, models.Dish, in_submenu(menu_id, submenu_id, dish_id), values, dish_update.version
+    )
+    await db.commit()
+    if not db_dish:
+        raise HTTPException(status_code=404, detail="dish not found")
+
+    await cache.invalidate([cache.dishes_key(submenu_id), cache.dish_key(submenu_id, dish_id)])
     return db_dish
 
 
+async def delete_dish(db: AsyncSession, menu_id: UUID, submenu_id: UUID, dish_id: UUID):
+    """Delete a dish with a single statement.
 
-def delete_dish(db: Session, dish_id: UUID):
-    db_dish = db.query(models.Dish).filter(models.Dish.id == dish_id).first()
-    if db_dish:
-        db.delete(db_dish)
-        db.commit()    
-        return {"status": true, "mesage": "The dish has been deleted"}
+    Returns the id of the deleted dish, or ``None`` when it did not exist
+    under this path.
+    """
+    deleted = await db.scalar(
+        delete(models.Dish).where(*in_submenu(menu_id, submenu_id, dish_id)).returning(models.Dish.id)
+    )
+    await db.commit()
+    if deleted is None:
+        return None
 
-    
-    raise HTTPException(status_code=404, detail="dish not found")
\ No newline at end of file
+    await cache.invalidate(_counted_keys(menu_id, submenu_id) + [cache.dish_key(submenu_id, dish_id)])
+    return dish_id
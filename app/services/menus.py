@@ -1,54 +1,156 @@
-from sqlalchemy.orm import Session
+from pydantic import TypeAdapter
+from sqlalchemy import delete, exists, insert, select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.orm import selectinload
 from app.models import core as models
 from app.models import schemas
-from uuid import UUID, uuid4
+from app.services import cache
+from app.services import conditional
+from app.services import pagination
+from uuid import UUID
 from sqlalchemy import func
 
 
-def get_menus(db: Session):
-    return db.query(models.Menu).all()
+menu_adapter = TypeAdapter(schemas.Menu)
+# Fields of a list row, in the order of schemas.Menu.
+MENU_FIELDS = ("id", "title", "description", "submenus_count", "dishes_count", "version")
 
 
-def get_menu(db: Session, menu_id: UUID):
-    menu = db.query(models.Menu).filter(models.Menu.id == menu_id).first()
-    if not menu:
-        return menu
+async def _load_menus(db: AsyncSession, cursor, limit):
+    query = select(*(getattr(models.Menu, field) for field in MENU_FIELDS), models.Menu.created_at)
+    rows, next_cursor = await pagination.fetch_rows(db, query, models.Menu, cursor, limit)
+    return [dict(zip(MENU_FIELDS, row)) for row in rows], next_cursor
 
-    submenus_count, dishes_count = menu.get_submenus_and_dishes_count(db)
 
-    menu.submenus_count = submenus_count
-    menu.dishes_count = dishes_count
+async def _load_menu(db: AsyncSession, menu_id: UUID):
+    result = await db.execute(select(models.Menu).where(models.Menu.id == menu_id))
+    return result.scalars().first()
 
-    return menu
 
+async def menu_exists(db: AsyncSession, menu_id: UUID):
+    return await db.scalar(select(exists().where(models.Menu.id == menu_id)))
 
-def create_menu(db: Session, menu: schemas.MenuCreate):
-    db_menu = models.Menu(
-        title=menu.title,
-        description=menu.description,
+
+async def menus_version(db: AsyncSession, *parts):
+    """Version of the menu list: deletes lower the count, any other change raises the max."""
+    async def load():
+        result = await db.execute(select(func.max(models.Menu.updated_at), func.count()).select_from(models.Menu))
+        return result.one()
+
+    updated_at, count = await cache.coalesced(cache.menus_key(), "version", load)
+    return conditional.version(updated_at, count, *parts)
+
+
+async def menu_version(db: AsyncSession, menu_id: UUID, *parts, lock: bool = False):
+    query = select(models.Menu.updated_at).where(models.Menu.id == menu_id)
+    if lock:
+        # Never shared: the lock must be taken in this request's transaction.
+        return conditional.version(await db.scalar(query.with_for_update()), menu_id, *parts)
+    updated_at = await cache.coalesced(cache.menu_key(menu_id), "version", lambda: db.scalar(query))
+    return conditional.version(updated_at, menu_id, *parts)
+
+
+async def get_menus(db: AsyncSession, cursor=None, limit=pagination.DEFAULT_LIMIT, version=None):
+    """``version`` is the one the route serves: a payload cached for another is reloaded."""
+    return await cache.cached_rows(
+        cache.menus_key(), pagination.page_key(cursor, limit), lambda: _load_menus(db, cursor, limit),
+        conditional.marker(version),
+    )
+
+
+async def get_menu(db: AsyncSession, menu_id: UUID, version=None):
+    return await cache.cached(
+        cache.menu_key(menu_id), menu_adapter, lambda: _load_menu(db, menu_id), conditional.marker(version)
+    )
+
+
+def _dish_tree(dish: models.Dish):
+    return {
+        "id": str(dish.id),
+        "title": dish.title,
+        "description": dish.description,
+        "price": str(dish.price),
+        "version": dish.version,
+    }
+
+
+def _submenu_tree(submenu: models.Submenu):
+    return {
+        "id": str(submenu.id),
+        "title": submenu.title,
+        "description": submenu.description,
+        "dishes_count": submenu.dishes_count,
+        "version": submenu.version,
+        "dishes": [_dish_tree(dish) for dish in submenu.dishes],
+    }
+
+
+def _menu_tree(menu: models.Menu):
+    return {
+        "id": str(menu.id),
+        "title": menu.title,
+        "description": menu.description,
+        "submenus_count": menu.submenus_count,
+        "dishes_count": menu.dishes_count,
+        "version": menu.version,
+        "submenus": [_submenu_tree(submenu) for submenu in menu.submenus],
+    }
+
+
+def _tree_query():
+    # One SELECT per level whatever the size of the tree.
+    return select(models.Menu).options(
+        selectinload(models.Menu.submenus).selectinload(models.Submenu.dishes)
     )
-    db.add(db_menu)
-    db.commit()
-    db.flush()  
-    db.refresh(db_menu)
 
+
+async def get_menu_trees(db: AsyncSession, cursor=None, limit=pagination.DEFAULT_TREE_LIMIT):
+    """One page of menus with their submenus and dishes, as plain JSON-ready dicts."""
+    menus, next_cursor = await pagination.fetch_page(db, _tree_query(), models.Menu, cursor, limit)
+    return {"items": [_menu_tree(menu) for menu in menus], "next_cursor": next_cursor}
+
+
+async def get_menu_tree(db: AsyncSession, menu_id: UUID):
+    result = await db.execute(_tree_query().where(models.Menu.id == menu_id))
+    menu = result.scalars().first()
+    if menu is None:
+        return None
+    return _menu_tree(menu)
+
+
+async def create_menu(db: AsyncSession, menu: schemas.MenuCreate):
+    """Insert the menu with a single ``INSERT ... RETURNING``; no refresh after the commit."""
+    db_menu = await db.scalar(
+        insert(models.Menu).values(title=menu.title, description=menu.description).returning(models.Menu)
+    )
+    await db.commit()
+    await cache.invalidate([cache.menus_key()])
     return db_menu
 
 
-def update_menu(db: Session, menu_id: UUID, menu_update: schemas.MenuUpdate):
-    db_menu = db.query(models.Menu).filter(models.Menu.id == menu_id).first()
+async def update_menu(db: AsyncSession, menu_id: UUID, menu_update: schemas.MenuUpdate):
+    """Update the menu with a single ``UPDATE ... RETURNING``; ``None`` when it does not exist.
+
+    Raises 409 when ``menu_update.version`` is set and no longer current.
+    """
+    values = {"title": menu_update.title, "description": menu_update.description}
+    db_menu = await conditional.update_row(db, models.Menu, (models.Menu.id == menu_id,), values, menu_update.version)
+    await db.commit()
     if db_menu:
-        db_menu.title = menu_update.title
-        db_menu.description = menu_update.description
-        db.commit()
-        db.refresh(db_menu)
+        await cache.invalidate([cache.menus_key(), cache.menu_key(menu_id)])
     return db_menu
 
-def delete_menu(db: Session, menu_id: UUID):
-    db_menu = db.query(models.Menu).filter(models.Menu.id == menu_id).first()
-    if db_menu:
-        db.delete(db_menu)
-        db.commit()
-        return db_menu
-    else:
-        return db_menu
\ No newline at end of file
+async def delete_menu(db: AsyncSession, menu_id: UUID):
+    """Delete a menu with a single statement; ON DELETE CASCADE takes the subtree.
+
+    Only the menu's own keys are invalidated, whatever the size of the
+    subtree: see ``cache.invalidate_subtree``.
+    Returns the id of the deleted menu, or ``None`` when it did not exist.
+    """
+    deleted = await db.scalar(delete(models.Menu).where(models.Menu.id == menu_id).returning(models.Menu.id))
+    await db.commit()
+    if deleted is None:
+        return None
+
+    await cache.invalidate_subtree(menu_id, [cache.menus_key(), cache.menu_key(menu_id), cache.submenus_key(menu_id)])
+    return menu_id
@@ -0,0 +1,79 @@
+"""Keyset pagination shared by the list endpoints.
+
+Lists are ordered by ``(created_at, id)`` and a page resumes strictly after
+the last row of the previous one, so every page is an index seek on the
+composite indexes declared in ``app.models.core`` no matter how deep it is.
+The cursor handed to clients is that last key, encoded opaquely.
+"""
+import base64
+import json
+from datetime import datetime
+from uuid import UUID
+
+from fastapi import HTTPException
+from sqlalchemy import tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+
+
+DEFAULT_LIMIT = 100
+MAX_LIMIT = 1000
+# Each menu of a tree page carries its whole subtree.
+DEFAULT_TREE_LIMIT = 10
+
+
+def encode_key(*values) -> str:
+    """Opaque cursor for a sort key made of JSON-serializable ``values``."""
+    raw = json.dumps(values).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_key(cursor: str, parse):
+    """Inverse of ``encode_key``; ``parse`` rebuilds the key from the values.
+
+    Any malformed cursor is the client's fault and answered with 400.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        return parse(*json.loads(raw))
+    except (ValueError, TypeError) as e:
+        raise HTTPException(status_code=400, detail="invalid cursor") from e
+
+
+def encode_cursor(created_at: datetime, id: UUID) -> str:
+    return encode_key(created_at.isoformat(), str(id))
+
+
+def decode_cursor(cursor: str):
+    return decode_key(cursor, lambda created_at, id: (datetime.fromisoformat(created_at), UUID(id)))
+
+
+def page_key(cursor, limit):
+    return f"{cursor or ''}:{limit}"
+
+
+async def fetch_page(db: AsyncSession, query, model, cursor, limit):
+    """Run ``query`` for one page of ``model`` rows.
+
+    Returns the rows and the cursor of the next page, ``None`` on the last one.
+    """
+    result = await db.execute(_page_query(query, model, cursor, limit))
+    return _split(result.scalars().all(), limit)
+
+
+async def fetch_rows(db: AsyncSession, query, model, cursor, limit):
+    """``fetch_page`` for a column-only ``query``; it must select ``created_at`` and ``id``."""
+    result = await db.execute(_page_query(query, model, cursor, limit))
+    return _split(result.all(), limit)
+
+
+def _page_query(query, model, cursor, limit):
+    if cursor:
+        query = query.where(tuple_(model.created_at, model.id) > tuple_(*decode_cursor(cursor)))
+    return query.order_by(model.created_at, model.id).limit(limit + 1)
+
+
+def _split(rows, limit):
+    if len(rows) <= limit:
+        return rows, None
+    rows = rows[:limit]
+    return rows, encode_cursor(rows[-1].created_at, rows[-1].id)
@@ -0,0 +1,117 @@
+"""Ranked search over submenus and dishes.
+
+Matches come from the ``search_vector`` GIN indexes (``websearch_to_tsquery``
+syntax: words, ``"phrases"``, ``-exclusions``, ``or``).  When ``pg_trgm`` is
+installed, titles that are word-similar to the query also match, which
+catches typos, and the similarity is added to the rank.
+
+Elsewhere (SQLite, for local tests) results are substring matches with LIKE,
+ranked 1 for a title match and 0.5 for a description match.
+
+Results are ordered by ``(rank DESC, id)`` and paginated with the same opaque
+cursors as the list endpoints, keyed on that pair.
+"""
+from typing import Optional
+from uuid import UUID
+
+from sqlalchemy import Float, Numeric, String, Uuid, and_, case, func, literal, literal_column, null, or_, select, text, union_all
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from app.models import core as models
+from app.models.search import TEXT_SEARCH_CONFIG
+from app.services import pagination
+
+
+MAX_QUERY_LENGTH = 200
+
+_trigram: Optional[bool] = None
+
+
+async def has_trigram(db: AsyncSession) -> bool:
+    global _trigram
+    if _trigram is None:
+        _trigram = await db.scalar(text("SELECT EXISTS (SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm')"))
+    return _trigram
+
+
+def _match(model, q, tsquery, trigram):
+    if tsquery is None:
+        return _like_match(model, q)
+    rank = func.ts_rank_cd(model.search_vector, tsquery)
+    match = model.search_vector.op("@@")(tsquery)
+    if trigram:
+        rank = rank + func.word_similarity(q, model.title)
+        match = or_(match, literal(q).op("<%")(model.title))
+    return rank.cast(Float).label("rank"), match
+
+
+def _like_match(model, q):
+    pattern = "%" + q.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+    in_title = model.title.ilike(pattern, escape="\\")
+    match = or_(in_title, model.description.ilike(pattern, escape="\\"))
+    return case((in_title, 1.0), else_=0.5).cast(Float).label("rank"), match
+
+
+def _query(q: str, full_text: bool, trigram: bool):
+    tsquery = None
+    if full_text:
+        tsquery = func.websearch_to_tsquery(literal_column(f"'{TEXT_SEARCH_CONFIG}'::regconfig"), q)
+
+    rank, match = _match(models.Submenu, q, tsquery, trigram)
+    submenus = (
+        select(
+            literal("submenu").label("kind"), models.Submenu.id, models.Submenu.title, models.Submenu.description,
+            null().cast(Numeric(10, 2)).label("price"), models.Menu.id.label("menu_id"),
+            models.Menu.title.label("menu_title"), null().cast(Uuid).label("submenu_id"),
+            null().cast(String).label("submenu_title"), rank,
+        )
+        .join(models.Menu, models.Menu.id == models.Submenu.menu_id)
+        .where(match)
+    )
+
+    rank, match = _match(models.Dish, q, tsquery, trigram)
+    dishes = (
+        select(
+            literal("dish").label("kind"), models.Dish.id, models.Dish.title, models.Dish.description,
+            models.Dish.price, models.Menu.id.label("menu_id"), models.Menu.title.label("menu_title"),
+            models.Submenu.id.label("submenu_id"), models.Submenu.title.label("submenu_title"), rank,
+        )
+        .join(models.Submenu, models.Submenu.id == models.Dish.submenu_id)
+        .join(models.Menu, models.Menu.id == models.Submenu.menu_id)
+        .where(match)
+    )
+    return union_all(submenus, dishes).subquery("hits")
+
+
+def _result(row):
+    return {
+        "kind": row.kind,
+        "id": row.id,
+        "title": row.title,
+        "description": row.description,
+        "price": row.price,
+        "rank": row.rank,
+        "path": {
+            "menu_id": row.menu_id,
+            "menu_title": row.menu_title,
+            "submenu_id": row.submenu_id,
+            "submenu_title": row.submenu_title,
+        },
+    }
+
+
+async def search(db: AsyncSession, q: str, cursor=None, limit=pagination.DEFAULT_LIMIT):
+    """One page of results for ``q`` as ``{"items": [...], "next_cursor": ...}``."""
+    full_text = db.bind.dialect.name == "postgresql"
+    hits = _query(q, full_text, full_text and await has_trigram(db))
+    query = select(hits).order_by(hits.c.rank.desc(), hits.c.id).limit(limit + 1)
+    if cursor:
+        rank, id = pagination.decode_key(cursor, lambda rank, id: (float(rank), UUID(id)))
+        query = query.where(or_(hits.c.rank < rank, and_(hits.c.rank == rank, hits.c.id > id)))
+
+    rows = (await db.execute(query)).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = pagination.encode_key(rows[-1].rank, str(rows[-1].id))
+    return {"items": [_result(row) for row in rows], "next_cursor": next_cursor}
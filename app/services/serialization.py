@@ -0,0 +1,39 @@
+"""orjson encoding for the list and tree responses.
+
+The list services build their rows as plain dicts straight from column-only
+queries, and the routes send them with ``ORJSONBytesResponse`` instead of
+validating every row through the ``response_model`` and ``jsonable_encoder``.
+orjson encodes ``uuid.UUID`` and ``datetime`` natively.  ``Decimal`` prices,
+and asyncpg's own ``UUID`` subclass which orjson does not accept, go through
+``default`` as strings, the way Pydantic dumps them.
+"""
+from decimal import Decimal
+from typing import Any
+from uuid import UUID
+
+import orjson
+from fastapi import Response
+
+
+def _default(value):
+    if isinstance(value, (Decimal, UUID)):
+        return str(value)
+    raise TypeError(f"{type(value).__name__} is not JSON serializable")
+
+
+def dumps(value: Any) -> bytes:
+    return orjson.dumps(value, default=_default)
+
+
+loads = orjson.loads
+
+
+class ORJSONBytesResponse(Response):
+    """JSON response rendered with orjson; ``bytes`` content is sent as is."""
+
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
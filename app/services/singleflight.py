@@ -0,0 +1,107 @@
+"""Single-flight loading: concurrent identical reads share one in-flight load.
+
+When a popular page goes live, many identical GETs miss the cache at the
+same moment and would all run the same queries.  ``Group.do`` lets the first
+caller for a ``(key, field)`` run the load (the leader) while the others
+await its result.  Keys are the cache keys of ``app.services.cache`` (the
+field is the page of a list), so a flight covers exactly what one cache
+entry covers.
+
+Writes call ``forget`` with the keys they invalidate.  That detaches the
+in-flight loads of those keys: callers arriving after the write start a
+fresh load, and the detached leader sees ``flight.stale`` and must not store
+its possibly pre-write result.  Callers that joined before the write still
+share that result, as they were concurrent with the write.
+
+A leader that fails hands its error to the followers.  A leader that is
+cancelled (its client went away) does not: one of the followers takes over.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Iterable
+
+from app.metrics import COALESCED
+
+
+class Flight:
+    __slots__ = ("future", "followers", "stale")
+
+    def __init__(self):
+        self.future = asyncio.get_running_loop().create_future()
+        self.followers = 0
+        self.stale = False
+
+
+class Group:
+    def __init__(self):
+        self._flights: Dict[str, Dict[str, Flight]] = {}
+        self.leaders = 0
+        self.coalesced = 0
+
+    async def do(self, key: str, field: str, load: Callable[[Flight], Awaitable[Any]]):
+        """Return ``await load(flight)``, run once for concurrent calls with the same key and field."""
+        while True:
+            flight = self._flights.get(key, {}).get(field)
+            if flight is None:
+                return await self._lead(key, field, load)
+            flight.followers += 1
+            self.coalesced += 1
+            COALESCED.labels(key.split(":", 1)[0]).inc()
+            # wait() never cancels the future, and raises CancelledError only
+            # when this caller is cancelled; a cancelled leader shows as a
+            # cancelled future (Task.cancelling() needs Python 3.11).
+            await asyncio.wait([flight.future])
+            if flight.future.cancelled():
+                continue
+            return flight.future.result()
+
+    async def _lead(self, key, field, load):
+        flight = Flight()
+        self._flights.setdefault(key, {})[field] = flight
+        self.leaders += 1
+        try:
+            result = await load(flight)
+        except asyncio.CancelledError:
+            flight.future.cancel()
+            raise
+        except Exception as error:
+            flight.future.set_exception(error)
+            if not flight.followers:
+                flight.future.exception()  # retrieved: nobody else will
+            raise
+        else:
+            flight.future.set_result(result)
+            return result
+        finally:
+            self._remove(key, field, flight)
+
+    def _remove(self, key, field, flight):
+        fields = self._flights.get(key)
+        if fields is not None and fields.get(field) is flight:
+            del fields[field]
+            if not fields:
+                del self._flights[key]
+
+    def forget(self, keys: Iterable[str]):
+        """Detach the in-flight loads of ``keys``; later calls start over."""
+        for key in keys:
+            for flight in self._flights.pop(key, {}).values():
+                flight.stale = True
+
+    def forget_field(self, field: str):
+        """Detach the in-flight loads of ``field`` under any key."""
+        for key, fields in list(self._flights.items()):
+            flight = fields.pop(field, None)
+            if flight is not None:
+                flight.stale = True
+                if not fields:
+                    del self._flights[key]
+
+    def forget_all(self):
+        self.forget(list(self._flights))
+
+    def stats(self):
+        return {
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "in_flight": sum(len(fields) for fields in self._flights.values()),
+        }
@@ -1,7 +1,6 @@
-
 from fastapi import HTTPException
-from sqlalchemy import select
-from sqlalchemy.orm import Session
+from sqlalchemy import delete, exists, insert, literal, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from starlette.status import HTTP_400_BAD_REQUEST
 from sqlalchemy import func  
 from fastapi.responses import JSONResponse
@@ -12,69 +11,142 @@ from typing import List, Optional
 from app.models import schemas
 from uuid import UUID
 
+from pydantic import TypeAdapter
+
+from app.services import batch
+from app.services import cache
+from app.services import conditional
 from app.services import menus as menu_service
+from app.services import pagination
 
 
-def get_submenus(db: Session, menu_id: UUID):
-    submenus = db.query(models.Submenu).filter(models.Submenu.menu_id == menu_id).all()
-    for submenu in submenus:
-        submenu.dishes_count = len(submenu.dishes)
-    return submenus
+submenu_adapter = TypeAdapter(schemas.Submenu)
+# Fields of a list row, in the order of schemas.Submenu.
+SUBMENU_FIELDS = ("title", "description", "id", "dishes_count", "version")
 
 
+async def _load_submenus(db: AsyncSession, menu_id: UUID, cursor, limit):
+    query = (
+        select(*(getattr(models.Submenu, field) for field in SUBMENU_FIELDS), models.Submenu.created_at)
+        .where(models.Submenu.menu_id == menu_id)
+    )
+    rows, next_cursor = await pagination.fetch_rows(db, query, models.Submenu, cursor, limit)
+    return [dict(zip(SUBMENU_FIELDS, row)) for row in rows], next_cursor
 
-def get_submenu(db: Session, submenu_id: UUID):
-    db_submenu = db.query(models.Submenu).filter(models.Submenu.id == submenu_id).first()
 
-    if db_submenu is None:
-        return db_submenu
-    else:
-        dishes_count = len(db_submenu.dishes)  
-    
-        submenu_response = {
-            "id": db_submenu.id,
-            "title": db_submenu.title,
-            "description": db_submenu.description,
-            "dishes_count": dishes_count
-        }
-        return submenu_response
+def in_menu(menu_id: UUID, submenu_id: UUID):
+    """Criteria selecting ``submenu_id`` only if it belongs to ``menu_id``.
+
+    Nested routes put them in the statement that reads or writes the row, so
+    a submenu addressed under the wrong menu is simply not found.
+    """
+    return models.Submenu.id == submenu_id, models.Submenu.menu_id == menu_id
+
+
+async def _load_submenu(db: AsyncSession, menu_id: UUID, submenu_id: UUID):
+    result = await db.execute(select(models.Submenu).where(*in_menu(menu_id, submenu_id)))
+    return result.scalars().first()
+
+
+async def submenu_version(db: AsyncSession, menu_id: UUID, submenu_id: UUID, *parts, lock: bool = False):
+    """Version of the submenu, ``None`` when it does not exist under ``menu_id``."""
+    query = select(models.Submenu.updated_at).where(*in_menu(menu_id, submenu_id))
+    if lock:
+        return conditional.version(await db.scalar(query.with_for_update()), submenu_id, *parts)
+    updated_at = await cache.coalesced(cache.submenu_key(submenu_id), cache.path_field(menu_id), lambda: db.scalar(query))
+    return conditional.version(updated_at, submenu_id, *parts)
+
+
+async def get_submenus(db: AsyncSession, menu_id: UUID, cursor=None, limit=pagination.DEFAULT_LIMIT, version=None):
+    return await cache.cached_rows(
+        cache.submenus_key(menu_id), pagination.page_key(cursor, limit),
+        lambda: _load_submenus(db, menu_id, cursor, limit), conditional.marker(version),
+    )
+
+
+
+async def get_submenu(db: AsyncSession, menu_id: UUID, submenu_id: UUID, version=None):
+    # Keyed by the submenu only: routes check the path with submenu_version first.
+    return await cache.cached(
+        cache.submenu_key(submenu_id), submenu_adapter, lambda: _load_submenu(db, menu_id, submenu_id),
+        conditional.marker(version),
+    )
+
+
+async def submenu_exists(db: AsyncSession, menu_id: UUID, submenu_id: UUID):
+    return await db.scalar(select(exists().where(*in_menu(menu_id, submenu_id))))
+
+
+def counted_keys(menu_id: UUID):
+    """Keys whose payload carries counters of ``menu_id`` or its submenus."""
+    return [cache.menus_key(), cache.menu_key(menu_id), cache.submenus_key(menu_id)]
 
     
-def create_submenu(db: Session, submenu: schemas.SubmenuCreate, menu_id: UUID):
-    db_menu = db.query(models.Menu).filter(models.Menu.id == menu_id).first()
-    if db_menu:
-        db_submenu = models.Submenu(title=submenu.title, description=submenu.description, menu_id=menu_id)
-        db.add(db_submenu)
-        db.commit()
-        db.refresh(db_submenu)
-        return db_submenu
-
-def create_submenu_2(db: Session, submenu: schemas.SubmenuCreate, menu_id: UUID):
-    db_submenu = models.Submenu(title=submenu.title, description=submenu.description, menu_id=menu_id)
-    db.add(db_submenu)
-    db.commit()
-    db.refresh(db_submenu)
+async def create_submenu(db: AsyncSession, submenu: schemas.SubmenuCreate, menu_id: UUID):
+    """Insert the submenu with a single ``INSERT ... SELECT ... RETURNING``.
+
+    Selecting the menu id from ``menus`` makes the statement insert nothing,
+    instead of failing on the foreign key, when the menu does not exist;
+    ``None`` is returned then.
+    """
+    menu = select(literal(submenu.title), literal(submenu.description), models.Menu.id).where(models.Menu.id == menu_id)
+    db_submenu = await db.scalar(
+        insert(models.Submenu).from_select(["title", "description", "menu_id"], menu).returning(models.Submenu)
+    )
+    await db.commit()
+    if db_submenu:
+        await cache.invalidate(counted_keys(menu_id))
     return db_submenu
 
 
-def update_submenu(db: Session, submenu_id: UUID, submenu_update: schemas.SubmenuUpdate):
-    db_submenu = db.query(models.Submenu).filter(models.Submenu.id == submenu_id).first()
+async def create_submenus(db: AsyncSession, items: List[dict], menu_id: UUID):
+    """Create a batch of submenus with a single INSERT that checks the menu (see ``batch.insert_under``).
+
+    Returns the batch report, or ``None`` when the menu does not exist.
+    """
+    valid, failures = batch.validate(items, schemas.SubmenuCreate)
+    if not valid:
+        # Nothing to write: only the menu check is left.
+        return batch.report(valid, [], failures) if await menu_service.menu_exists(db, menu_id) else None
+
+    rows = await batch.insert_under(
+        db, models.Submenu, [submenu.model_dump() for _, submenu in valid], {"menu_id": menu_id},
+        models.Menu.id == menu_id,
+    )
+    await db.commit()
+    if not rows:
+        return None
+    await cache.invalidate(counted_keys(menu_id))
+    return batch.report(valid, rows, failures)
+
+
+async def update_submenu(db: AsyncSession, menu_id: UUID, submenu_id: UUID, submenu_update: schemas.SubmenuUpdate):
+    values = submenu_update.model_dump(exclude_unset=True, exclude={"version"})
+    db_submenu = await conditional.update_row(
+        db, models.Submenu, in_menu(menu_id, submenu_id), values, submenu_update.version
+    )
+    await db.commit()
     if not db_submenu:
         raise HTTPException(status_code=404, detail="submenu not found")
 
-    for key, value in submenu_update.dict(exclude_unset=True).items():
-        setattr(db_submenu, key, value)
-
-    db.commit()
-    db.refresh(db_submenu)
+    await cache.invalidate([cache.submenus_key(menu_id), cache.submenu_key(submenu_id)])
     return db_submenu
 
 
+async def delete_submenu(db: AsyncSession, menu_id: UUID, submenu_id: UUID):
+    """Delete a submenu and its dishes with a single statement, like ``menus.delete_menu``.
 
-def delete_submenu(db: Session, submenu_id: UUID):
-    db_submenu = db.query(models.Submenu).filter(models.Submenu.id == submenu_id).first()
-    if db_submenu:
-        db.query(models.Dish).filter(models.Dish.submenu_id == submenu_id).delete()
-        db.delete(db_submenu)
-        db.commit()
-    return db_submenu
\ No newline at end of file
+    Returns the id of the deleted submenu, or ``None`` when it did not exist
+    under ``menu_id``.
+    """
+    deleted = await db.scalar(
+        delete(models.Submenu).where(*in_menu(menu_id, submenu_id)).returning(models.Submenu.id)
+    )
+    await db.commit()
+    if deleted is None:
+        return None
+
+    await cache.invalidate_subtree(
+        menu_id, counted_keys(menu_id) + [cache.submenu_key(submenu_id), cache.dishes_key(submenu_id)]
+    )
+    return submenu_id
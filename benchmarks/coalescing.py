@@ -0,0 +1,131 @@
+"""Bursts of identical reads on a cold cache: coalesced against independent loads.
+
+Seeds one submenu with ``--dishes`` dishes (500 by default) and, for
+``--rounds`` rounds, empties the cache and sends ``--concurrency`` concurrent
+identical requests (1, 8, 32 and 128 by default) for its dish list, as when a
+popular menu goes live or its cache entry expires under load:
+
+* ``coalesced``: the current ``app.services.cache``, where the requests join
+  the version lookup and the load already in flight;
+* ``independent``: every request runs its own lookup and load, as before.
+
+Reports the SQL statements per burst, the median and p95 latency of a
+request, and the median time until the whole burst is answered.  The app runs
+in this process through the ASGI transport, against a migrated database::
+
+    python -m app.cli migrate
+    python -m benchmarks.coalescing [--concurrency 1,8,32,128] [--dishes 500] [--rounds 20]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from uuid import uuid4
+
+import httpx
+from sqlalchemy import delete, event, insert
+
+from app.main import app
+from app.metrics import is_transaction_control
+from app.models import core as models
+from app.models.database import SessionLocal, engine
+from app.services import cache
+from app.services.singleflight import Flight, Group
+
+
+class Independent(Group):
+    """A group that never shares a load."""
+
+    async def do(self, key, field, load):
+        return await load(Flight())
+
+
+GROUPS = {"coalesced": Group, "independent": Independent}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, round(len(ordered) * q) - 1)]
+
+
+async def seed(dishes):
+    menu_id, submenu_id = uuid4(), uuid4()
+    async with SessionLocal() as db:
+        await db.execute(insert(models.Menu).values(id=menu_id, title="Benchmark menu", description="Benchmark"))
+        await db.execute(insert(models.Submenu).values(
+            id=submenu_id, menu_id=menu_id, title="Benchmark submenu", description="Benchmark",
+        ))
+        await db.execute(insert(models.Dish).values([
+            {"title": f"Dish {i}", "description": "Benchmark", "price": "9.99", "submenu_id": submenu_id}
+            for i in range(dishes)
+        ]))
+        await db.commit()
+    return menu_id, submenu_id
+
+
+async def burst(client, url, concurrency):
+    async def get():
+        started = time.perf_counter()
+        response = await client.get(url)
+        assert response.status_code == 200, (response.status_code, response.text)
+        return time.perf_counter() - started
+
+    await cache.clear()
+    started = time.perf_counter()
+    latencies = await asyncio.gather(*(get() for _ in range(concurrency)))
+    return time.perf_counter() - started, latencies
+
+
+async def run(client, url, concurrency, rounds, statements):
+    bursts, latencies, counts = [], [], []
+    for _ in range(rounds):
+        statements.clear()
+        seconds, request_seconds = await burst(client, url, concurrency)
+        bursts.append(seconds)
+        latencies += request_seconds
+        counts.append(len(statements))
+    return {
+        "statements": max(counts),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "burst_ms": round(statistics.median(bursts) * 1000, 2),
+    }
+
+
+async def main(args):
+    statements = []
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not is_transaction_control(statement):
+            statements.append(statement)
+
+    menu_id, submenu_id = await seed(args.dishes)
+    url = f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes?limit={args.dishes}"
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench", timeout=60)
+    event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+    report = {"dishes": args.dishes, "rounds": args.rounds}
+    flights = cache.flights
+    try:
+        for name, group in GROUPS.items():
+            cache.flights = group()
+            report[name] = {}
+            for concurrency in [int(level) for level in args.concurrency.split(",")]:
+                report[name][str(concurrency)] = await run(client, url, concurrency, args.rounds, statements)
+    finally:
+        cache.flights = flights
+        event.remove(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+        await client.aclose()
+        async with SessionLocal() as db:
+            await db.execute(delete(models.Menu).where(models.Menu.id == menu_id))
+            await db.commit()
+        await engine.dispose()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,8,32,128", help="comma-separated burst sizes")
+    parser.add_argument("--dishes", type=int, default=500)
+    parser.add_argument("--rounds", type=int, default=20)
+    asyncio.run(main(parser.parse_args()))
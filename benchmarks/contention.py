@@ -0,0 +1,124 @@
+"""Concurrent edits of hot rows: optimistic versions against row locks.
+
+``--concurrency`` workers (1, 8 and 32 by default) run read-modify-write
+cycles on ``--menus`` menus (1, the worst case) for ``--duration`` seconds,
+with ``--think-ms`` of application work between the read and the write:
+
+* ``lock``: ``SELECT ... FOR UPDATE``, think, update, commit, all in one
+  transaction, as the ``If-Match`` path of PATCH does;
+* ``optimistic``: read the version, think, update with that version
+  expected (``app.services.conditional.update_row``), and start over on 409.
+
+Reports completed edits per second, p50/p95 latency of an edit including
+retries, and the number of conflicts.  Both ways must lose no edit: the
+versions of the menus account for every completed edit.  Run it against a
+migrated database::
+
+    python -m app.cli migrate
+    python -m benchmarks.contention [--concurrency 1,8,32] [--menus 1] [--duration 5] [--think-ms 1]
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+
+from fastapi import HTTPException
+from sqlalchemy import delete, func, insert, select
+from starlette.status import HTTP_409_CONFLICT
+
+from app.models import core as models
+from app.models import schemas
+from app.models.database import SessionLocal, engine
+from app.services import menus as menu_service
+
+
+async def lock_edit(menu_id, think):
+    async with SessionLocal() as db:
+        await db.scalar(select(models.Menu.version).where(models.Menu.id == menu_id).with_for_update())
+        await asyncio.sleep(think)
+        await menu_service.update_menu(db, menu_id, schemas.MenuUpdate(title="Contended", description="lock"))
+    return 0
+
+
+async def optimistic_edit(menu_id, think):
+    conflicts = 0
+    while True:
+        async with SessionLocal() as db:
+            version = await db.scalar(select(models.Menu.version).where(models.Menu.id == menu_id))
+        await asyncio.sleep(think)
+        update = schemas.MenuUpdate(title="Contended", description="optimistic", version=version)
+        try:
+            async with SessionLocal() as db:
+                await menu_service.update_menu(db, menu_id, update)
+            return conflicts
+        except HTTPException as error:
+            if error.status_code != HTTP_409_CONFLICT:
+                raise
+            conflicts += 1
+
+
+EDITS = {"lock": lock_edit, "optimistic": optimistic_edit}
+
+
+def percentile(values, q):
+    ordered = sorted(values)
+    return ordered[max(0, round(len(ordered) * q) - 1)]
+
+
+async def run_level(edit, menu_ids, concurrency, duration, think):
+    latencies, conflicts = [], 0
+    deadline = time.perf_counter() + duration
+
+    async def worker():
+        nonlocal conflicts
+        while time.perf_counter() < deadline:
+            started = time.perf_counter()
+            retries = await edit(random.choice(menu_ids), think)
+            latencies.append(time.perf_counter() - started)
+            conflicts += retries
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "edits": len(latencies),
+        "edits_per_second": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(percentile(latencies, 0.5) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "conflicts": conflicts,
+    }
+
+
+async def main(args):
+    report = {"menus": args.menus, "duration": args.duration, "think_ms": args.think_ms}
+    think = args.think_ms / 1000
+    try:
+        for name, edit in EDITS.items():
+            report[name] = {}
+            for concurrency in [int(level) for level in args.concurrency.split(",")]:
+                async with SessionLocal() as db:
+                    menu_ids = (await db.scalars(
+                        insert(models.Menu).returning(models.Menu.id),
+                        [{"title": f"Contended {i}", "description": "Benchmark"} for i in range(args.menus)],
+                    )).all()
+                    await db.commit()
+                level = await run_level(edit, menu_ids, concurrency, args.duration, think)
+                async with SessionLocal() as db:
+                    versions = await db.scalar(select(func.sum(models.Menu.version - 1)).where(models.Menu.id.in_(menu_ids)))
+                    await db.execute(delete(models.Menu).where(models.Menu.id.in_(menu_ids)))
+                    await db.commit()
+                assert versions == level["edits"], f"{name}: {level['edits']} edits, versions moved by {versions}"
+                report[name][str(concurrency)] = level
+    finally:
+        await engine.dispose()
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--menus", type=int, default=1, help="rows the workers edit")
+    parser.add_argument("--duration", type=float, default=5, help="seconds per level")
+    parser.add_argument("--think-ms", type=float, default=1, help="work between the read and the write")
+    asyncio.run(main(parser.parse_args()))
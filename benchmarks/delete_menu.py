@@ -0,0 +1,78 @@
+"""Time ``DELETE /api/v1/menus/{id}`` on a large menu.
+
+Seeds one menu with ``--submenus`` submenus of ``--dishes`` dishes in total
+(50,000 by default) with set-based INSERTs, then deletes it through the menu
+service and reports the wall time and the number of SQL statements.  Run it
+against a migrated database::
+
+    python -m app.cli migrate
+    python -m benchmarks.delete_menu [--dishes 50000] [--submenus 50]
+"""
+import argparse
+import asyncio
+import json
+import time
+from uuid import uuid4
+
+from sqlalchemy import event, text
+
+from app.models.database import SessionLocal, engine
+from app.services import menus as menu_service
+
+
+SEED = [
+    "INSERT INTO menus (id, title) VALUES (:menu_id, 'Benchmark menu')",
+    """
+    INSERT INTO submenus (id, title, menu_id)
+    SELECT gen_random_uuid(), 'Benchmark submenu ' || i, :menu_id FROM generate_series(1, :submenus) AS i
+    """,
+    """
+    INSERT INTO dishes (id, title, description, price, submenu_id)
+    SELECT gen_random_uuid(), 'Benchmark dish ' || i, 'Benchmark dish', 9.99, s.id
+    FROM submenus AS s, generate_series(1, :per_submenu) AS i
+    WHERE s.menu_id = :menu_id
+    """,
+]
+
+
+async def seed(submenus, dishes):
+    menu_id = uuid4()
+    params = {"menu_id": menu_id, "submenus": submenus, "per_submenu": dishes // submenus}
+    async with SessionLocal() as db:
+        for statement in SEED:
+            await db.execute(text(statement), params)
+        await db.commit()
+    return menu_id
+
+
+async def main(args):
+    menu_id = await seed(args.submenus, args.dishes)
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        started = time.perf_counter()
+        async with SessionLocal() as db:
+            deleted = await menu_service.delete_menu(db, menu_id)
+        seconds = time.perf_counter() - started
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+        await engine.dispose()
+
+    assert deleted == menu_id
+    print(json.dumps({
+        "submenus": args.submenus,
+        "dishes": args.submenus * (args.dishes // args.submenus),
+        "seconds": round(seconds, 3),
+        "statements": len(statements),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--dishes", type=int, default=50_000)
+    parser.add_argument("--submenus", type=int, default=50)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,382 @@
+"""HTTP load test of the API with recorded baselines.
+
+Seeds a catalog (``--menus`` menus of ``--submenus`` submenus of ``--dishes``
+dishes) through ``POST /api/v1/import``, or through the ``:batch`` create
+endpoints where the import is not available (it needs PostgreSQL), then drives a weighted mix of reads
+and writes over every route (see ``MIX``) at each ``--concurrency`` level for
+``--duration`` seconds, and reports requests per second and p50/p95/p99
+latency, overall and per operation.  The seeded menus and everything the run
+created are deleted afterwards.
+
+By default the app runs in this process through the ASGI transport, against
+the database configured by ``SQLALCHEMY_DATABASE_URL``; ``--url`` targets a
+running server instead::
+
+    python -m app.cli migrate
+    python -m benchmarks.load --save                # record benchmarks/baselines/load.json
+    python -m benchmarks.load --compare             # exit 1 on a regression
+    python -m benchmarks.load --url http://127.0.0.1:8000 --concurrency 1,16,64
+
+A level regresses when its throughput drops, or its p95/p99 latency grows,
+by more than ``--threshold`` (20% by default) against the baseline.  Any
+unexpected status (5xx, or a 4xx on a request that should succeed) fails the
+run too.  Baselines only compare runs on the same machine and settings.
+"""
+import argparse
+import asyncio
+import csv
+import io
+import json
+import os
+import random
+import sys
+import time
+from collections import defaultdict
+from uuid import uuid4
+
+import httpx
+
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baselines", "load.json")
+API = "/api/v1/menus"
+# Items per :batch request, app.services.batch.MAX_ITEMS.
+BATCH_SIZE = 1000
+
+
+class Catalog:
+    """Ids of the seeded objects, plus the objects the run created and may delete."""
+
+    def __init__(self):
+        self.menus = []
+        self.submenus = []
+        self.dishes = []
+        self.created_menus = []
+        self.created_submenus = []
+        self.created_dishes = []
+
+    def seed_csv(self, menus, submenus, dishes):
+        out = io.StringIO()
+        writer = csv.writer(out)
+        writer.writerow(["menu_id", "menu_title", "submenu_id", "submenu_title", "dish_id", "dish_title", "dish_description", "dish_price"])
+        for m in range(menus):
+            menu_id = str(uuid4())
+            self.menus.append(menu_id)
+            for s in range(submenus):
+                submenu_id = str(uuid4())
+                self.submenus.append((menu_id, submenu_id))
+                for d in range(dishes):
+                    dish_id = str(uuid4())
+                    self.dishes.append((menu_id, submenu_id, dish_id))
+                    writer.writerow([
+                        menu_id, f"Load menu {m}", submenu_id, f"Load submenu {m}.{s}",
+                        dish_id, f"Dish {d} {random.choice(WORDS)}", "Seeded by the load test", "9.99",
+                    ])
+        return out.getvalue()
+
+    async def seed_batches(self, client, menus, submenus, dishes):
+        """Create the catalog through the API: one menu at a time, children in batches."""
+        async def create_batch(url, items):
+            ids = []
+            for start in range(0, len(items), BATCH_SIZE):
+                response = await client.post(url, json=items[start:start + BATCH_SIZE])
+                response.raise_for_status()
+                ids += [item["id"] for item in response.json()["results"]]
+            return ids
+
+        for m in range(menus):
+            response = await client.post(f"{API}/", json={"title": f"Load menu {m}", "description": "Seeded by the load test"})
+            response.raise_for_status()
+            menu_id = response.json()["id"]
+            self.menus.append(menu_id)
+            submenu_ids = await create_batch(f"{API}/{menu_id}/submenus:batch", [
+                {"title": f"Load submenu {m}.{s}", "description": "Seeded by the load test"} for s in range(submenus)
+            ])
+            for submenu_id in submenu_ids:
+                self.submenus.append((menu_id, submenu_id))
+                dish_ids = await create_batch(f"{API}/{menu_id}/submenus/{submenu_id}/dishes:batch", [
+                    {"title": f"Dish {d} {random.choice(WORDS)}", "description": "Seeded by the load test", "price": "9.99"}
+                    for d in range(dishes)
+                ])
+                self.dishes += [(menu_id, submenu_id, dish_id) for dish_id in dish_ids]
+
+
+WORDS = ["soup", "salad", "steak", "pasta", "cake", "tea", "pie", "curry", "noodles", "bread"]
+
+
+# Each operation picks its target and returns (name, method, url, json body,
+# expected statuses, callback on success).
+
+
+def list_menus(rng, catalog):
+    return "list_menus", "GET", f"{API}/?limit=20", None, (200,), None
+
+
+def get_menu(rng, catalog):
+    return "get_menu", "GET", f"{API}/{rng.choice(catalog.menus)}", None, (200,), None
+
+
+def get_menu_tree(rng, catalog):
+    return "get_menu_tree", "GET", f"{API}/{rng.choice(catalog.menus)}/tree", None, (200,), None
+
+
+def list_submenus(rng, catalog):
+    return "list_submenus", "GET", f"{API}/{rng.choice(catalog.menus)}/submenus", None, (200,), None
+
+
+def get_submenu(rng, catalog):
+    menu_id, submenu_id = rng.choice(catalog.submenus)
+    return "get_submenu", "GET", f"{API}/{menu_id}/submenus/{submenu_id}", None, (200,), None
+
+
+def list_dishes(rng, catalog):
+    menu_id, submenu_id = rng.choice(catalog.submenus)
+    return "list_dishes", "GET", f"{API}/{menu_id}/submenus/{submenu_id}/dishes", None, (200,), None
+
+
+def get_dish(rng, catalog):
+    menu_id, submenu_id, dish_id = rng.choice(catalog.dishes)
+    return "get_dish", "GET", f"{API}/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}", None, (200,), None
+
+
+def search(rng, catalog):
+    return "search", "GET", f"/api/v1/search/?q={rng.choice(WORDS)}&limit=20", None, (200,), None
+
+
+def create_menu(rng, catalog):
+    body = {"title": "Load menu", "description": "Created by the load test"}
+    return "create_menu", "POST", f"{API}/", body, (201,), lambda menu: catalog.created_menus.append(menu["id"])
+
+
+def update_menu(rng, catalog):
+    body = {"title": f"Load menu {rng.random()}", "description": "Updated by the load test"}
+    return "update_menu", "PATCH", f"{API}/{rng.choice(catalog.menus)}", body, (200,), None
+
+
+def delete_menu(rng, catalog):
+    if not catalog.created_menus:
+        return create_menu(rng, catalog)
+    return "delete_menu", "DELETE", f"{API}/{catalog.created_menus.pop()}", None, (200,), None
+
+
+def create_submenu(rng, catalog):
+    menu_id = rng.choice(catalog.menus)
+    body = {"title": "Load submenu", "description": "Created by the load test"}
+    return "create_submenu", "POST", f"{API}/{menu_id}/submenus", body, (201,), (
+        lambda submenu: catalog.created_submenus.append((menu_id, submenu["id"]))
+    )
+
+
+def update_submenu(rng, catalog):
+    menu_id, submenu_id = rng.choice(catalog.submenus)
+    body = {"title": f"Load submenu {rng.random()}", "description": "Updated by the load test"}
+    return "update_submenu", "PATCH", f"{API}/{menu_id}/submenus/{submenu_id}", body, (200,), None
+
+
+def delete_submenu(rng, catalog):
+    if not catalog.created_submenus:
+        return create_submenu(rng, catalog)
+    menu_id, submenu_id = catalog.created_submenus.pop()
+    return "delete_submenu", "DELETE", f"{API}/{menu_id}/submenus/{submenu_id}", None, (200,), None
+
+
+def create_dish(rng, catalog):
+    menu_id, submenu_id = rng.choice(catalog.submenus)
+    body = {"title": f"Load dish {rng.choice(WORDS)}", "description": "Created by the load test", "price": "12.50"}
+    return "create_dish", "POST", f"{API}/{menu_id}/submenus/{submenu_id}/dishes", body, (201,), (
+        lambda dish: catalog.created_dishes.append((menu_id, submenu_id, dish["id"]))
+    )
+
+
+def update_dish(rng, catalog):
+    menu_id, submenu_id, dish_id = rng.choice(catalog.dishes)
+    body = {"title": f"Dish {rng.choice(WORDS)}", "description": "Updated by the load test", "price": "10.25"}
+    return "update_dish", "PATCH", f"{API}/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}", body, (200,), None
+
+
+def delete_dish(rng, catalog):
+    if not catalog.created_dishes:
+        return create_dish(rng, catalog)
+    menu_id, submenu_id, dish_id = catalog.created_dishes.pop()
+    return "delete_dish", "DELETE", f"{API}/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}", None, (200,), None
+
+
+def export_menu(rng, catalog):
+    return "export_menu", "GET", f"/api/v1/export?menu_id={rng.choice(catalog.menus)}", None, (200,), None
+
+
+def stats(rng, catalog):
+    return "stats", "GET", rng.choice(["/api/v1/stats/cache", "/api/v1/stats/pool", "/metrics"]), None, (200,), None
+
+
+# Mostly reads, like a menu-browsing client; writes are ~15% of the traffic.
+MIX = {
+    list_menus: 10,
+    get_menu: 12,
+    get_menu_tree: 4,
+    list_submenus: 8,
+    get_submenu: 10,
+    list_dishes: 8,
+    get_dish: 14,
+    search: 4,
+    create_menu: 1,
+    update_menu: 1,
+    delete_menu: 1,
+    create_submenu: 2,
+    update_submenu: 2,
+    delete_submenu: 2,
+    create_dish: 4,
+    update_dish: 4,
+    delete_dish: 4,
+    export_menu: 1,
+    stats: 1,
+}
+
+
+def percentile(sorted_values, p):
+    """Nearest-rank percentile of an already sorted list."""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * p // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(latencies, seconds):
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "rps": round(len(latencies) / seconds, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 2),
+    }
+
+
+async def run_level(client, catalog, concurrency, duration, seed):
+    operations, weights = list(MIX), list(MIX.values())
+    latencies = defaultdict(list)
+    errors = []
+    deadline = time.perf_counter() + duration
+
+    async def worker(n):
+        rng = random.Random(seed * 1000 + n)
+        while time.perf_counter() < deadline:
+            name, method, url, body, expected, on_success = rng.choices(operations, weights)[0](rng, catalog)
+            started = time.perf_counter()
+            response = await client.request(method, url, json=body)
+            await response.aread()
+            latencies[name].append(time.perf_counter() - started)
+            if response.status_code not in expected:
+                errors.append({"operation": name, "url": url, "status": response.status_code})
+            elif on_success is not None:
+                on_success(response.json())
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(n) for n in range(concurrency)))
+    seconds = time.perf_counter() - started
+
+    result = summarize([latency for values in latencies.values() for latency in values], seconds)
+    result["errors"] = len(errors)
+    result["first_errors"] = errors[:10]
+    result["operations"] = {name: summarize(values, seconds) for name, values in sorted(latencies.items())}
+    return result
+
+
+def compare(results, baseline, threshold):
+    """Human-readable regressions of ``results`` against ``baseline``."""
+    regressions = []
+    for level, current in results["levels"].items():
+        previous = baseline["levels"].get(level)
+        if previous is None:
+            continue
+        if current["rps"] < previous["rps"] * (1 - threshold):
+            regressions.append(f"concurrency {level}: {current['rps']} rps, baseline {previous['rps']}")
+        for key in ("p95_ms", "p99_ms"):
+            if current[key] > previous[key] * (1 + threshold):
+                regressions.append(f"concurrency {level}: {key} {current[key]}, baseline {previous[key]}")
+    return regressions
+
+
+def client_for(url, concurrency):
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    if url:
+        return httpx.AsyncClient(base_url=url, limits=limits, timeout=30, follow_redirects=True)
+
+    from app.main import app
+
+    return httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://load", timeout=30, follow_redirects=True,
+    )
+
+
+async def main(args):
+    levels = [int(level) for level in args.concurrency.split(",")]
+    catalog = Catalog()
+    failures = []
+
+    async with client_for(args.url, max(levels)) as client:
+        response = await client.post(
+            "/api/v1/import", params={"format": "csv"},
+            content=catalog.seed_csv(args.menus, args.submenus, args.dishes),
+        )
+        if response.status_code == 400 and "requires PostgreSQL" in response.text:
+            # SQLite or another backend without COPY: nothing was imported.
+            catalog = Catalog()
+            await catalog.seed_batches(client, args.menus, args.submenus, args.dishes)
+        else:
+            response.raise_for_status()
+        try:
+            results = {
+                "target": args.url or "in-process",
+                "catalog": {"menus": args.menus, "submenus": args.submenus, "dishes": args.dishes},
+                "duration": args.duration,
+                "levels": {},
+            }
+            for level in levels:
+                # A short warm-up fills the connection pools and caches.
+                await run_level(client, catalog, level, min(1.0, args.duration), args.seed)
+                result = await run_level(client, catalog, level, args.duration, args.seed)
+                results["levels"][str(level)] = result
+                print(
+                    f"concurrency {level:>4}: {result['rps']:>8} rps  p50 {result['p50_ms']} ms  "
+                    f"p95 {result['p95_ms']} ms  p99 {result['p99_ms']} ms  errors {result['errors']}",
+                    file=sys.stderr,
+                )
+                if result["errors"]:
+                    failures.append(f"concurrency {level}: {result['errors']} unexpected responses, e.g. {result['first_errors'][0]}")
+        finally:
+            for menu_id in catalog.menus + catalog.created_menus:
+                await client.delete(f"{API}/{menu_id}")
+
+    if not args.url:
+        from app.models.database import engine
+
+        await engine.dispose()
+
+    print(json.dumps(results, indent=2))
+    if args.save:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w") as file:
+            json.dump(results, file, indent=2)
+    if args.compare:
+        with open(args.baseline) as file:
+            failures += compare(results, json.load(file), args.threshold)
+
+    for failure in failures:
+        print(f"REGRESSION {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--url", help="base URL of a running server (default: the app in this process)")
+    parser.add_argument("--concurrency", default="1,8,32", help="comma-separated concurrency levels")
+    parser.add_argument("--duration", type=float, default=10, help="seconds per level")
+    parser.add_argument("--menus", type=int, default=20)
+    parser.add_argument("--submenus", type=int, default=5, help="per menu")
+    parser.add_argument("--dishes", type=int, default=10, help="per submenu")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--baseline", default=BASELINE)
+    parser.add_argument("--save", action="store_true", help="write the results to --baseline")
+    parser.add_argument("--compare", action="store_true", help="fail on a regression against --baseline")
+    parser.add_argument("--threshold", type=float, default=0.2)
+    sys.exit(asyncio.run(main(parser.parse_args())))
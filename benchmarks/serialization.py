@@ -0,0 +1,109 @@
+"""Cost of building a list response: validated ORM path against the orjson path.
+
+Seeds one submenu with ``--rows`` dishes (10,000 by default) and times, for
+the whole list, the two ways of turning it into response bytes:
+
+* ``orm``: load ``Dish`` entities, dump them through the ``List[Dish]``
+  adapter as the cache did, then what FastAPI does for a ``response_model``
+  (validate again, ``jsonable_encoder``, stdlib ``json``);
+* ``orjson``: the column-only query of ``app.services.dishes`` into plain
+  dicts, encoded with ``app.services.serialization``.
+
+The cache is bypassed.  Reports the median of ``--runs`` runs for the query,
+the encoding and both together.  Run it against a migrated database::
+
+    python -m app.cli migrate
+    python -m benchmarks.serialization [--rows 10000] [--runs 7]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+from typing import List
+from uuid import uuid4
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+from sqlalchemy import select, text
+
+from app.models import core as models
+from app.models import schemas
+from app.models.database import SessionLocal, engine
+from app.services import dishes as dish_service
+from app.services import serialization
+
+
+SEED = [
+    "INSERT INTO menus (id, title) VALUES (:menu_id, 'Benchmark menu')",
+    "INSERT INTO submenus (id, title, menu_id) VALUES (:submenu_id, 'Benchmark submenu', :menu_id)",
+    """
+    INSERT INTO dishes (id, title, description, price, submenu_id)
+    SELECT gen_random_uuid(), 'Benchmark dish ' || i, 'A benchmark dish with a description', 9.99, :submenu_id
+    FROM generate_series(1, :rows) AS i
+    """,
+]
+
+dishes_adapter = TypeAdapter(List[schemas.Dish])
+
+
+async def orm_path(db, submenu_id, rows):
+    started = time.perf_counter()
+    result = await db.execute(
+        select(models.Dish).where(models.Dish.submenu_id == submenu_id)
+        .order_by(models.Dish.created_at, models.Dish.id).limit(rows)
+    )
+    dishes = result.scalars().all()
+    loaded = time.perf_counter()
+    items = dishes_adapter.dump_python(dishes_adapter.validate_python(dishes, from_attributes=True), mode="json")
+    content = jsonable_encoder(dishes_adapter.dump_python(dishes_adapter.validate_python(items), mode="json"))
+    body = json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+    return loaded - started, time.perf_counter() - loaded, body
+
+
+async def orjson_path(db, submenu_id, rows):
+    started = time.perf_counter()
+    items, _ = await dish_service._load_dishes(db, submenu_id, None, rows)
+    loaded = time.perf_counter()
+    body = serialization.dumps(items)
+    return loaded - started, time.perf_counter() - loaded, body
+
+
+async def main(args):
+    menu_id, submenu_id = uuid4(), uuid4()
+    params = {"menu_id": menu_id, "submenu_id": submenu_id, "rows": args.rows}
+    async with SessionLocal() as db:
+        for statement in SEED:
+            await db.execute(text(statement), params)
+        await db.commit()
+
+    report = {"rows": args.rows, "runs": args.runs}
+    try:
+        for name, path in (("orm", orm_path), ("orjson", orjson_path)):
+            timings = []
+            for _ in range(args.runs):
+                async with SessionLocal() as db:
+                    query, encode, body = await path(db, submenu_id, args.rows)
+                timings.append((query, encode))
+            report[name] = {
+                "query_ms": round(statistics.median(query for query, _ in timings) * 1000, 1),
+                "encode_ms": round(statistics.median(encode for _, encode in timings) * 1000, 1),
+                "total_ms": round(statistics.median(query + encode for query, encode in timings) * 1000, 1),
+                "bytes": len(body),
+            }
+            assert len(json.loads(body)) == args.rows
+    finally:
+        async with SessionLocal() as db:
+            await db.execute(text("DELETE FROM menus WHERE id = :menu_id"), params)
+            await db.commit()
+        await engine.dispose()
+
+    report["speedup"] = round(report["orm"]["total_ms"] / report["orjson"]["total_ms"], 1)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--rows", type=int, default=10_000)
+    parser.add_argument("--runs", type=int, default=7)
+    asyncio.run(main(parser.parse_args()))
@@ -0,0 +1,74 @@
+"""Import-to-first-request latency of the API.
+
+Starts ``uvicorn app.main:app`` in a fresh process and measures the time until
+the first ``GET /api/v1/menus`` succeeds: interpreter start, imports, lifespan
+startup and the first query.  Run it against a migrated database::
+
+    python -m app.cli migrate
+    python -m benchmarks.startup [--runs 5] [--workers 1]
+"""
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import httpx
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def measure(workers, timeout):
+    port = free_port()
+    url = f"http://127.0.0.1:{port}/api/v1/menus/?limit=1"
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning"],
+        cwd=ROOT,
+    )
+    try:
+        while time.perf_counter() - started < timeout:
+            if server.poll() is not None:
+                raise RuntimeError(f"server exited with {server.returncode}")
+            try:
+                if httpx.get(url).status_code == 200:
+                    return time.perf_counter() - started
+            except httpx.TransportError:
+                pass
+            time.sleep(0.005)
+        raise RuntimeError(f"no response within {timeout}s")
+    finally:
+        server.terminate()
+        server.wait()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--timeout", type=float, default=60)
+    args = parser.parse_args(argv)
+
+    seconds = [measure(args.workers, args.timeout) for _ in range(args.runs)]
+    print(json.dumps({
+        "workers": args.workers,
+        "runs": args.runs,
+        "min": round(min(seconds), 3),
+        "median": round(statistics.median(seconds), 3),
+        "max": round(max(seconds), 3),
+    }, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,192 @@
+"""Latency of single-row writes: commit-and-refresh against ``RETURNING``.
+
+Times ``--runs`` creates and updates of menus, submenus and dishes (200 each
+by default) two ways:
+
+* ``refresh``: the previous services, which SELECT the parent or the row,
+  commit, then ``refresh()`` the row with a second SELECT;
+* ``returning``: the current services in ``app.services``, one
+  ``INSERT ... RETURNING`` or ``UPDATE ... RETURNING`` per write.
+
+Reports the median and p95 latency and the SQL statements per write, and the
+median saved.  The difference grows with the round-trip time to the
+database, so run it against the database the app really uses::
+
+    python -m app.cli migrate
+    python -m benchmarks.writes [--runs 200]
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import time
+
+from sqlalchemy import delete, event, select
+
+from app.metrics import is_transaction_control
+from app.models import core as models
+from app.models import schemas
+from app.models.database import SessionLocal, engine
+from app.services import cache
+from app.services import dishes as dish_service
+from app.services import menus as menu_service
+from app.services import submenus as submenu_service
+
+
+MENU = schemas.MenuCreate(title="Benchmark menu", description="Benchmark menu")
+SUBMENU = schemas.SubmenuCreate(title="Benchmark submenu", description="Benchmark submenu")
+DISH = schemas.DishCreate(title="Benchmark dish", description="Benchmark dish", price="9.99")
+MENU_UPDATE = schemas.MenuUpdate(title="Benchmark menu", description="Updated")
+SUBMENU_UPDATE = schemas.SubmenuUpdate(title="Benchmark submenu", description="Updated")
+DISH_UPDATE = schemas.DishUpdate(title="Benchmark dish", description="Updated", price="8.99")
+
+
+async def refresh_create_menu(db, menu):
+    db_menu = models.Menu(title=menu.title, description=menu.description)
+    db.add(db_menu)
+    await db.commit()
+    await db.refresh(db_menu)
+    await cache.invalidate([cache.menus_key()])
+    return db_menu
+
+
+async def refresh_update_menu(db, menu_id, menu_update):
+    db_menu = await db.scalar(select(models.Menu).where(models.Menu.id == menu_id))
+    db_menu.title = menu_update.title
+    db_menu.description = menu_update.description
+    await db.commit()
+    await db.refresh(db_menu)
+    await cache.invalidate([cache.menus_key(), cache.menu_key(menu_id)])
+    return db_menu
+
+
+async def refresh_create_submenu(db, submenu, menu_id):
+    await db.scalar(select(models.Menu).where(models.Menu.id == menu_id))
+    db_submenu = models.Submenu(title=submenu.title, description=submenu.description, menu_id=menu_id)
+    db.add(db_submenu)
+    await db.commit()
+    await db.refresh(db_submenu)
+    await cache.invalidate(submenu_service.counted_keys(menu_id))
+    return db_submenu
+
+
+async def refresh_update_submenu(db, menu_id, submenu_id, submenu_update):
+    db_submenu = await db.scalar(select(models.Submenu).where(models.Submenu.id == submenu_id))
+    for key, value in submenu_update.model_dump(exclude_unset=True).items():
+        setattr(db_submenu, key, value)
+    await db.commit()
+    await db.refresh(db_submenu)
+    await cache.invalidate([cache.submenus_key(db_submenu.menu_id), cache.submenu_key(submenu_id)])
+    return db_submenu
+
+
+async def refresh_create_dish(db, dish, menu_id, submenu_id):
+    db_dish = models.Dish(title=dish.title, description=dish.description, price=dish.price, submenu_id=submenu_id)
+    db.add(db_dish)
+    await db.commit()
+    await db.refresh(db_dish)
+    menu_id = await db.scalar(select(models.Submenu.menu_id).where(models.Submenu.id == submenu_id))
+    await cache.invalidate([cache.submenu_key(submenu_id), cache.dishes_key(submenu_id)] + submenu_service.counted_keys(menu_id))
+    return db_dish
+
+
+async def refresh_update_dish(db, menu_id, submenu_id, dish_id, dish_update):
+    db_dish = await db.get(models.Dish, dish_id)
+    for key, value in dish_update.model_dump(exclude_unset=True).items():
+        setattr(db_dish, key, value)
+    await db.commit()
+    await db.refresh(db_dish)
+    await cache.invalidate([cache.dishes_key(db_dish.submenu_id), cache.dish_key(db_dish.submenu_id, dish_id)])
+    return db_dish
+
+
+PATHS = {
+    "refresh": {
+        "create_menu": refresh_create_menu,
+        "update_menu": refresh_update_menu,
+        "create_submenu": refresh_create_submenu,
+        "update_submenu": refresh_update_submenu,
+        "create_dish": refresh_create_dish,
+        "update_dish": refresh_update_dish,
+    },
+    "returning": {
+        "create_menu": menu_service.create_menu,
+        "update_menu": menu_service.update_menu,
+        "create_submenu": submenu_service.create_submenu,
+        "update_submenu": submenu_service.update_submenu,
+        "create_dish": dish_service.create_dish,
+        "update_dish": dish_service.update_dish,
+    },
+}
+
+
+async def timed(statements, write, *args):
+    statements.clear()
+    started = time.perf_counter()
+    async with SessionLocal() as db:
+        row = await write(db, *args)
+    return time.perf_counter() - started, len(statements), row
+
+
+def summary(samples):
+    seconds = sorted(seconds for seconds, _ in samples)
+    return {
+        "p50_ms": round(statistics.median(seconds) * 1000, 3),
+        "p95_ms": round(seconds[max(0, round(len(seconds) * 0.95) - 1)] * 1000, 3),
+        "statements": max(count for _, count in samples),
+    }
+
+
+async def run(path, runs, statements):
+    writes = PATHS[path]
+    samples = {name: [] for name in writes}
+    menu_ids = []
+    for _ in range(runs):
+        seconds, count, menu = await timed(statements, writes["create_menu"], MENU)
+        samples["create_menu"].append((seconds, count))
+        menu_ids.append(menu.id)
+        seconds, count, _ = await timed(statements, writes["update_menu"], menu.id, MENU_UPDATE)
+        samples["update_menu"].append((seconds, count))
+        seconds, count, submenu = await timed(statements, writes["create_submenu"], SUBMENU, menu.id)
+        samples["create_submenu"].append((seconds, count))
+        seconds, count, _ = await timed(statements, writes["update_submenu"], menu.id, submenu.id, SUBMENU_UPDATE)
+        samples["update_submenu"].append((seconds, count))
+        seconds, count, dish = await timed(statements, writes["create_dish"], DISH, menu.id, submenu.id)
+        samples["create_dish"].append((seconds, count))
+        seconds, count, _ = await timed(statements, writes["update_dish"], menu.id, submenu.id, dish.id, DISH_UPDATE)
+        samples["update_dish"].append((seconds, count))
+    return {name: summary(values) for name, values in samples.items()}, menu_ids
+
+
+async def main(args):
+    statements = []
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not is_transaction_control(statement):
+            statements.append(statement)
+
+    event.listen(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+    report = {"runs": args.runs}
+    menu_ids = []
+    try:
+        for path in PATHS:
+            report[path], created = await run(path, args.runs, statements)
+            menu_ids += created
+    finally:
+        event.remove(engine.sync_engine, "after_cursor_execute", after_cursor_execute)
+        async with SessionLocal() as db:
+            await db.execute(delete(models.Menu).where(models.Menu.id.in_(menu_ids)))
+            await db.commit()
+        await engine.dispose()
+
+    report["saved_p50_ms"] = {
+        name: round(report["refresh"][name]["p50_ms"] - report["returning"][name]["p50_ms"], 3)
+        for name in PATHS["returning"]
+    }
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=200)
+    asyncio.run(main(parser.parse_args()))
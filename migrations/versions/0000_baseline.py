@@ -0,0 +1,70 @@
+"""baseline
+
+The tables the app created with ``create_all`` at startup before migrations
+existed: no timestamps, nullable counters without server defaults, no
+triggers.  Databases from those versions are stamped here by
+``python -m app.cli migrate`` and brought up to date by 0001.
+
+Revision ID: 0000
+Revises:
+Create Date: 2026-10-18 07:10:02.104417
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0000'
+down_revision: Union[str, Sequence[str], None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table('menus',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('title', sa.String(), nullable=True),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('submenus_count', sa.Integer(), nullable=True),
+    sa.Column('dishes_count', sa.Integer(), nullable=True),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_menus_description'), 'menus', ['description'], unique=False)
+    op.create_index(op.f('ix_menus_title'), 'menus', ['title'], unique=False)
+    op.create_table('submenus',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('title', sa.String(), nullable=True),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('dishes_count', sa.Integer(), nullable=True),
+    sa.Column('menu_id', sa.UUID(), nullable=True),
+    sa.ForeignKeyConstraint(['menu_id'], ['menus.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_submenus_title'), 'submenus', ['title'], unique=False)
+    op.create_table('dishes',
+    sa.Column('id', sa.UUID(), nullable=False),
+    sa.Column('title', sa.String(), nullable=True),
+    sa.Column('description', sa.String(), nullable=True),
+    sa.Column('price', sa.Numeric(precision=10, scale=2), nullable=False),
+    sa.Column('submenu_id', sa.UUID(), nullable=True),
+    sa.ForeignKeyConstraint(['submenu_id'], ['submenus.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_index(op.f('ix_dishes_description'), 'dishes', ['description'], unique=False)
+    op.create_index(op.f('ix_dishes_title'), 'dishes', ['title'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_dishes_title'), table_name='dishes')
+    op.drop_index(op.f('ix_dishes_description'), table_name='dishes')
+    op.drop_table('dishes')
+    op.drop_index(op.f('ix_submenus_title'), table_name='submenus')
+    op.drop_table('submenus')
+    op.drop_index(op.f('ix_menus_title'), table_name='menus')
+    op.drop_index(op.f('ix_menus_description'), table_name='menus')
+    op.drop_table('menus')
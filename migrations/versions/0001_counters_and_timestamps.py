@@ -0,0 +1,261 @@
+"""counters and timestamps
+
+Brings the baseline tables to the schema of the move from ``create_all`` at
+startup to migrations: exact, non-null counters kept by triggers, and
+``created_at``/``updated_at`` for pagination and ETags.  Counters of
+existing rows are recomputed.  The trigger SQL is frozen here; later changes
+to app.models.triggers need their own revision.
+
+Revision ID: 0001
+Revises: 0000
+Create Date: 2026-10-18 07:14:30.886198
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0001'
+down_revision: Union[str, Sequence[str], None] = '0000'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TRIGGERS = [
+    """
+    CREATE OR REPLACE FUNCTION apply_dishes_count_delta(p_submenu_ids uuid[], p_deltas bigint[])
+    RETURNS void LANGUAGE sql AS $$
+        WITH delta AS (
+            SELECT submenu_id, n FROM unnest(p_submenu_ids, p_deltas) AS d(submenu_id, n)
+            WHERE n <> 0
+        ),
+        touched AS (
+            UPDATE submenus SET dishes_count = submenus.dishes_count + delta.n
+            FROM delta
+            WHERE submenus.id = delta.submenu_id
+            RETURNING submenus.menu_id, delta.n
+        )
+        UPDATE menus SET dishes_count = menus.dishes_count + t.n
+        FROM (SELECT menu_id, sum(n) AS n FROM touched GROUP BY menu_id) AS t
+        WHERE menus.id = t.menu_id;
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION apply_submenus_count_delta(
+        p_menu_ids uuid[], p_submenu_deltas bigint[], p_dish_deltas bigint[]
+    )
+    RETURNS void LANGUAGE sql AS $$
+        UPDATE menus SET
+            submenus_count = menus.submenus_count + d.submenus,
+            dishes_count = menus.dishes_count + d.dishes
+        FROM unnest(p_menu_ids, p_submenu_deltas, p_dish_deltas) AS d(menu_id, submenus, dishes)
+        WHERE menus.id = d.menu_id;
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION dishes_counts_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM apply_dishes_count_delta(array_agg(submenu_id), array_agg(n))
+        FROM (SELECT submenu_id, count(*) AS n FROM new_rows GROUP BY submenu_id) AS d;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION dishes_counts_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM apply_dishes_count_delta(array_agg(submenu_id), array_agg(n))
+        FROM (SELECT submenu_id, -count(*) AS n FROM old_rows GROUP BY submenu_id) AS d;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION dishes_counts_move() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM apply_dishes_count_delta(ARRAY[OLD.submenu_id, NEW.submenu_id], ARRAY[-1, 1]::bigint[]);
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION submenus_counts_insert() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM apply_submenus_count_delta(array_agg(menu_id), array_agg(submenus), array_agg(dishes))
+        FROM (
+            SELECT menu_id, count(*) AS submenus, sum(dishes_count) AS dishes
+            FROM new_rows GROUP BY menu_id
+        ) AS d;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION submenus_counts_delete() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM apply_submenus_count_delta(array_agg(menu_id), array_agg(submenus), array_agg(dishes))
+        FROM (
+            SELECT menu_id, -count(*) AS submenus, -sum(dishes_count) AS dishes
+            FROM old_rows GROUP BY menu_id
+        ) AS d;
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION submenus_counts_move() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        PERFORM apply_submenus_count_delta(
+            ARRAY[OLD.menu_id, NEW.menu_id],
+            ARRAY[-1, 1]::bigint[],
+            ARRAY[-OLD.dishes_count, NEW.dishes_count]::bigint[]
+        );
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION touch_updated_at() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.updated_at := greatest(clock_timestamp(), OLD.updated_at + interval '1 microsecond');
+        RETURN NEW;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION dishes_touch_submenus() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE submenus SET updated_at = clock_timestamp()
+        WHERE id IN (SELECT submenu_id FROM new_rows);
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION submenus_touch_menus() RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        UPDATE menus SET updated_at = clock_timestamp()
+        WHERE id IN (SELECT menu_id FROM new_rows);
+        RETURN NULL;
+    END
+    $$
+    """,
+    """
+    CREATE OR REPLACE TRIGGER dishes_counts_insert AFTER INSERT ON dishes
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION dishes_counts_insert()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER dishes_counts_delete AFTER DELETE ON dishes
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION dishes_counts_delete()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER dishes_counts_move AFTER UPDATE OF submenu_id ON dishes
+    FOR EACH ROW WHEN (OLD.submenu_id IS DISTINCT FROM NEW.submenu_id)
+    EXECUTE FUNCTION dishes_counts_move()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER submenus_counts_insert AFTER INSERT ON submenus
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION submenus_counts_insert()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER submenus_counts_delete AFTER DELETE ON submenus
+    REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION submenus_counts_delete()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER submenus_counts_move AFTER UPDATE OF menu_id ON submenus
+    FOR EACH ROW WHEN (OLD.menu_id IS DISTINCT FROM NEW.menu_id)
+    EXECUTE FUNCTION submenus_counts_move()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER menus_updated_at BEFORE UPDATE ON menus
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER submenus_updated_at BEFORE UPDATE ON submenus
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER dishes_updated_at BEFORE UPDATE ON dishes
+    FOR EACH ROW EXECUTE FUNCTION touch_updated_at()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER dishes_touch_submenus AFTER UPDATE ON dishes
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION dishes_touch_submenus()
+    """,
+    """
+    CREATE OR REPLACE TRIGGER submenus_touch_menus AFTER UPDATE ON submenus
+    REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION submenus_touch_menus()
+    """,
+]
+
+FUNCTIONS = [
+    "apply_dishes_count_delta",
+    "apply_submenus_count_delta",
+    "dishes_counts_insert",
+    "dishes_counts_delete",
+    "dishes_counts_move",
+    "submenus_counts_insert",
+    "submenus_counts_delete",
+    "submenus_counts_move",
+    "touch_updated_at",
+    "dishes_touch_submenus",
+    "submenus_touch_menus",
+]
+
+
+TABLES = ('menus', 'submenus', 'dishes')
+
+COUNTERS = {'menus': ('submenus_count', 'dishes_count'), 'submenus': ('dishes_count',)}
+
+RECOUNT = [
+    """
+    UPDATE submenus SET dishes_count = (SELECT count(*) FROM dishes WHERE dishes.submenu_id = submenus.id)
+    """,
+    """
+    UPDATE menus SET
+        submenus_count = (SELECT count(*) FROM submenus WHERE submenus.menu_id = menus.id),
+        dishes_count = (SELECT coalesce(sum(dishes_count), 0) FROM submenus WHERE submenus.menu_id = menus.id)
+    """,
+]
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for statement in RECOUNT:
+        op.execute(statement)
+    for table, columns in COUNTERS.items():
+        for column in columns:
+            op.alter_column(table, column, existing_type=sa.Integer(), nullable=False, server_default='0')
+    for table in TABLES:
+        op.add_column(table, sa.Column('created_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+        op.add_column(table, sa.Column('updated_at', sa.DateTime(timezone=True), server_default=sa.text('now()'), nullable=False))
+    op.create_index('ix_menus_created_at_id', 'menus', ['created_at', 'id'], unique=False)
+    op.create_index('ix_submenus_menu_id_created_at_id', 'submenus', ['menu_id', 'created_at', 'id'], unique=False)
+    op.create_index('ix_dishes_submenu_id_created_at_id', 'dishes', ['submenu_id', 'created_at', 'id'], unique=False)
+    for statement in TRIGGERS:
+        op.execute(statement)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # CASCADE drops the triggers with their functions.
+    for function in FUNCTIONS:
+        op.execute(f"DROP FUNCTION IF EXISTS {function} CASCADE")
+    op.drop_index('ix_dishes_submenu_id_created_at_id', table_name='dishes')
+    op.drop_index('ix_submenus_menu_id_created_at_id', table_name='submenus')
+    op.drop_index('ix_menus_created_at_id', table_name='menus')
+    for table in TABLES:
+        op.drop_column(table, 'updated_at')
+        op.drop_column(table, 'created_at')
+    for table, columns in COUNTERS.items():
+        for column in columns:
+            op.alter_column(table, column, existing_type=sa.Integer(), nullable=True, server_default=None)
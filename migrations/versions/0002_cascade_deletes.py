@@ -0,0 +1,37 @@
+"""cascade deletes
+
+Deleting a menu or submenu removes its children with ON DELETE CASCADE
+instead of ORM-loaded per-row deletes.  The counter triggers already ignore
+deltas for parents deleted in the same statement.
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18 08:02:11.417532
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0002'
+down_revision: Union[str, Sequence[str], None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_constraint('submenus_menu_id_fkey', 'submenus', type_='foreignkey')
+    op.create_foreign_key('submenus_menu_id_fkey', 'submenus', 'menus', ['menu_id'], ['id'], ondelete='CASCADE')
+    op.drop_constraint('dishes_submenu_id_fkey', 'dishes', type_='foreignkey')
+    op.create_foreign_key('dishes_submenu_id_fkey', 'dishes', 'submenus', ['submenu_id'], ['id'], ondelete='CASCADE')
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_constraint('dishes_submenu_id_fkey', 'dishes', type_='foreignkey')
+    op.create_foreign_key('dishes_submenu_id_fkey', 'dishes', 'submenus', ['submenu_id'], ['id'])
+    op.drop_constraint('submenus_menu_id_fkey', 'submenus', type_='foreignkey')
+    op.create_foreign_key('submenus_menu_id_fkey', 'submenus', 'menus', ['menu_id'], ['id'])
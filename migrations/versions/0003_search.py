@@ -0,0 +1,70 @@
+"""search
+
+Full-text search vectors with GIN indexes on submenus and dishes, trigram
+indexes on their titles where pg_trgm is available, and removal of the btree
+indexes on title/description that no query uses.
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-18 07:27:33.976819
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql
+
+# revision identifiers, used by Alembic.
+revision: str = '0003'
+down_revision: Union[str, Sequence[str], None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+SEARCH_VECTOR = (
+    "setweight(to_tsvector('english', coalesce(title, '')), 'A') || "
+    "setweight(to_tsvector('english', coalesce(description, '')), 'B')"
+)
+
+TRIGRAM = """
+DO $$
+BEGIN
+    IF EXISTS (SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm') THEN
+        CREATE EXTENSION IF NOT EXISTS pg_trgm;
+        CREATE INDEX IF NOT EXISTS ix_submenus_title_trgm ON submenus USING gin (title gin_trgm_ops);
+        CREATE INDEX IF NOT EXISTS ix_dishes_title_trgm ON dishes USING gin (title gin_trgm_ops);
+    END IF;
+EXCEPTION WHEN insufficient_privilege THEN
+    RAISE NOTICE 'pg_trgm not installed, search runs without typo tolerance';
+END
+$$
+"""
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.drop_index(op.f('ix_menus_description'), table_name='menus')
+    op.drop_index(op.f('ix_menus_title'), table_name='menus')
+    op.drop_index(op.f('ix_submenus_title'), table_name='submenus')
+    op.drop_index(op.f('ix_dishes_description'), table_name='dishes')
+    op.drop_index(op.f('ix_dishes_title'), table_name='dishes')
+    for table in ('submenus', 'dishes'):
+        op.add_column(table, sa.Column('search_vector', postgresql.TSVECTOR(), sa.Computed(SEARCH_VECTOR, persisted=True), nullable=True))
+        op.create_index(f'ix_{table}_search_vector', table, ['search_vector'], unique=False, postgresql_using='gin')
+    op.execute(TRIGRAM)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # The extension stays, other database objects may use it.
+    op.execute("DROP INDEX IF EXISTS ix_dishes_title_trgm")
+    op.execute("DROP INDEX IF EXISTS ix_submenus_title_trgm")
+    for table in ('dishes', 'submenus'):
+        op.drop_index(f'ix_{table}_search_vector', table_name=table, postgresql_using='gin')
+        op.drop_column(table, 'search_vector')
+    op.create_index(op.f('ix_dishes_title'), 'dishes', ['title'], unique=False)
+    op.create_index(op.f('ix_dishes_description'), 'dishes', ['description'], unique=False)
+    op.create_index(op.f('ix_submenus_title'), 'submenus', ['title'], unique=False)
+    op.create_index(op.f('ix_menus_title'), 'menus', ['title'], unique=False)
+    op.create_index(op.f('ix_menus_description'), 'menus', ['description'], unique=False)
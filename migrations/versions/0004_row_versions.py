@@ -0,0 +1,37 @@
+"""row versions
+
+A ``version`` counter on menus, submenus and dishes for optimistic
+concurrency: PATCH bumps it and, given the version the client edited,
+updates only if it is still current.  Existing rows start at 1.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-18 09:12:40.518204
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0004'
+down_revision: Union[str, Sequence[str], None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+TABLES = ('menus', 'submenus', 'dishes')
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(), server_default='1', nullable=False))
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    for table in reversed(TABLES):
+        op.drop_column(table, 'version')
@@ -0,0 +1,34 @@
+"""path indexes
+
+Composite indexes backing the ownership checks of nested routes: a
+submenu is looked up as ``(menu_id, id)`` and a dish as
+``(submenu_id, id)``.  The foreign key columns lead both, as they already
+lead the pagination indexes, so cascades and parent lookups stay indexed.
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-18 10:03:52.144870
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision: str = '0005'
+down_revision: Union[str, Sequence[str], None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_index('ix_submenus_menu_id_id', 'submenus', ['menu_id', 'id'])
+    op.create_index('ix_dishes_submenu_id_id', 'dishes', ['submenu_id', 'id'])
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_dishes_submenu_id_id', table_name='dishes')
+    op.drop_index('ix_submenus_menu_id_id', table_name='submenus')
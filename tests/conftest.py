@@ -0,0 +1,168 @@
+"""Test database setup and the query-budget plugin.
+
+The schema is created once per session.  Every test then runs inside a
+transaction on one connection that is rolled back afterwards; ``SessionLocal``
+(and so ``get_db``) joins it through savepoints, so the
+code under test commits as usual without anything reaching the database.
+
+The database comes from ``SQLALCHEMY_DATABASE_URL`` (PostgreSQL by default,
+``sqlite:///:memory:`` for a quick local run).  Under pytest-xdist every
+worker uses its own database, created on demand.  Tests marked
+``postgresql`` are skipped on other databases.
+
+Query budgets: ``@pytest.mark.query_budget(n)`` fails the test when any
+request it makes to the app issues more than ``n`` SQL statements.
+Statements are attributed to requests through the per-request tally of
+``app.metrics``; statements run by the test itself (fixtures, direct session
+use) and transaction control are not counted.  The failure lists every
+statement of the offending request, which is usually enough to spot the N+1.
+"""
+import os
+
+from sqlalchemy.engine import make_url
+
+
+def _worker_url(url, worker):
+    url = make_url(url)
+    if url.get_backend_name() == "sqlite":
+        # An in-memory database is private to the worker process already.
+        if url.database in (None, "", ":memory:"):
+            return url
+        root, ext = os.path.splitext(url.database)
+        return url.set(database=f"{root}_{worker}{ext}")
+    return url.set(database=f"{url.database}_{worker}")
+
+
+# Before the app creates its engine.
+if "PYTEST_XDIST_WORKER" in os.environ:
+    os.environ["SQLALCHEMY_DATABASE_URL"] = _worker_url(
+        os.environ.get("SQLALCHEMY_DATABASE_URL", "postgresql://postgres:postgres@db:5432/app_db"),
+        os.environ["PYTEST_XDIST_WORKER"],
+    ).render_as_string(hide_password=False)
+
+import pytest
+from sqlalchemy import event, text
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
+
+from app.metrics import current_sql, is_transaction_control
+from app.models.core import Base
+from app.models.database import SessionLocal, engine
+from app.services import cache
+
+
+MAX_STATEMENT = 300
+
+
+class QueryRecorder:
+    def __init__(self):
+        self.requests = {}
+
+    def __call__(self, conn, cursor, statement, parameters, context, executemany):
+        tally = current_sql.get()
+        if tally is not None and not is_transaction_control(statement):
+            self.requests.setdefault(tally, []).append(statement)
+
+    def over_budget(self, budget):
+        return [(tally.request, statements) for tally, statements in self.requests.items() if len(statements) > budget]
+
+
+async def create_database(url):
+    """Create the PostgreSQL database of ``url`` unless it exists."""
+    server = create_async_engine(url.set(database="postgres"), isolation_level="AUTOCOMMIT", poolclass=NullPool)
+    try:
+        async with server.connect() as conn:
+            exists = await conn.scalar(text("SELECT 1 FROM pg_database WHERE datname = :name"), {"name": url.database})
+            if not exists:
+                await conn.execute(text(f'CREATE DATABASE "{url.database}"'))
+    finally:
+        await server.dispose()
+
+
+async def drop_database(url):
+    server = create_async_engine(url.set(database="postgres"), isolation_level="AUTOCOMMIT", poolclass=NullPool)
+    try:
+        async with server.connect() as conn:
+            await conn.execute(text(f'DROP DATABASE IF EXISTS "{url.database}"'))
+    finally:
+        await server.dispose()
+
+
+@pytest.fixture(scope="session", autouse=True)
+async def schema():
+    per_worker = engine.dialect.name == "postgresql" and "PYTEST_XDIST_WORKER" in os.environ
+    if per_worker:
+        await create_database(engine.url)
+    async with engine.begin() as conn:
+        # Start from the current models even if a previous run was interrupted.
+        await conn.run_sync(Base.metadata.drop_all)
+        await conn.run_sync(Base.metadata.create_all)
+    yield
+    async with engine.begin() as conn:
+        await conn.run_sync(Base.metadata.drop_all)
+    await engine.dispose()
+    if per_worker:
+        await drop_database(engine.url)
+
+
+@pytest.fixture(autouse=True)
+async def transaction(schema):
+    """The connection every session of the test runs on, rolled back at the end."""
+    await cache.clear()
+    async with engine.connect() as connection:
+        await connection.begin()
+        SessionLocal.configure(bind=connection, join_transaction_mode="create_savepoint")
+        try:
+            yield connection
+        finally:
+            SessionLocal.configure(bind=engine, join_transaction_mode="conditional_savepoint")
+            await connection.rollback()
+    await cache.clear()
+
+
+@pytest.fixture
+async def empty_database():
+    """An engine on a fresh, empty PostgreSQL database next to the test one."""
+    url = engine.url.set(database=f"{engine.url.database}_empty")
+    await drop_database(url)
+    await create_database(url)
+    scratch = create_async_engine(url, poolclass=NullPool)
+    try:
+        yield scratch
+    finally:
+        await scratch.dispose()
+        await drop_database(url)
+
+
+def pytest_runtest_setup(item):
+    if item.get_closest_marker("postgresql") and engine.dialect.name != "postgresql":
+        pytest.skip(f"needs PostgreSQL, running on {engine.dialect.name}")
+
+
+def _report(budget, offenders):
+    lines = []
+    for request, statements in offenders:
+        lines.append(f"{request} issued {len(statements)} SQL statements, budget is {budget}:")
+        for i, statement in enumerate(statements, start=1):
+            statement = " ".join(statement.split())
+            lines.append(f"  {i}. {statement if len(statement) <= MAX_STATEMENT else statement[:MAX_STATEMENT] + ' ...'}")
+    return "\n".join(lines)
+
+
+@pytest.hookimpl(wrapper=True)
+def pytest_runtest_call(item):
+    marker = item.get_closest_marker("query_budget")
+    if marker is None:
+        return (yield)
+
+    budget = marker.args[0]
+    recorder = QueryRecorder()
+    event.listen(engine.sync_engine, "before_cursor_execute", recorder)
+    try:
+        result = yield
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", recorder)
+    offenders = recorder.over_budget(budget)
+    if offenders:
+        pytest.fail(_report(budget, offenders), pytrace=False)
+    return result
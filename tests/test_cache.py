@@ -0,0 +1,213 @@
+import fnmatch
+import time
+from uuid import UUID
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import update
+from app.main import app
+from app.models.core import Dish
+from app.models.database import SessionLocal
+from app.services import cache
+from app.services.cache import MemoryCache, NullCache, RedisCache, create_cache
+
+import pytest
+
+
+client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test", follow_redirects=True)
+
+
+def _encode(value):
+    # Like redis-py: str values are sent UTF-8 encoded, bytes as is.
+    return value if isinstance(value, bytes) else value.encode()
+
+
+class FakeRedis:
+    """Local stand-in for the part of redis.asyncio the cache uses."""
+
+    def __init__(self):
+        self.data = {}
+
+    async def get(self, key):
+        value, expires_at = self.data.get(key, (None, None))
+        if expires_at is not None and expires_at < time.monotonic():
+            del self.data[key]
+            return None
+        return value
+
+    async def set(self, key, value, px=None):
+        self.data[key] = (_encode(value), time.monotonic() + px / 1000 if px else None)
+
+    async def hget(self, key, field):
+        fields = await self.get(key)
+        return None if fields is None else fields.get(field)
+
+    async def hset(self, key, field, value):
+        fields = await self.get(key)
+        if fields is None:
+            fields = {}
+            self.data[key] = (fields, None)
+        fields[field] = _encode(value)
+
+    async def pexpire(self, key, px, nx=False):
+        value, expires_at = self.data[key]
+        if not nx or expires_at is None:
+            self.data[key] = (value, time.monotonic() + px / 1000)
+
+    async def delete(self, *keys):
+        for key in keys:
+            self.data.pop(key, None)
+
+    async def scan_iter(self, match):
+        for key in list(self.data):
+            if fnmatch.fnmatch(key, match):
+                yield key
+
+
+@pytest.fixture(params=["memory", "redis"])
+async def backend(request, monkeypatch):
+    if request.param == "memory":
+        backend = MemoryCache(ttl=60, maxsize=100)
+    else:
+        backend = RedisCache(FakeRedis(), ttl=60)
+    monkeypatch.setattr(cache, "cache", backend)
+    yield backend
+
+
+async def test_memory_cache_expires_entries():
+    memory = MemoryCache(ttl=0.01, maxsize=10)
+    await memory.set("key", {"value": 1})
+    assert await memory.get("key") == {"value": 1}
+    time.sleep(0.02)
+    assert await memory.get("key") is None
+    assert memory.stats()["hits"] == 1
+    assert memory.stats()["misses"] == 1
+
+
+def test_memory_cache_refused_with_several_workers():
+    assert isinstance(create_cache("memory://", workers=1), MemoryCache)
+    assert isinstance(create_cache("none://", workers=4), NullCache)
+    with pytest.raises(ValueError, match="per process"):
+        create_cache("memory://", workers=4)
+
+
+async def test_memory_cache_evicts_least_recently_used():
+    memory = MemoryCache(ttl=60, maxsize=2)
+    await memory.set("a", 1)
+    await memory.set("b", 2)
+    await memory.get("a")
+    await memory.set("c", 3)
+    assert await memory.get("a") == 1
+    assert await memory.get("b") is None
+    assert await memory.get("c") == 3
+
+
+async def test_redis_cache_round_trip():
+    redis = RedisCache(FakeRedis(), ttl=60)
+    await redis.set("menu:1", {"title": "Menu", "dishes_count": 2})
+    assert await redis.get("menu:1") == {"title": "Menu", "dishes_count": 2}
+    await redis.delete("menu:1")
+    assert await redis.get("menu:1") is None
+    await redis.set_field("menus", ":100", {"items": [], "next_cursor": None})
+    assert await redis.get_field("menus", ":100") == {"items": [], "next_cursor": None}
+    assert await redis.get_field("menus", "other:100") is None
+    await redis.clear()
+    assert await redis.get("menus") is None
+
+
+async def test_get_menu_is_served_from_cache(backend):
+    response = await client.post("/api/v1/menus", json={"title": "Cached Menu", "description": "Cached menu description"})
+    assert response.status_code == 201
+    menu_id = response.json()["id"]
+
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.status_code == 200
+    misses = backend.misses
+
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.status_code == 200
+    assert response.json()["title"] == "Cached Menu"
+    assert backend.misses == misses
+    assert backend.hits >= 1
+
+    response = await client.get("/api/v1/stats/cache")
+    assert response.status_code == 200
+    assert response.json()["hits"] == backend.hits
+
+
+async def test_writes_invalidate_parent_counts(backend):
+    response = await client.post("/api/v1/menus", json={"title": "Cached Menu", "description": "Cached menu description"})
+    menu_id = response.json()["id"]
+
+    # Warm every key of the hierarchy
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Cached Submenu", "description": "Cached submenu description"})
+    submenu_id = response.json()["id"]
+    await client.get("/api/v1/menus")
+    await client.get(f"/api/v1/menus/{menu_id}")
+    await client.get(f"/api/v1/menus/{menu_id}/submenus")
+    await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes")
+
+    dish_data = {"title": "Cached Dish", "description": "Cached dish description", "price": '9.99'}
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+    assert response.status_code == 201
+    dish_id = response.json()["id"]
+
+    response = await client.get("/api/v1/menus")
+    assert next(menu for menu in response.json() if menu["id"] == menu_id)["dishes_count"] == 1
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.json()["dishes_count"] == 1
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus")
+    assert response.json()[0]["dishes_count"] == 1
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    assert response.json()["dishes_count"] == 1
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes")
+    assert len(response.json()) == 1
+
+    # Updating the dish refreshes both the dish and the list
+    await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    dish_data["title"] = "Renamed Dish"
+    response = await client.patch(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}", json=dish_data)
+    assert response.status_code == 200
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    assert response.json()["title"] == "Renamed Dish"
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes")
+    assert response.json()[0]["title"] == "Renamed Dish"
+
+    # Deleting the menu drops the whole cached subtree
+    response = await client.delete(f"/api/v1/menus/{menu_id}")
+    assert response.status_code == 200
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    assert response.status_code == 404
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    assert response.status_code == 404
+
+
+async def test_stale_entry_is_reloaded_for_the_new_etag(backend):
+    response = await client.post("/api/v1/menus", json={"title": "Cached Menu", "description": "Cached menu description"})
+    menu_id = response.json()["id"]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Cached Submenu", "description": "Cached submenu description"})
+    submenu_id = response.json()["id"]
+    dishes_url = f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes"
+    response = await client.post(dishes_url, json={"title": "Old title", "description": "Cached dish", "price": "9.99"})
+    dish_url = f"{dishes_url}/{response.json()['id']}"
+    for url in (dish_url, dishes_url):
+        await client.get(url)
+
+    # A write this process was not told about, e.g. made by another worker.
+    async with SessionLocal() as db:
+        await db.execute(update(Dish).where(Dish.id == UUID(dish_url.rsplit("/", 1)[1])).values(title="New title"))
+        await db.commit()
+
+    stale = backend.stale
+    response = await client.get(dish_url)
+    assert response.json()["title"] == "New title"
+    etag = response.headers["etag"]
+    response = await client.get(dishes_url)
+    assert response.json()[0]["title"] == "New title"
+    assert backend.stale == stale + 2
+
+    response = await client.get(dish_url, headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    response = await client.get(dish_url)
+    assert response.headers["etag"] == etag
+    assert response.json()["title"] == "New title"
@@ -1,34 +1,28 @@
-from fastapi.testclient import TestClient
-from sqlalchemy.orm import Session
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.main import app
 from app.models.database import get_db
 from app.models import schemas
 import pytest
+from uuid import uuid4
+from app.services import dishes as dish_service
 from app.models.database import engine
-from app.models.core import Base
-client = TestClient(app)
-
-# Create the tables before tests
-@pytest.fixture(scope="module", autouse=True)
-def create_tables():
-    Base.metadata.create_all(bind=engine)
-    yield
-    Base.metadata.drop_all(bind=engine)
+client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test", follow_redirects=True)
 
 @pytest.fixture(scope="function")
-def db():
-    with Session(engine) as session:
+async def db():
+    async with AsyncSession(engine) as session:
         yield session
-        session.rollback()
+        await session.rollback()
 
 
-def test_get_dishes_empty(db: Session):
+async def test_get_dishes_empty(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -37,25 +31,25 @@ def test_get_dishes_empty(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
     submenu_id = response.json()["id"]
 
     # Fetch dishes for the created submenu
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes")
 
     assert response.status_code == 200
     assert len(response.json()) == 0
 
 
 
-def test_get_dishes_not_empty(db: Session):
+async def test_get_dishes_not_empty(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -64,7 +58,7 @@ def test_get_dishes_not_empty(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
     submenu_id = response.json()["id"]
 
@@ -74,22 +68,22 @@ def test_get_dishes_not_empty(db: Session):
         "description": "My test dish description",
         "price": 9.99
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
     assert response.status_code == 201
 
     # Fetch dishes for the created submenu
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes")
 
     assert response.status_code == 200
     assert len(response.json()) == 1
 
-def test_create_dish(db: Session):
+async def test_create_dish(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -98,7 +92,7 @@ def test_create_dish(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
     submenu_id = response.json()["id"]
 
@@ -108,7 +102,7 @@ def test_create_dish(db: Session):
         "description": "My test dish description",
         "price": '9.99'
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
 
     assert response.status_code == 201
     assert response.json()["title"] == dish_data["title"]
@@ -116,13 +110,13 @@ def test_create_dish(db: Session):
     assert response.json()["price"] == dish_data["price"]
 
 
-def test_get_dish_by_id(db: Session):
+async def test_get_dish_by_id(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -131,7 +125,7 @@ def test_get_dish_by_id(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
     submenu_id = response.json()["id"]
 
@@ -141,25 +135,25 @@ def test_get_dish_by_id(db: Session):
         "description": "My test dish description",
         "price": '9.99'
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
     assert response.status_code == 201
     dish_id = response.json()["id"]
 
     # Fetch the created dish by its ID
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
     assert response.status_code == 200
     assert response.json()["title"] == dish_data["title"]
     assert response.json()["description"] == dish_data["description"]
     assert response.json()["price"] == dish_data["price"]
 
 
-def test_update_dish(db: Session):
+async def test_update_dish(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -168,7 +162,7 @@ def test_update_dish(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
     submenu_id = response.json()["id"]
 
@@ -178,7 +172,7 @@ def test_update_dish(db: Session):
         "description": "My test dish description",
         "price": 9.99
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
     assert response.status_code == 201
     dish_id = response.json()["id"]
 
@@ -188,23 +182,23 @@ def test_update_dish(db: Session):
         "description": "Updated dish description",
         "price": '12.99'
     }
-    response = client.patch(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}", json=updated_dish_data)
+    response = await client.patch(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}", json=updated_dish_data)
     assert response.status_code == 200
 
     # Fetch the updated dish and verify the changes
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
     assert response.status_code == 200
     assert response.json()["title"] == updated_dish_data["title"]
     assert response.json()["description"] == updated_dish_data["description"]
     assert response.json()["price"] == updated_dish_data["price"]
 
-def test_delete_dish(db: Session):
+async def test_delete_dish(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -213,7 +207,7 @@ def test_delete_dish(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
     submenu_id = response.json()["id"]
 
@@ -223,15 +217,182 @@ def test_delete_dish(db: Session):
         "description": "My test dish description",
         "price": '9.99'
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
     assert response.status_code == 201
     dish_id = response.json()["id"]
 
     # Delete the created dish
-    response = client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    response = await client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
     assert response.status_code == 200
 
     # Try to fetch the deleted dish and ensure it's not found
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    assert response.status_code == 404
+
+
+
+async def test_update_dish_version_conflict(db: AsyncSession):
+    response = await client.post("/api/v1/menus", json={"title": "Test Menu", "description": "Test menu description"})
+    menu_id = response.json()["id"]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Test Submenu", "description": "Test submenu description"})
+    submenu_id = response.json()["id"]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json={"title": "Test Dish", "description": "Test dish description", "price": "5.00"})
+    dish_id = response.json()["id"]
+
+    url = f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}"
+    response = await client.patch(url, json={"title": "Test Dish", "description": "Cheaper", "price": "4.00", "version": 1})
+    assert response.json()["version"] == 2
+    response = await client.patch(url, json={"title": "Test Dish", "description": "Dearer", "price": "6.00", "version": 1})
+    assert response.status_code == 409
+    response = await client.get(url)
+    assert response.json()["price"] == "4.00"
+
+
+async def test_dish_under_wrong_menu_not_found(db: AsyncSession):
+    response = await client.post("/api/v1/menus", json={"title": "Owner Menu", "description": "Owner menu description"})
+    menu_id = response.json()["id"]
+    response = await client.post("/api/v1/menus", json={"title": "Other Menu", "description": "Other menu description"})
+    other_id = response.json()["id"]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Owned Submenu", "description": "Owned submenu description"})
+    submenu_id = response.json()["id"]
+    dish_data = {"title": "Owned Dish", "description": "Owned dish description", "price": "3.00"}
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+    dish_id = response.json()["id"]
+
+    # The submenu exists, but not under the other menu
+    base = f"/api/v1/menus/{other_id}/submenus/{submenu_id}/dishes"
+    assert (await client.post(base, json=dish_data)).status_code == 404
+    assert (await client.get(base)).json() == []
+    assert (await client.get(f"{base}/{dish_id}")).status_code == 404
+    assert (await client.patch(f"{base}/{dish_id}", json={**dish_data, "price": "0.01"})).status_code == 404
+    assert (await client.delete(f"{base}/{dish_id}")).json()["status"] is False
+
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    assert response.json()["price"] == "3.00"
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    assert response.json()["dishes_count"] == 1
+
+
+async def test_create_dish_submenu_not_found(db: AsyncSession):
+    response = await client.post("/api/v1/menus", json={"title": "Test Menu", "description": "Test menu description"})
+    menu_id = response.json()["id"]
+
+    dish_data = {"title": "Orphan Dish", "description": "Orphan dish description", "price": "1.50"}
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{uuid4()}/dishes", json=dish_data)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "submenu not found"
+
+
+async def test_get_dishes_paginated(db: AsyncSession):
+    # Create a menu with a submenu holding five dishes
+    response = await client.post("/api/v1/menus", json={"title": "Test Menu", "description": "Test menu description"})
+    assert response.status_code == 201
+    menu_id = response.json()["id"]
+
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Test Submenu", "description": "My test submenu description"})
+    assert response.status_code == 201
+    submenu_id = response.json()["id"]
+
+    dish_ids = []
+    for i in range(5):
+        dish_data = {"title": f"Test Dish {i}", "description": "My test dish description", "price": '9.99'}
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+        assert response.status_code == 201
+        dish_ids.append(response.json()["id"])
+
+    # Walk the pages: creation order, no duplicates, no cursor on the last page
+    pages = []
+    url = f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes"
+    params = {"limit": 2}
+    while True:
+        response = await client.get(url, params=params)
+        assert response.status_code == 200
+        pages.append([dish["id"] for dish in response.json()])
+        if "X-Next-Cursor" not in response.headers:
+            break
+        params["cursor"] = response.headers["X-Next-Cursor"]
+
+    assert [len(page) for page in pages] == [2, 2, 1]
+    assert [dish_id for page in pages for dish_id in page] == dish_ids
+
+    response = await client.get(url, params={"cursor": "not-a-cursor"})
+    assert response.status_code == 400
+
+    response = await client.get(url, params={"limit": 0})
+    assert response.status_code == 422
+
+
+async def test_create_dishes_batch(db: AsyncSession):
+    # Create a menu with a submenu
+    response = await client.post("/api/v1/menus", json={"title": "Test Menu", "description": "Test menu description"})
+    assert response.status_code == 201
+    menu_id = response.json()["id"]
+
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Test Submenu", "description": "My test submenu description"})
+    assert response.status_code == 201
+    submenu_id = response.json()["id"]
+
+    # One invalid item among valid ones is reported without failing the batch
+    dishes_data = [
+        {"title": f"Batch Dish {i}", "description": "My batch dish description", "price": '9.99'}
+        for i in range(3)
+    ]
+    dishes_data.insert(1, {"title": "Batch Dish without price", "description": "My batch dish description"})
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes:batch", json=dishes_data)
+    assert response.status_code == 207
+    result = response.json()
+    assert result["created"] == 3
+    assert result["failed"] == 1
+    assert [item["index"] for item in result["results"]] == [0, 1, 2, 3]
+    assert [item["status"] for item in result["results"]] == [201, 422, 201, 201]
+    assert result["results"][1]["errors"][0]["loc"] == ["price"]
+
+    # The created dishes are listed and counted
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes")
+    assert [dish["id"] for dish in response.json()] == [item["id"] for item in result["results"] if item["status"] == 201]
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    assert response.json()["dishes_count"] == 3
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.json()["dishes_count"] == 3
+
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{uuid4()}/dishes:batch", json=dishes_data)
     assert response.status_code == 404
 
+
+async def test_create_dishes_batch_checks_the_path_in_the_insert(db: AsyncSession, monkeypatch):
+    async def no_separate_check(db, menu_id, submenu_id):
+        raise AssertionError("the INSERT checks the path")
+
+    response = await client.post("/api/v1/menus", json={"title": "Other Menu", "description": "Other menu description"})
+    other_menu_id = response.json()["id"]
+    response = await client.post(f"/api/v1/menus/{other_menu_id}/submenus", json={"title": "Other Submenu", "description": "Other submenu description"})
+    submenu_id = response.json()["id"]
+
+    monkeypatch.setattr(dish_service.submenu_service, "submenu_exists", no_separate_check)
+    dishes_data = [{"title": "Late Dish", "description": "My late dish description", "price": '9.99'}]
+    # An existing submenu under the wrong menu inserts nothing
+    response = await client.post(f"/api/v1/menus/{uuid4()}/submenus/{submenu_id}/dishes:batch", json=dishes_data)
+    assert response.status_code == 404
+    response = await client.get(f"/api/v1/menus/{other_menu_id}/submenus/{submenu_id}/dishes")
+    assert response.json() == []
+
+
+async def test_get_dishes_matches_get_dish(db: AsyncSession):
+    # The list is encoded with orjson from plain rows; it must render each
+    # dish exactly like the validated single-dish route.
+    response = await client.post("/api/v1/menus", json={"title": "Menu", "description": "Menu description"})
+    menu_id = response.json()["id"]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Submenu", "description": "Submenu description"})
+    submenu_id = response.json()["id"]
+    response = await client.post(
+        f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes",
+        json={"title": "Dish", "description": "Dish description", "price": "12.50"},
+    )
+    dish_id = response.json()["id"]
+
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes")
+    assert response.headers["content-type"] == "application/json"
+    [listed] = response.json()
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    assert listed == response.json()
+    assert listed["price"] == "12.50"
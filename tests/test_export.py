@@ -0,0 +1,86 @@
+import csv
+import io
+import json
+from uuid import uuid4
+
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+
+import pytest
+
+
+client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test", follow_redirects=True)
+
+
+@pytest.fixture
+async def menu_id():
+    response = await client.post("/api/v1/menus", json={"title": "Export Menu", "description": "Export menu description"})
+    menu_id = response.json()["id"]
+    for i in range(2):
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": f"Export Submenu {i}", "description": None})
+        submenu_id = response.json()["id"]
+        dishes_data = [{"title": f"Export Dish {j}", "description": "Export dish description", "price": '9.99'} for j in range(i * 3)]
+        await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes:batch", json=dishes_data)
+    await client.post("/api/v1/menus", json={"title": "Other Menu", "description": "Other menu description"})
+    return menu_id
+
+
+async def test_export_ndjson(menu_id):
+    response = await client.get("/api/v1/export", params={"menu_id": menu_id}, headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert "content-encoding" not in response.headers
+
+    lines = [json.loads(line) for line in response.text.splitlines()]
+    assert [line["type"] for line in lines] == ["menu", "submenu", "submenu", "dish", "dish", "dish"]
+    assert lines[0]["id"] == menu_id
+    assert lines[2]["menu_id"] == menu_id
+    assert all(line["submenu_id"] == lines[2]["id"] for line in lines[3:])
+    assert lines[3]["price"] == "9.99"
+
+
+async def test_export_gzip(menu_id):
+    response = await client.get("/api/v1/export", headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    menus = [json.loads(line)["title"] for line in response.text.splitlines() if '"type": "menu"' in line]
+    assert menus == ["Export Menu", "Other Menu"]
+
+
+@pytest.mark.parametrize("accept_encoding, gzipped", [
+    ("gzip;q=0", False),
+    ("gzip;q=0, identity", False),
+    ("*;q=0", False),
+    ("br", False),
+    ("deflate, gzip;q=0.5", True),
+    ("*", True),
+])
+async def test_export_gzip_quality(menu_id, accept_encoding, gzipped):
+    response = await client.get("/api/v1/export", params={"menu_id": menu_id}, headers={"Accept-Encoding": accept_encoding})
+    assert response.status_code == 200
+    assert ("content-encoding" in response.headers) == gzipped
+    assert json.loads(response.text.splitlines()[0])["id"] == menu_id
+
+
+# Goes back through the import, which needs PostgreSQL.
+@pytest.mark.postgresql
+async def test_export_csv_round_trip(menu_id):
+    response = await client.get("/api/v1/export", params={"menu_id": menu_id, "format": "csv"})
+    assert response.status_code == 200
+    rows = list(csv.DictReader(io.StringIO(response.text)))
+    assert len(rows) == 4
+    assert rows[0]["submenu_title"] == "Export Submenu 0"
+    assert rows[0]["dish_id"] == ""
+
+    # The export is a valid import that changes nothing
+    response = await client.post("/api/v1/import", params={"format": "csv"}, content=response.text)
+    assert response.status_code == 200
+    assert response.json()["dishes"] == 3
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.json()["submenus_count"] == 2
+    assert response.json()["dishes_count"] == 3
+
+
+async def test_export_unknown_menu():
+    response = await client.get("/api/v1/export", params={"menu_id": str(uuid4())})
+    assert response.status_code == 404
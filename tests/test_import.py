@@ -0,0 +1,130 @@
+import json
+import threading
+
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.services import catalog_import as import_service
+
+import pytest
+
+
+# The import loads its staging tables with COPY.
+pytestmark = pytest.mark.postgresql
+
+client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test", follow_redirects=True)
+
+CSV_CATALOG = """menu_title,menu_description,submenu_title,submenu_description,dish_title,dish_description,dish_price
+Import Menu,Imported menu,Starters,Cold starters,Salad,Green salad,5.50
+Import Menu,Imported menu,Starters,Cold starters,Soup,"Soup, of the day",4.00
+Import Menu,Imported menu,Mains,,Steak,Grilled steak,19.99
+Import Menu,Imported menu,Desserts,,,,
+"""
+
+
+async def find_menu(title):
+    response = await client.get("/api/v1/menus/tree", params={"limit": 1000})
+    return [menu for menu in response.json() if menu["title"] == title]
+
+
+async def test_import_csv():
+    response = await client.post("/api/v1/import", params={"format": "csv"}, content=CSV_CATALOG)
+    assert response.status_code == 200
+    report = response.json()
+    assert report["imported"] is True
+    assert (report["menus"], report["submenus"], report["dishes"]) == (1, 3, 3)
+    assert report["rows_per_second"] > 0
+
+    [menu] = await find_menu("Import Menu")
+    assert menu["submenus_count"] == 3
+    assert menu["dishes_count"] == 3
+    assert [submenu["title"] for submenu in menu["submenus"]] == ["Starters", "Mains", "Desserts"]
+    assert [dish["price"] for dish in menu["submenus"][0]["dishes"]] == ["5.50", "4.00"]
+    assert menu["submenus"][0]["dishes"][1]["description"] == "Soup, of the day"
+
+
+async def test_import_json_round_trip():
+    response = await client.post("/api/v1/import", params={"format": "csv"}, content=CSV_CATALOG)
+    assert response.status_code == 200
+    [menu] = await find_menu("Import Menu")
+
+    # Re-importing the exported tree with ids updates in place
+    menu["title"] = "Import Menu JSON"
+    menu["submenus"][0]["dishes"][0]["price"] = "6.00"
+    response = await client.post("/api/v1/import", params={"format": "json"}, content=json.dumps([menu]))
+    assert response.status_code == 200
+    assert response.json()["dishes"] == 3
+
+    assert await find_menu("Import Menu") == []
+    [updated] = await find_menu("Import Menu JSON")
+    assert updated["id"] == menu["id"]
+    assert updated["dishes_count"] == 3
+    assert updated["submenus"][0]["dishes"][0]["price"] == "6.00"
+
+
+async def test_import_dry_run():
+    catalog = CSV_CATALOG.replace("Import Menu", "Dry Run Menu")
+    response = await client.post("/api/v1/import", params={"format": "csv", "dry_run": True}, content=catalog)
+    assert response.status_code == 200
+    report = response.json()
+    assert report["dry_run"] is True
+    assert report["imported"] is False
+    assert report["dishes"] == 3
+    assert await find_menu("Dry Run Menu") == []
+
+
+async def test_import_reports_invalid_rows():
+    catalog = CSV_CATALOG.replace("5.50", "cheap").replace("Import Menu", "Invalid Menu")
+    response = await client.post("/api/v1/import", params={"format": "csv"}, content=catalog)
+    assert response.status_code == 422
+    report = response.json()
+    assert report["imported"] is False
+    assert report["errors"] == [{"at": "line 2", "error": "invalid price 'cheap'"}]
+    assert await find_menu("Invalid Menu") == []
+
+    response = await client.post("/api/v1/import", params={"format": "json"}, content='[{"title": ')
+    assert response.status_code == 422
+
+
+def many_dishes(count, first_price="9.99"):
+    rows = [f"Chunked Menu,,Mains,,Dish {i},,{first_price if i == 0 else '9.99'}" for i in range(count)]
+    return "menu_title,menu_description,submenu_title,submenu_description,dish_title,dish_description,dish_price\n" + "\n".join(rows)
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    copies, threads = [], set()
+    copy, parse_csv = import_service._copy, import_service.parse_csv
+
+    async def recording_copy(db, table, columns, records):
+        copies.append((table, len(records)))
+        await copy(db, table, columns, records)
+
+    def recording_parse(file, parser):
+        for item in parse_csv(file, parser):
+            threads.add(threading.current_thread())
+            yield item
+
+    monkeypatch.setattr(import_service, "CHUNK_SIZE", 4)
+    monkeypatch.setattr(import_service, "_copy", recording_copy)
+    monkeypatch.setitem(import_service.PARSERS, "csv", recording_parse)
+    return copies, threads
+
+
+async def test_import_copies_in_chunks_parsed_off_the_event_loop(small_chunks):
+    copies, threads = small_chunks
+    response = await client.post("/api/v1/import", params={"format": "csv"}, content=many_dishes(10))
+    assert response.status_code == 200
+    assert response.json()["dishes"] == 10
+
+    assert [rows for table, rows in copies if table == "import_dishes"] == [4, 4, 2]
+    assert threading.main_thread() not in threads
+
+
+async def test_import_counts_without_buffering_after_an_error(small_chunks):
+    copies, _ = small_chunks
+    response = await client.post("/api/v1/import", params={"format": "csv"}, content=many_dishes(10, first_price="free"))
+    assert response.status_code == 422
+    report = response.json()
+    assert report["dishes"] == 10
+    assert report["errors"] == [{"at": "line 2", "error": "invalid price 'free'"}]
+    assert copies == []
@@ -1,46 +1,45 @@
-from fastapi.testclient import TestClient
-from sqlalchemy.orm import Session
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.main import app
+from app.metrics import is_transaction_control
 from app.models.database import get_db
 from app.models import schemas
 import pytest
+from app.services import cache
 from app.models.database import engine
 from app.models.core import Base
-from app.models.core import Base, Menu 
-from uuid import uuid4
+from app.models.core import Base, Menu, Submenu
+from uuid import UUID, uuid4
+from sqlalchemy import event, update
+from argparse import Namespace
+from app import cli
+from app.models.database import SessionLocal
 
 
-client = TestClient(app)
-
-# Create the tables before tests
-@pytest.fixture(scope="module", autouse=True)
-def create_tables():
-    Base.metadata.create_all(bind=engine)
-    yield
-    Base.metadata.drop_all(bind=engine)
+client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test", follow_redirects=True)
 
 @pytest.fixture(scope="function")
-def db():
-    with Session(engine) as session:
+async def db():
+    async with AsyncSession(engine) as session:
         yield session
-        session.rollback()
+        await session.rollback()
 
-def test_get_menus_empty(db: Session):
-    response = client.get("/api/v1/menus")
+async def test_get_menus_empty(db: AsyncSession):
+    response = await client.get("/api/v1/menus")
     assert response.status_code == 200
     assert response.json() == []
 
-def test_get_menus_not_empty(db: Session):
+async def test_get_menus_not_empty(db: AsyncSession):
     # Create some menus in the database
     menu_create_payloads = [
         {"title": "Menu 1", "description": "Description 1"},
         {"title": "Menu 2", "description": "Description 2"},
     ]
     for payload in menu_create_payloads:
-        client.post("/api/v1/menus/", json=payload)
+        await client.post("/api/v1/menus/", json=payload)
    
     # Send a GET request to retrieve all menus
-    response = client.get("/api/v1/menus/")
+    response = await client.get("/api/v1/menus/")
    
     # Verify the response status code and JSON data
     assert response.status_code == 200
@@ -53,7 +52,7 @@ def test_get_menus_not_empty(db: Session):
         assert retrieved_menus[i]["submenus_count"] == 0
         assert retrieved_menus[i]["dishes_count"] == 0
 
-def test_create_menu(db: Session):
+async def test_create_menu(db: AsyncSession):
     # Prepare payload for creating a menu
     menu_create_payload = {
         "title": "New Menu",
@@ -61,7 +60,7 @@ def test_create_menu(db: Session):
     }
     
     # Send a POST request to create a menu
-    response = client.post("/api/v1/menus/", json=menu_create_payload)
+    response = await client.post("/api/v1/menus/", json=menu_create_payload)
     
     # Verify the response status code and JSON data
     assert response.status_code == 201
@@ -71,17 +70,17 @@ def test_create_menu(db: Session):
     assert created_menu["submenus_count"] == 0
     assert created_menu["dishes_count"] == 0
 
-def test_get_menu_by_id(db: Session):
+async def test_get_menu_by_id(db: AsyncSession):
     # Create a menu in the database
     menu_create_payload = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus/", json=menu_create_payload)
+    response = await client.post("/api/v1/menus/", json=menu_create_payload)
     created_menu = response.json()
     
     # Send a GET request to retrieve the created menu
-    response = client.get(f"/api/v1/menus/{created_menu['id']}")
+    response = await client.get(f"/api/v1/menus/{created_menu['id']}")
     
     # Verify the response status code and JSON data
     assert response.status_code == 200
@@ -93,49 +92,49 @@ def test_get_menu_by_id(db: Session):
     assert retrieved_menu["dishes_count"] == created_menu["dishes_count"]
 
 
-def test_delete_menu_not_found(db: Session):
+async def test_delete_menu_not_found(db: AsyncSession):
     # Generate a random UUID that is not present in the database
     non_existent_menu_id = uuid4()
 
     # Send a DELETE request to delete the non-existent menu
-    response = client.delete(f"/api/v1/menus/{non_existent_menu_id}")
+    response = await client.delete(f"/api/v1/menus/{non_existent_menu_id}")
 
     # Verify the response status code and the detail message
     assert response.status_code == 404
     assert response.json()["detail"] == "menu not found"
 
-def test_delete_menu_found(db: Session):
+async def test_delete_menu_found(db: AsyncSession):
     # Create a new menu for testing
     menu_create_payload = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus/", json=menu_create_payload)
+    response = await client.post("/api/v1/menus/", json=menu_create_payload)
 
     # Verify that the menu was created successfully
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
     # Send a DELETE request to delete the created menu
-    delete_response = client.delete(f"/api/v1/menus/{menu_id}")
+    delete_response = await client.delete(f"/api/v1/menus/{menu_id}")
 
     # Verify the response status code and the response message
     assert delete_response.status_code == 200
     assert delete_response.json() == {"status": True, "message": "The menu has been deleted"}
 
     # Verify that the menu is no longer present in the database
-    get_response = client.get(f"/api/v1/menus/{menu_id}")
+    get_response = await client.get(f"/api/v1/menus/{menu_id}")
     assert get_response.status_code == 404
     assert get_response.json()["detail"] == "menu not found"
 
-def test_update_menu_found(db: Session):
+async def test_update_menu_found(db: AsyncSession):
     # Create a menu first
     menu_create_payload = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
     
-    create_response = client.post("/api/v1/menus/", json=menu_create_payload)
+    create_response = await client.post("/api/v1/menus/", json=menu_create_payload)
     assert create_response.status_code == 201
     created_menu_id = create_response.json()["id"]
     
@@ -145,12 +144,12 @@ def test_update_menu_found(db: Session):
         "description": "Updated menu description"
     }
     
-    update_response = client.patch(f"/api/v1/menus/{created_menu_id}", json=updated_menu_data)
+    update_response = await client.patch(f"/api/v1/menus/{created_menu_id}", json=updated_menu_data)
     assert update_response.status_code == 200
     assert update_response.json()["title"] == updated_menu_data["title"]
     assert update_response.json()["description"] == updated_menu_data["description"]
 
-def test_update_menu_not_found(db: Session):
+async def test_update_menu_not_found(db: AsyncSession):
     # Menu ID that does not exist
     non_existent_menu_id = uuid4()
     
@@ -159,17 +158,17 @@ def test_update_menu_not_found(db: Session):
         "description": "Updated menu description"
     }
     
-    update_response = client.patch(f"/api/v1/menus/{non_existent_menu_id}", json=updated_menu_data)
+    update_response = await client.patch(f"/api/v1/menus/{non_existent_menu_id}", json=updated_menu_data)
     assert update_response.status_code == 404
 
 
-def test_menu_when_all_submenus_deleted(db: Session):
+async def test_menu_when_all_submenus_deleted(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -181,20 +180,339 @@ def test_menu_when_all_submenus_deleted(db: Session):
             "title": f"Test Submenu {i}",
             "description": "My test submenu description"
         }
-        response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
         assert response.status_code == 201
         submenu_ids.append(response.json()["id"])  # Store the created submenu ID
 
     # Delete all submenus
     for submenu_id in submenu_ids:
-        response = client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+        response = await client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
         assert response.status_code == 200
 
     # Fetch the menu again
-    response = client.get(f"/api/v1/menus/{menu_id}")
+    response = await client.get(f"/api/v1/menus/{menu_id}")
     assert response.status_code == 200
 
     # Assert that there are no submenus left
     assert response.json()["submenus_count"] == 0
     assert response.json()["dishes_count"] == 0
 
+
+
+async def test_get_menus_counts(db: AsyncSession):
+    # Create a menu
+    menu_data = {
+        "title": "Counted Menu",
+        "description": "Counted menu description"
+    }
+    response = await client.post("/api/v1/menus", json=menu_data)
+    assert response.status_code == 201
+    menu_id = response.json()["id"]
+
+    # Create two submenus with dishes in the first one
+    submenu_ids = []
+    for i in range(2):
+        submenu_data = {
+            "title": f"Counted Submenu {i}",
+            "description": "Counted submenu description"
+        }
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+        assert response.status_code == 201
+        submenu_ids.append(response.json()["id"])
+
+    for i in range(3):
+        dish_data = {
+            "title": f"Counted Dish {i}",
+            "description": "Counted dish description",
+            "price": '9.99'
+        }
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_ids[0]}/dishes", json=dish_data)
+        assert response.status_code == 201
+
+    # The list and the detail endpoint must report the same live counts
+    response = await client.get("/api/v1/menus")
+    assert response.status_code == 200
+    listed_menu = next(menu for menu in response.json() if menu["id"] == menu_id)
+    assert listed_menu["submenus_count"] == 2
+    assert listed_menu["dishes_count"] == 3
+
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.status_code == 200
+    assert response.json()["submenus_count"] == 2
+    assert response.json()["dishes_count"] == 3
+
+
+async def test_menu_counts_after_submenu_with_dishes_deleted(db: AsyncSession):
+    # Create a menu with one submenu holding two dishes
+    response = await client.post("/api/v1/menus", json={"title": "Test Menu", "description": "Test menu description"})
+    assert response.status_code == 201
+    menu_id = response.json()["id"]
+
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Test Submenu", "description": "My test submenu description"})
+    assert response.status_code == 201
+    submenu_id = response.json()["id"]
+
+    for i in range(2):
+        dish_data = {"title": f"Test Dish {i}", "description": "My test dish description", "price": '9.99'}
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+        assert response.status_code == 201
+
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.json()["submenus_count"] == 1
+    assert response.json()["dishes_count"] == 2
+
+    # Deleting the submenu takes its dishes out of the menu counters too
+    response = await client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    assert response.status_code == 200
+
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.json()["submenus_count"] == 0
+    assert response.json()["dishes_count"] == 0
+
+
+async def test_recount_repairs_corrupted_counters(db: AsyncSession):
+    response = await client.post("/api/v1/menus", json={"title": "Recount Menu", "description": "Recount menu description"})
+    menu_id = response.json()["id"]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Recount Submenu", "description": "Recount submenu description"})
+    submenu_id = response.json()["id"]
+    for i in range(2):
+        dish_data = {"title": f"Recount Dish {i}", "description": "Recount dish description", "price": '9.99'}
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+        assert response.status_code == 201
+
+    # Counters drift, e.g. after a load with the triggers disabled
+    async with SessionLocal() as session:
+        await session.execute(update(Menu).where(Menu.id == UUID(menu_id)).values(submenus_count=7, dishes_count=9))
+        await session.execute(update(Submenu).where(Submenu.id == UUID(submenu_id)).values(dishes_count=5))
+        await session.commit()
+    await cache.clear()
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert (response.json()["submenus_count"], response.json()["dishes_count"]) == (7, 9)
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    assert response.json()["dishes_count"] == 5
+
+    await cli.recount(Namespace())
+
+    # The cached payloads with the corrupted counts are gone as well
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert (response.json()["submenus_count"], response.json()["dishes_count"]) == (1, 2)
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    assert response.json()["dishes_count"] == 2
+
+
+async def test_get_menu_tree(db: AsyncSession):
+    response = await client.post("/api/v1/menus", json={"title": "Tree Menu", "description": "Tree menu description"})
+    assert response.status_code == 201
+    menu_id = response.json()["id"]
+
+    async def tree_statements(url):
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if not is_transaction_control(statement):
+                statements.append(statement)
+
+        event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+        try:
+            response = await client.get(url)
+        finally:
+            event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+        assert response.status_code == 200
+        return response.json(), len(statements)
+
+    async def add_submenu_with_dishes(i):
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": f"Tree Submenu {i}", "description": "Tree submenu description"})
+        submenu_id = response.json()["id"]
+        for j in range(2):
+            dish_data = {"title": f"Tree Dish {j}", "description": "Tree dish description", "price": '9.99'}
+            response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+            assert response.status_code == 201
+
+    await add_submenu_with_dishes(0)
+    tree, small_tree_statements = await tree_statements(f"/api/v1/menus/{menu_id}/tree")
+    assert len(tree["submenus"]) == 1
+
+    for i in range(1, 3):
+        await add_submenu_with_dishes(i)
+
+    tree, large_tree_statements = await tree_statements(f"/api/v1/menus/{menu_id}/tree")
+    assert large_tree_statements == small_tree_statements
+    assert tree["id"] == menu_id
+    assert tree["submenus_count"] == 3
+    assert tree["dishes_count"] == 6
+    assert len(tree["submenus"]) == 3
+    for submenu in tree["submenus"]:
+        assert submenu["dishes_count"] == 2
+        assert [dish["price"] for dish in submenu["dishes"]] == ['9.99', '9.99']
+
+    trees, _ = await tree_statements("/api/v1/menus/tree")
+    assert next(tree for tree in trees if tree["id"] == menu_id)["dishes_count"] == 6
+
+    response = await client.get(f"/api/v1/menus/{uuid4()}/tree")
+    assert response.status_code == 404
+
+
+async def test_conditional_get_menu(db: AsyncSession):
+    response = await client.post("/api/v1/menus", json={"title": "Etag Menu", "description": "Etag menu description"})
+    menu_id = response.json()["id"]
+
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert "Last-Modified" in response.headers
+
+    response = await client.get(f"/api/v1/menus/{menu_id}", headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+
+    response = await client.get("/api/v1/menus")
+    menus_etag = response.headers["ETag"]
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus")
+    submenus_etag = response.headers["ETag"]
+
+    # A new dish changes the versions of every ancestor
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Etag Submenu", "description": "Etag submenu description"})
+    submenu_id = response.json()["id"]
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    submenu_etag = response.headers["ETag"]
+    dish_data = {"title": "Etag Dish", "description": "Etag dish description", "price": "1.50"}
+    await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+
+    for url, old in [
+        (f"/api/v1/menus/{menu_id}", etag),
+        ("/api/v1/menus", menus_etag),
+        (f"/api/v1/menus/{menu_id}/submenus", submenus_etag),
+        (f"/api/v1/menus/{menu_id}/submenus/{submenu_id}", submenu_etag),
+    ]:
+        response = await client.get(url, headers={"If-None-Match": old})
+        assert response.status_code == 200, url
+        assert response.headers["ETag"] != old
+
+    response = await client.get(f"/api/v1/menus/{menu_id}/tree")
+    response = await client.get(f"/api/v1/menus/{menu_id}/tree", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+
+async def test_if_modified_since_is_not_answered_with_304(db: AsyncSession):
+    response = await client.post("/api/v1/menus", json={"title": "Dated Menu", "description": "Dated menu description"})
+    menu_id = response.json()["id"]
+    response = await client.post("/api/v1/menus", json={"title": "Doomed Menu", "description": "Doomed menu description"})
+    doomed_id = response.json()["id"]
+
+    response = await client.get("/api/v1/menus")
+    since = response.headers["Last-Modified"]
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    menu_since = response.headers["Last-Modified"]
+
+    # A delete leaves max(updated_at) of the list as it was
+    await client.delete(f"/api/v1/menus/{doomed_id}")
+    response = await client.get("/api/v1/menus", headers={"If-Modified-Since": since})
+    assert response.status_code == 200
+    assert [menu["id"] for menu in response.json()] == [menu_id]
+
+    # An edit within the same second as the read
+    await client.patch(f"/api/v1/menus/{menu_id}", json={"title": "Edited Menu", "description": "Dated menu description"})
+    response = await client.get(f"/api/v1/menus/{menu_id}", headers={"If-Modified-Since": menu_since})
+    assert response.status_code == 200
+    assert response.json()["title"] == "Edited Menu"
+    response = await client.get(f"/api/v1/menus/{menu_id}", headers={"If-Modified-Since": response.headers["Last-Modified"]})
+    assert response.status_code == 200
+
+
+async def test_get_missing_menu_looks_up_the_version_only(db: AsyncSession):
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not is_transaction_control(statement):
+            statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = await client.get(f"/api/v1/menus/{uuid4()}")
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 404
+    assert len(statements) == 1
+
+
+async def test_update_menu_if_match(db: AsyncSession):
+    response = await client.post("/api/v1/menus", json={"title": "Etag Menu", "description": "Etag menu description"})
+    menu_id = response.json()["id"]
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    etag = response.headers["ETag"]
+
+    update = {"title": "Renamed Menu", "description": "Renamed menu description"}
+    response = await client.patch(f"/api/v1/menus/{menu_id}", json=update, headers={"If-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+    # RETURNING reported the stored version
+    new_etag = response.headers["ETag"]
+    response = await client.get(f"/api/v1/menus/{menu_id}", headers={"If-None-Match": new_etag})
+    assert response.status_code == 304
+
+    # The old version is stale now
+    response = await client.patch(f"/api/v1/menus/{menu_id}", json=update, headers={"If-Match": etag})
+    assert response.status_code == 412
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.json()["title"] == "Renamed Menu"
+
+
+async def test_update_menu_version_conflict(db: AsyncSession):
+    response = await client.post("/api/v1/menus", json={"title": "Versioned Menu", "description": "Versioned menu description"})
+    menu_id = response.json()["id"]
+    assert response.json()["version"] == 1
+
+    # Counter changes are not edits
+    await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Submenu", "description": "Submenu description"})
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.json()["version"] == 1
+
+    response = await client.patch(f"/api/v1/menus/{menu_id}", json={"title": "First", "description": "First edit", "version": 1})
+    assert response.status_code == 200
+    assert response.json()["version"] == 2
+
+    # A second editor of version 1 lost the race
+    response = await client.patch(f"/api/v1/menus/{menu_id}", json={"title": "Second", "description": "Second edit", "version": 1})
+    assert response.status_code == 409
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.json()["title"] == "First"
+    assert response.json()["version"] == 2
+
+    response = await client.patch(f"/api/v1/menus/{uuid4()}", json={"title": "None", "description": "None", "version": 1})
+    assert response.status_code == 404
+
+
+async def test_delete_menu_single_statement(db: AsyncSession):
+    response = await client.post("/api/v1/menus", json={"title": "Doomed Menu", "description": "Doomed menu description"})
+    menu_id = response.json()["id"]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Doomed Submenu", "description": "Doomed submenu description"})
+    submenu_id = response.json()["id"]
+    dish_ids = []
+    for i in range(3):
+        dish_data = {"title": f"Doomed Dish {i}", "description": "Doomed dish description", "price": '1.00'}
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+        dish_ids.append(response.json()["id"])
+    # Warm the cache of the subtree
+    for dish_id in dish_ids:
+        await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not is_transaction_control(statement):
+            statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = await client.delete(f"/api/v1/menus/{menu_id}")
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200
+    assert len(statements) == 1
+
+    for dish_id in dish_ids:
+        response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+        assert response.status_code == 404
+    response = await client.delete(f"/api/v1/menus/{menu_id}")
+    assert response.status_code == 404
@@ -0,0 +1,46 @@
+from httpx import ASGITransport, AsyncClient
+from prometheus_client.parser import text_string_to_metric_families
+from app.main import app
+from app.services import cache
+
+
+client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test", follow_redirects=True)
+
+
+async def scrape():
+    response = await client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    samples = {}
+    for family in text_string_to_metric_families(response.text):
+        for sample in family.samples:
+            samples[sample.name, tuple(sorted(sample.labels.items()))] = sample.value
+    return samples
+
+
+def sample(samples, name, **labels):
+    return samples.get((name, tuple(sorted(labels.items()))), 0)
+
+
+async def test_metrics_per_route():
+    route = {"method": "GET", "route": "/api/v1/menus/{menu_id}"}
+    before = await scrape()
+
+    response = await client.post("/api/v1/menus/", json={"title": "Metrics Menu", "description": "Metrics menu description"})
+    menu_id = response.json()["id"]
+    await cache.cache.clear()
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.status_code == 200
+    response = await client.get("/api/v1/menus/00000000-0000-0000-0000-000000000000")
+    assert response.status_code == 404
+
+    after = await scrape()
+    assert sample(after, "http_requests_total", status="200", **route) - sample(before, "http_requests_total", status="200", **route) == 1
+    assert sample(after, "http_requests_total", status="404", **route) - sample(before, "http_requests_total", status="404", **route) == 1
+    assert sample(after, "http_request_duration_seconds_count", **route) - sample(before, "http_request_duration_seconds_count", **route) == 2
+    assert sample(after, "http_requests_in_progress", **route) == 0
+
+    # Version lookup and body load, then the version lookup alone for the missing menu
+    statements = sample(after, "http_request_sql_statements_sum", **route) - sample(before, "http_request_sql_statements_sum", **route)
+    assert statements == 3
+    assert sample(after, "http_request_sql_duration_seconds_sum", **route) > sample(before, "http_request_sql_duration_seconds_sum", **route)
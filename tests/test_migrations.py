@@ -0,0 +1,117 @@
+import os
+import sqlite3
+import subprocess
+import sys
+from uuid import uuid4
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.migration import MigrationContext
+from sqlalchemy import inspect, text
+from alembic.script import ScriptDirectory
+from app.cli import INITIAL_REVISION, _migrate, alembic_config
+from app.models.core import Base
+from app.models.search import include_object
+
+import pytest
+
+
+# Migrations are PostgreSQL DDL; they run against an empty database of their own.
+# SQLite gets the models' schema from migrate instead.
+
+
+def _diff(connection):
+    context = MigrationContext.configure(connection, opts={"include_object": include_object})
+    return compare_metadata(context, Base.metadata)
+
+
+@pytest.mark.postgresql
+async def test_migrations_match_models(empty_database):
+    async with empty_database.begin() as conn:
+        await conn.run_sync(_migrate, "head")
+        assert await conn.run_sync(_diff) == []
+        result = await conn.execute(text("SELECT tgname FROM pg_trigger WHERE NOT tgisinternal"))
+        assert {"dishes_counts_insert", "submenus_counts_delete", "dishes_touch_submenus"} <= set(result.scalars())
+
+        await conn.run_sync(lambda c: command.downgrade(alembic_config(c), "base"))
+        tables = await conn.run_sync(lambda c: inspect(c).get_table_names())
+        assert tables == ["alembic_version"]
+
+
+# What the first version of the app created with create_all at startup.
+BASELINE_DDL = [
+    "CREATE TABLE menus (id UUID NOT NULL, title VARCHAR, description VARCHAR, "
+    "submenus_count INTEGER, dishes_count INTEGER, PRIMARY KEY (id))",
+    "CREATE INDEX ix_menus_title ON menus (title)",
+    "CREATE INDEX ix_menus_description ON menus (description)",
+    "CREATE TABLE submenus (id UUID NOT NULL, title VARCHAR, description VARCHAR, dishes_count INTEGER, "
+    "menu_id UUID, PRIMARY KEY (id), FOREIGN KEY(menu_id) REFERENCES menus (id))",
+    "CREATE INDEX ix_submenus_title ON submenus (title)",
+    "CREATE TABLE dishes (id UUID NOT NULL, title VARCHAR, description VARCHAR, price NUMERIC(10, 2) NOT NULL, "
+    "submenu_id UUID, PRIMARY KEY (id), FOREIGN KEY(submenu_id) REFERENCES submenus (id))",
+    "CREATE INDEX ix_dishes_title ON dishes (title)",
+    "CREATE INDEX ix_dishes_description ON dishes (description)",
+]
+
+
+@pytest.mark.postgresql
+async def test_migrate_adopts_baseline_schema(empty_database):
+    menu_id, submenu_id = uuid4(), uuid4()
+    async with empty_database.begin() as conn:
+        for statement in BASELINE_DDL:
+            await conn.execute(text(statement))
+        # The old app left the counters at their Python-side default.
+        await conn.execute(text(
+            "INSERT INTO menus (id, title, description, submenus_count, dishes_count) VALUES (:id, 'Menu', 'Old', 0, 0)"
+        ), {"id": menu_id})
+        await conn.execute(text(
+            "INSERT INTO submenus (id, title, description, dishes_count, menu_id) VALUES (:id, 'Submenu', 'Old', NULL, :menu_id)"
+        ), {"id": submenu_id, "menu_id": menu_id})
+        await conn.execute(text(
+            "INSERT INTO dishes (id, title, description, price, submenu_id) "
+            "VALUES (gen_random_uuid(), 'Dish', 'Old', 1.50, :submenu_id), (gen_random_uuid(), 'Dish', 'Old', 2.50, :submenu_id)"
+        ), {"submenu_id": submenu_id})
+
+        await conn.run_sync(_migrate, "head")
+        assert await conn.run_sync(_diff) == []
+        counts = (await conn.execute(text("SELECT submenus_count, dishes_count, updated_at FROM menus"))).one()
+        assert counts[:2] == (1, 2)
+        assert await conn.scalar(text("SELECT dishes_count FROM submenus")) == 2
+
+        # The triggers are in place: counters and updated_at follow writes.
+        await conn.execute(text(
+            "INSERT INTO dishes (id, title, description, price, submenu_id) VALUES (gen_random_uuid(), 'New', 'New', 3, :submenu_id)"
+        ), {"submenu_id": submenu_id})
+        menu = (await conn.execute(text("SELECT dishes_count, updated_at FROM menus"))).one()
+        assert menu.dishes_count == 3
+        assert menu.updated_at > counts.updated_at
+
+
+@pytest.mark.postgresql
+async def test_migrate_adopts_schema_with_triggers(empty_database):
+    async with empty_database.begin() as conn:
+        # What create_all made just before migrations, without migration history
+        await conn.run_sync(lambda c: command.upgrade(alembic_config(c), INITIAL_REVISION))
+        await conn.execute(text("DROP TABLE alembic_version"))
+
+        await conn.run_sync(_migrate, "head")
+        assert await conn.run_sync(_diff) == []
+
+
+def test_migrate_creates_sqlite_schema(tmp_path):
+    path = tmp_path / "app.db"
+    env = {**os.environ, "SQLALCHEMY_DATABASE_URL": f"sqlite:///{path}"}
+    env.pop("PYTEST_XDIST_WORKER", None)
+    for _ in range(2):
+        # The second run finds the schema in place.
+        subprocess.run([sys.executable, "-m", "app.cli", "migrate"], env=env, check=True, capture_output=True)
+
+    head = ScriptDirectory.from_config(alembic_config()).get_current_head()
+    with sqlite3.connect(path) as db:
+        assert db.execute("SELECT version_num FROM alembic_version").fetchall() == [(head,)]
+        db.execute("PRAGMA foreign_keys = ON")
+        db.execute("INSERT INTO menus (id, title, description) VALUES ('m1', 'Menu', 'Menu')")
+        db.execute("INSERT INTO submenus (id, title, description, menu_id) VALUES ('s1', 'Submenu', 'Submenu', 'm1')")
+        db.execute("INSERT INTO dishes (id, title, description, price, submenu_id) VALUES ('d1', 'Dish', 'Dish', 1.5, 's1')")
+        # The counter triggers came with the schema.
+        assert db.execute("SELECT submenus_count, dishes_count FROM menus").fetchall() == [(1, 1)]
@@ -0,0 +1,42 @@
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+from app.models.database import _async_url
+
+import pytest
+
+
+client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test", follow_redirects=True)
+
+
+@pytest.fixture(autouse=True)
+async def transaction():
+    # Measure the pool as the app uses it, without a connection held by the test.
+    yield
+
+
+@pytest.mark.parametrize("url", [
+    "postgresql://user:secret@db:5432/app_db",
+    "postgresql+psycopg2://user:secret@db:5432/app_db",
+    "postgresql+asyncpg://user:secret@db:5432/app_db",
+])
+def test_database_url_uses_asyncpg(url):
+    assert _async_url(url).drivername == "postgresql+asyncpg"
+
+
+@pytest.mark.parametrize("url", ["sqlite://", "sqlite:///:memory:", "sqlite:///local.db"])
+def test_sqlite_url_uses_aiosqlite(url):
+    assert _async_url(url).drivername == "sqlite+aiosqlite"
+
+
+@pytest.mark.postgresql
+async def test_pool_stats():
+    response = await client.get("/api/v1/menus")
+    assert response.status_code == 200
+
+    response = await client.get("/api/v1/stats/pool")
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["checkouts"] >= 1
+    assert stats["checked_out"] == 0
+    assert stats["timeouts"] == 0
+    assert stats["wait_seconds_max"] >= stats["wait_seconds_avg"] >= 0
@@ -0,0 +1,246 @@
+"""SQL statement budgets for every endpoint, against a seeded catalog.
+
+The catalog is large enough (20 menus, 100 submenus, 1000 dishes) that a
+per-row query shows up as a blown budget.  The cache starts empty in every
+test, so the budgets hold for the uncached path.  Endpoints that only exist,
+or take a different path, on PostgreSQL are marked ``postgresql``.
+"""
+from decimal import Decimal
+from pathlib import Path
+from uuid import uuid4
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import insert
+from app.main import app
+from app.models.core import Dish, Menu, Submenu
+
+import pytest
+
+
+client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test", follow_redirects=True)
+
+MENUS = 20
+SUBMENUS_PER_MENU = 5
+DISHES_PER_SUBMENU = 10
+
+
+@pytest.fixture
+async def catalog(transaction):
+    """Seed the catalog in the test transaction; returns the ids of every dish with its parents."""
+    menus, submenus, dishes, ids = [], [], [], []
+    for m in range(MENUS):
+        menu_id = uuid4()
+        menus.append({"id": menu_id, "title": f"Menu {m}"})
+        for s in range(SUBMENUS_PER_MENU):
+            submenu_id = uuid4()
+            submenus.append({"id": submenu_id, "title": f"Submenu {s}", "menu_id": menu_id})
+            for d in range(DISHES_PER_SUBMENU):
+                dish_id = uuid4()
+                dishes.append({"id": dish_id, "title": f"Dish {d} soup", "description": "Budget dish", "price": Decimal("9.99"), "submenu_id": submenu_id})
+                ids.append((str(menu_id), str(submenu_id), str(dish_id)))
+    # One multi-row INSERT per table: the counter triggers then run once, not per row.
+    await transaction.execute(insert(Menu).values(menus))
+    await transaction.execute(insert(Submenu).values(submenus))
+    await transaction.execute(insert(Dish).values(dishes))
+    return ids
+
+
+@pytest.mark.query_budget(2)
+async def test_get_menus(catalog):
+    response = await client.get("/api/v1/menus/")
+    assert len(response.json()) == MENUS
+
+
+@pytest.mark.query_budget(4)
+async def test_get_menu_trees(catalog):
+    response = await client.get("/api/v1/menus/tree", params={"limit": MENUS})
+    assert len(response.json()) == MENUS
+
+
+@pytest.mark.query_budget(4)
+async def test_get_menu_tree(catalog):
+    menu_id, _, _ = catalog[0]
+    response = await client.get(f"/api/v1/menus/{menu_id}/tree")
+    assert len(response.json()["submenus"]) == SUBMENUS_PER_MENU
+
+
+@pytest.mark.query_budget(2)
+async def test_get_menu(catalog):
+    menu_id, _, _ = catalog[0]
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.json()["dishes_count"] == SUBMENUS_PER_MENU * DISHES_PER_SUBMENU
+    response = await client.get(f"/api/v1/menus/{menu_id}", headers={"If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+
+@pytest.mark.query_budget(1)
+async def test_create_menu(catalog):
+    response = await client.post("/api/v1/menus/", json={"title": "Budget Menu", "description": "Budget menu"})
+    assert response.status_code == 201
+
+
+@pytest.mark.query_budget(2)
+async def test_update_menu(catalog):
+    menu_id, _, _ = catalog[0]
+    response = await client.patch(f"/api/v1/menus/{menu_id}", json={"title": "Menu 0", "description": "Updated"})
+    assert response.status_code == 200
+    response = await client.patch(f"/api/v1/menus/{menu_id}", json={"title": "Menu 0", "description": "Updated"}, headers={"If-Match": response.headers["ETag"]})
+    assert response.status_code == 200
+
+
+@pytest.mark.query_budget(2)
+async def test_get_submenus(catalog):
+    menu_id, _, _ = catalog[0]
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/")
+    assert len(response.json()) == SUBMENUS_PER_MENU
+
+
+@pytest.mark.query_budget(2)
+async def test_get_submenu(catalog):
+    menu_id, submenu_id, _ = catalog[0]
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    assert response.json()["dishes_count"] == DISHES_PER_SUBMENU
+
+
+@pytest.mark.query_budget(1)
+async def test_create_submenu(catalog):
+    menu_id, _, _ = catalog[0]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/", json={"title": "Budget Submenu", "description": "Budget submenu"})
+    assert response.status_code == 201
+
+
+@pytest.mark.query_budget(1)
+async def test_create_submenus_batch(catalog):
+    menu_id, _, _ = catalog[0]
+    items = [{"title": f"Budget Submenu {i}", "description": "Budget submenu"} for i in range(50)]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus:batch", json=items)
+    assert response.json()["created"] == 50
+
+
+@pytest.mark.query_budget(1)
+async def test_update_submenu(catalog):
+    menu_id, submenu_id, _ = catalog[0]
+    response = await client.patch(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}", json={"title": "Submenu 0", "description": "Updated"})
+    assert response.status_code == 200
+
+
+@pytest.mark.query_budget(2)
+async def test_get_dishes(catalog):
+    menu_id, submenu_id, _ = catalog[0]
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/")
+    assert len(response.json()) == DISHES_PER_SUBMENU
+
+
+@pytest.mark.query_budget(2)
+async def test_get_dish(catalog):
+    menu_id, submenu_id, dish_id = catalog[0]
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    assert response.status_code == 200
+
+
+@pytest.mark.query_budget(1)
+async def test_create_dish(catalog):
+    menu_id, submenu_id, _ = catalog[0]
+    dish = {"title": "Budget Dish", "description": "Budget dish", "price": "1.00"}
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish)
+    assert response.status_code == 201
+
+
+@pytest.mark.query_budget(1)
+async def test_create_dishes_batch(catalog):
+    menu_id, submenu_id, _ = catalog[0]
+    items = [{"title": f"Budget Dish {i}", "description": "Budget dish", "price": "1.00"} for i in range(100)]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes:batch", json=items)
+    assert response.json()["created"] == 100
+
+
+@pytest.mark.query_budget(1)
+async def test_update_dish(catalog):
+    menu_id, submenu_id, dish_id = catalog[0]
+    dish = {"title": "Dish 0 soup", "description": "Updated", "price": "2.00"}
+    response = await client.patch(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}", json=dish)
+    assert response.status_code == 200
+
+
+@pytest.mark.query_budget(2)
+@pytest.mark.postgresql
+async def test_search(catalog):
+    response = await client.get("/api/v1/search/", params={"q": "soup", "limit": 50})
+    assert len(response.json()) == 50
+
+
+@pytest.mark.query_budget(1)
+async def test_export(catalog):
+    response = await client.get("/api/v1/export", params={"format": "ndjson"})
+    assert response.status_code == 200
+
+
+@pytest.mark.query_budget(6)
+@pytest.mark.postgresql
+async def test_import_dry_run(catalog):
+    content = "menu_title,submenu_title,dish_title,dish_description,dish_price\nBudget,Budget,Budget,Budget,1.00\n"
+    response = await client.post("/api/v1/import", params={"format": "csv", "dry_run": True}, content=content)
+    assert response.status_code == 200
+
+
+@pytest.mark.query_budget(0)
+async def test_stats(catalog):
+    for url in ["/api/v1/stats/cache", "/api/v1/stats/pool", "/metrics"]:
+        response = await client.get(url)
+        assert response.status_code == 200
+
+
+@pytest.mark.query_budget(1)
+async def test_delete_dish(catalog):
+    menu_id, submenu_id, dish_id = catalog[1]
+    response = await client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    assert response.json()["status"] is True
+
+
+@pytest.mark.query_budget(1)
+async def test_delete_submenu(catalog):
+    menu_id, submenu_id, _ = catalog[0]
+    response = await client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    assert response.status_code == 200
+
+
+@pytest.mark.query_budget(1)
+async def test_delete_menu(catalog):
+    menu_id, _, _ = catalog[0]
+    response = await client.delete(f"/api/v1/menus/{menu_id}")
+    assert response.status_code == 200
+
+
+def test_blown_budget_fails_with_the_statements(pytester, monkeypatch):
+    # A separate run on its own in-memory database, with this suite's plugin.
+    root = Path(__file__).resolve().parents[1]
+    monkeypatch.setenv("PYTHONPATH", str(root))
+    monkeypatch.setenv("SQLALCHEMY_DATABASE_URL", "sqlite:///:memory:")
+    monkeypatch.delenv("PYTEST_XDIST_WORKER", raising=False)
+    pytester.makeini((root / "pytest.ini").read_text())
+    pytester.makeconftest('pytest_plugins = ["tests.conftest"]')
+    pytester.makepyfile(
+        """
+        from httpx import ASGITransport, AsyncClient
+        from app.main import app
+
+        import pytest
+
+
+        @pytest.mark.query_budget(1)
+        async def test_over_budget():
+            async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as client:
+                response = await client.post("/api/v1/menus/", json={"title": "Menu", "description": "Menu"})
+                assert response.status_code == 201
+                await client.get(f"/api/v1/menus/{response.json()['id']}")
+        """
+    )
+
+    result = pytester.runpytest_subprocess("-p", "no:cacheprovider")
+    result.assert_outcomes(failed=1)
+    result.stdout.fnmatch_lines([
+        "*GET /api/v1/menus/{menu_id} issued 2 SQL statements, budget is 1:",
+        "  1. SELECT menus.updated_at *",
+        "  2. SELECT menus.* FROM menus WHERE menus.id = *",
+    ])
+    result.stdout.no_fnmatch_line("*POST /api/v1/menus*")
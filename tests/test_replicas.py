@@ -0,0 +1,156 @@
+import json
+from uuid import uuid4
+
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy import insert
+from sqlalchemy.engine import make_url
+from app.main import app
+from app.models import replicas
+from app.models.core import Base, Menu
+from app.models.database import Route, SessionLocal, create_engine, current_route, engine
+from app.models.replicas import PIN_COOKIE, ReplicaSet
+from app.services import cache
+from tests.conftest import create_database, drop_database
+
+import pytest
+
+
+def new_client():
+    # One per client of the app: the read_primary cookie must not leak between them.
+    return AsyncClient(transport=ASGITransport(app=app), base_url="http://test", follow_redirects=True)
+
+
+@pytest.fixture
+async def replica(tmp_path, monkeypatch):
+    """A second database standing in for a replica, with the schema and no rows.
+
+    It does not stream from the primary, so it never catches up with a write.
+    """
+    if engine.dialect.name == "postgresql":
+        url = engine.url.set(database=f"{engine.url.database}_replica")
+        await drop_database(url)
+        await create_database(url)
+    else:
+        url = make_url(f"sqlite+aiosqlite:///{tmp_path / 'replica.db'}")
+    replica_engine = create_engine(url)
+    async with replica_engine.begin() as conn:
+        await conn.run_sync(Base.metadata.create_all)
+    monkeypatch.setattr(replicas, "replica_set", ReplicaSet([replica_engine]))
+    try:
+        yield replica_engine
+    finally:
+        await replica_engine.dispose()
+        if engine.dialect.name == "postgresql":
+            await drop_database(url)
+
+
+async def test_get_reads_from_replica(replica):
+    async with replica.begin() as conn:
+        await conn.execute(insert(Menu).values(title="On the replica", description="Replica menu"))
+    async with SessionLocal() as db:
+        db.add(Menu(title="On the primary", description="Primary menu"))
+        await db.commit()
+
+    async with new_client() as client:
+        response = await client.get("/api/v1/menus/")
+        assert response.status_code == 200
+        assert [menu["title"] for menu in response.json()] == ["On the replica"]
+        stats = (await client.get("/api/v1/stats/replicas")).json()
+    assert stats["replicas"][0]["reads"] == 2
+    assert stats["primary_reads"] == 0
+
+
+async def test_export_reads_from_replica(replica):
+    async with replica.begin() as conn:
+        await conn.execute(insert(Menu).values(title="On the replica", description="Replica menu"))
+    async with SessionLocal() as db:
+        db.add(Menu(title="On the primary", description="Primary menu"))
+        await db.commit()
+
+    async with new_client() as client:
+        response = await client.get("/api/v1/export", headers={"Accept-Encoding": "identity"})
+    assert response.status_code == 200
+    assert [json.loads(line)["title"] for line in response.text.splitlines()] == ["On the replica"]
+
+
+async def test_client_reads_its_own_writes(replica):
+    async with new_client() as writer, new_client() as other:
+        response = await writer.post("/api/v1/menus/", json={"title": "Fresh", "description": "Just written"})
+        assert response.status_code == 201
+        assert PIN_COOKIE in writer.cookies
+        menu_id = response.json()["id"]
+
+        # The replica has not got the row, the writer is pinned to the primary.
+        response = await other.get(f"/api/v1/menus/{menu_id}")
+        assert response.status_code == 404
+        assert PIN_COOKIE not in other.cookies
+        response = await writer.get(f"/api/v1/menus/{menu_id}")
+        assert response.status_code == 200
+        assert response.json()["title"] == "Fresh"
+
+    assert replicas.replica_set.pinned_reads == 1
+    assert replicas.replica_set.replicas[0].reads == 1
+
+
+async def test_replica_reads_do_not_cache_over_a_recent_write(replica):
+    menu_id = uuid4()
+    async with replica.begin() as conn:
+        await conn.execute(insert(Menu).values(id=menu_id, title="Before", description="Lagging"))
+    async with SessionLocal() as db:
+        db.add(Menu(id=menu_id, title="Before", description="Lagging"))
+        await db.commit()
+
+    async with new_client() as writer, new_client() as other:
+        response = await writer.patch(f"/api/v1/menus/{menu_id}", json={"title": "After", "description": "Written"})
+        assert response.status_code == 200
+
+        response = await other.get(f"/api/v1/menus/{menu_id}")
+        assert response.json()["title"] == "Before"
+        assert await cache.cache.get(cache.menu_key(menu_id)) is None
+
+        response = await writer.get(f"/api/v1/menus/{menu_id}")
+        assert response.json()["title"] == "After"
+        # Pinned reads do not fill the cache either.
+        assert await cache.cache.get(cache.menu_key(menu_id), response.headers["etag"]) is None
+
+
+async def test_pinned_read_does_not_store_what_it_loaded():
+    # A pinned load may have started before another client's write: nothing
+    # marks it stale, so it must not store its result.
+    async def load():
+        await cache.invalidate([cache.menus_key()])
+        return [{"title": "Before the write"}], None
+
+    token = current_route.set(Route(pinned=True))
+    try:
+        value = await cache.cached_rows(cache.menus_key(), "page", load)
+    finally:
+        current_route.reset(token)
+    assert value["items"] == [{"title": "Before the write"}]
+    assert await cache.cache.get_field(cache.menus_key(), "page") is None
+
+
+async def test_failing_replica_is_ejected(tmp_path, monkeypatch):
+    if engine.dialect.name == "postgresql":
+        url = engine.url.set(host="127.0.0.1", port=1)
+    else:
+        url = make_url(f"sqlite+aiosqlite:///{tmp_path / 'missing' / 'replica.db'}")
+    broken = create_engine(url)
+    monkeypatch.setattr(replicas, "replica_set", ReplicaSet([broken], eject_seconds=60))
+
+    async with new_client() as writer, new_client() as reader:
+        response = await writer.post("/api/v1/menus/", json={"title": "Primary only", "description": "Still served"})
+        assert response.status_code == 201
+
+        for _ in range(2):
+            response = await reader.get("/api/v1/menus/")
+            assert response.status_code == 200
+            assert [menu["title"] for menu in response.json()] == ["Primary only"]
+
+        stats = (await reader.get("/api/v1/stats/replicas")).json()
+    await broken.dispose()
+
+    assert stats["primary_reads"] == 3
+    assert stats["replicas"][0]["healthy"] is False
+    assert stats["replicas"][0]["ejections"] == 1
+    assert stats["replicas"][0]["last_error"]
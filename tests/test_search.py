@@ -0,0 +1,73 @@
+from httpx import ASGITransport, AsyncClient
+from app.main import app
+
+import pytest
+
+
+# Ranking, stemming and typo tolerance are PostgreSQL full-text features.
+pytestmark = pytest.mark.postgresql
+
+client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test", follow_redirects=True)
+
+
+@pytest.fixture
+async def catalog():
+    response = await client.post("/api/v1/menus", json={"title": "Dinner", "description": "Evening menu"})
+    menu_id = response.json()["id"]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Soups", "description": "Hot tomato and onion soups"})
+    submenu_id = response.json()["id"]
+    dishes = [
+        {"title": "Tomato soup", "description": "Roasted tomatoes with basil", "price": "5.50"},
+        {"title": "Onion soup", "description": "French onion soup with cheese", "price": "6.00"},
+        {"title": "Bread", "description": "Served with tomato butter", "price": "2.00"},
+    ]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes:batch", json=dishes)
+    assert response.status_code == 201
+    return menu_id, submenu_id
+
+
+async def test_search_ranks_title_matches_first(catalog):
+    menu_id, submenu_id = catalog
+    response = await client.get("/api/v1/search", params={"q": "tomatoes"})
+    assert response.status_code == 200
+    results = response.json()
+    # Stemming matches "tomato" too; title matches outrank descriptions.
+    assert [result["title"] for result in results][:1] == ["Tomato soup"]
+    assert {result["title"] for result in results} == {"Tomato soup", "Bread", "Soups"}
+    ranks = [result["rank"] for result in results]
+    assert ranks == sorted(ranks, reverse=True)
+
+    dish = results[0]
+    assert dish["kind"] == "dish"
+    assert dish["price"] == "5.50"
+    assert dish["path"] == {"menu_id": menu_id, "menu_title": "Dinner", "submenu_id": submenu_id, "submenu_title": "Soups"}
+    submenu = next(result for result in results if result["kind"] == "submenu")
+    assert submenu["path"] == {"menu_id": menu_id, "menu_title": "Dinner", "submenu_id": None, "submenu_title": None}
+
+
+async def test_search_paginates(catalog):
+    response = await client.get("/api/v1/search", params={"q": "soup"})
+    expected = [result["id"] for result in response.json()]
+    assert len(expected) == 3
+
+    seen = []
+    cursor = None
+    while True:
+        params = {"q": "soup", "limit": 1} if cursor is None else {"q": "soup", "limit": 1, "cursor": cursor}
+        response = await client.get("/api/v1/search", params=params)
+        seen += [result["id"] for result in response.json()]
+        cursor = response.headers.get("X-Next-Cursor")
+        if cursor is None:
+            break
+    assert seen == expected
+
+
+async def test_search_without_matches(catalog):
+    response = await client.get("/api/v1/search", params={"q": "dessert"})
+    assert response.status_code == 200
+    assert response.json() == []
+
+    response = await client.get("/api/v1/search", params={"q": ""})
+    assert response.status_code == 422
+    response = await client.get("/api/v1/search", params={"q": "soup", "cursor": "garbage"})
+    assert response.status_code == 400
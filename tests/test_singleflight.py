@@ -0,0 +1,166 @@
+import asyncio
+from uuid import uuid4
+
+from httpx import ASGITransport, AsyncClient
+from prometheus_client import REGISTRY
+from app.main import app
+from app.services import cache
+from app.services.singleflight import Group
+
+import pytest
+
+
+client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test", follow_redirects=True)
+
+
+def coalesced_reads(key):
+    return REGISTRY.get_sample_value("coalesced_reads_total", {"key": key}) or 0
+
+
+async def test_concurrent_calls_share_one_load():
+    group = Group()
+    release = asyncio.Event()
+    loads = 0
+
+    async def load(flight):
+        nonlocal loads
+        loads += 1
+        number = loads
+        await release.wait()
+        return {"load": number}
+
+    calls = [asyncio.create_task(group.do("menu:1", "", load)) for _ in range(5)]
+    other = asyncio.create_task(group.do("menu:1", "version", load))
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*calls, other)
+
+    assert loads == 2
+    assert results == [{"load": 1}] * 5 + [{"load": 2}]
+    assert group.stats() == {"leaders": 2, "coalesced": 4, "in_flight": 0}
+
+
+async def test_errors_reach_every_caller():
+    group = Group()
+    release = asyncio.Event()
+
+    async def load(flight):
+        await release.wait()
+        raise RuntimeError("database down")
+
+    calls = [asyncio.create_task(group.do("menus", "", load)) for _ in range(3)]
+    await asyncio.sleep(0)
+    release.set()
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    assert [str(result) for result in results] == ["database down"] * 3
+
+
+async def test_follower_takes_over_from_cancelled_leader():
+    group = Group()
+    release = asyncio.Event()
+    loads = 0
+
+    async def load(flight):
+        nonlocal loads
+        loads += 1
+        await release.wait()
+        return loads
+
+    leader = asyncio.create_task(group.do("menus", "", load))
+    await asyncio.sleep(0)
+    follower = asyncio.create_task(group.do("menus", "", load))
+    await asyncio.sleep(0)
+    leader.cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    assert await follower == 2
+    with pytest.raises(asyncio.CancelledError):
+        await leader
+
+
+async def test_cancelled_follower_leaves_the_flight_running():
+    group = Group()
+    release = asyncio.Event()
+
+    async def load(flight):
+        await release.wait()
+        return "loaded"
+
+    leader = asyncio.create_task(group.do("menus", "", load))
+    await asyncio.sleep(0)
+    followers = [asyncio.create_task(group.do("menus", "", load)) for _ in range(2)]
+    await asyncio.sleep(0)
+    followers[0].cancel()
+    await asyncio.sleep(0)
+    release.set()
+
+    with pytest.raises(asyncio.CancelledError):
+        await followers[0]
+    assert await followers[1] == "loaded"
+    assert await leader == "loaded"
+    assert group.leaders == 1
+
+
+async def test_write_during_load_is_not_served_stale():
+    started, release = asyncio.Event(), asyncio.Event()
+
+    async def before_write():
+        started.set()
+        await release.wait()
+        return [{"title": "before"}], None
+
+    async def after_write():
+        return [{"title": "after"}], None
+
+    first = asyncio.create_task(cache.cached_rows("menus", "page", lambda: before_write()))
+    await started.wait()
+    # The write commits and invalidates while the first load is in flight:
+    # later readers must not join it, and its result must not be stored.
+    await cache.invalidate([cache.menus_key()])
+    second = await cache.cached_rows("menus", "page", after_write)
+    release.set()
+    await first
+
+    assert second["items"] == [{"title": "after"}]
+    assert (await cache.cache.get_field("menus", "page"))["items"] == [{"title": "after"}]
+
+
+async def test_subtree_delete_detaches_version_lookups():
+    started, release = asyncio.Event(), asyncio.Event()
+    menu_id, key = uuid4(), cache.dish_key(uuid4(), uuid4())
+
+    async def before_delete():
+        started.set()
+        await release.wait()
+        return "before"
+
+    async def after_delete():
+        return None
+
+    first = asyncio.create_task(cache.coalesced(key, cache.path_field(menu_id), before_delete))
+    await started.wait()
+    # Deleting the menu takes the dish without naming its key.
+    await cache.invalidate_subtree(menu_id, [cache.menu_key(menu_id)])
+    second = await cache.coalesced(key, cache.path_field(menu_id), after_delete)
+    release.set()
+
+    assert await first == "before"
+    assert second is None
+
+
+async def test_concurrent_gets_of_cold_menu_run_one_query_each():
+    response = await client.post("/api/v1/menus/", json={"title": "Hot menu", "description": "Launch day"})
+    menu_id = response.json()["id"]
+    await cache.clear()
+    before = coalesced_reads("menu")
+
+    responses = await asyncio.gather(*(client.get(f"/api/v1/menus/{menu_id}") for _ in range(10)))
+
+    assert {response.status_code for response in responses} == {200}
+    assert {response.json()["title"] for response in responses} == {"Hot menu"}
+    assert len({response.headers["etag"] for response in responses}) == 1
+    # One version lookup and one load, the other nine requests joined both
+    assert coalesced_reads("menu") - before == 18
+    stats = (await client.get("/api/v1/stats/cache")).json()
+    assert stats["flights"]["in_flight"] == 0
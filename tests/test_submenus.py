@@ -1,56 +1,52 @@
-from fastapi.testclient import TestClient
-from sqlalchemy.orm import Session
+from httpx import ASGITransport, AsyncClient
+from sqlalchemy.ext.asyncio import AsyncSession
 from app.main import app
+from app.metrics import is_transaction_control
 from app.models.database import get_db
 from app.models import schemas
-from app.models.core import Base
 from app.models.core import Submenu
 from app.models.database import engine
 
 import pytest
+from app.services import cache
+from app.services import submenus as submenu_service
 from uuid import uuid4
+from sqlalchemy import event
 
 
-client = TestClient(app)
+client = AsyncClient(transport=ASGITransport(app=app), base_url="http://test", follow_redirects=True)
 
 
-# Create the tables before tests
-@pytest.fixture(scope="module", autouse=True)
-def create_tables():
-    Base.metadata.create_all(bind=engine)
-    yield
-    Base.metadata.drop_all(bind=engine)
-
 @pytest.fixture(scope="function")
-def db():
-    with Session(engine) as session:
+async def db():
+    async with AsyncSession(engine) as session:
         yield session
-        session.rollback()
+        await session.rollback()
 
-def test_get_submenus_empty(db: Session):
+async def test_get_submenus_empty(db: AsyncSession):
     # Create a menu to use its ID
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
     # Fetch submenus for the created menu
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus")
 
     assert response.status_code == 200
     assert response.json() == []
 
 
-def test_get_submenus_not_empty(db: Session):
+async def test_get_submenus_not_empty(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -71,22 +67,22 @@ def test_get_submenus_not_empty(db: Session):
     ]
     
     for submenu_data in submenu_data_list:
-        response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
         assert response.status_code == 201
 
     # Fetch submenus for the created menu
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus")
 
     assert response.status_code == 200
     assert len(response.json()) == len(submenu_data_list)
 
-def test_get_submenu_by_id(db: Session):
+async def test_get_submenu_by_id(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -95,12 +91,12 @@ def test_get_submenu_by_id(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
     submenu_id = response.json()["id"]
 
     # Fetch the created submenu by its ID
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
 
     assert response.status_code == 200
     assert response.json()["id"] == submenu_id
@@ -108,13 +104,13 @@ def test_get_submenu_by_id(db: Session):
     assert response.json()["description"] == submenu_data["description"]
 
 
-def test_update_submenu(db: Session):
+async def test_update_submenu(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -123,7 +119,7 @@ def test_update_submenu(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
     submenu_id = response.json()["id"]
 
@@ -132,7 +128,7 @@ def test_update_submenu(db: Session):
         "title": "Updated Submenu Title",
         "description": "Updated submenu description"
     }
-    response = client.patch(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}", json=updated_data)
+    response = await client.patch(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}", json=updated_data)
     assert response.status_code == 200
 
     # Fetch the updated submenu and verify its attributes
@@ -141,13 +137,46 @@ def test_update_submenu(db: Session):
     assert updated_submenu["description"] == updated_data["description"]
 
 
-def test_create_submenu(db: Session):
+async def test_update_submenu_version_conflict(db: AsyncSession):
+    response = await client.post("/api/v1/menus", json={"title": "Test Menu", "description": "Test menu description"})
+    menu_id = response.json()["id"]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Test Submenu", "description": "Test submenu description"})
+    submenu_id = response.json()["id"]
+
+    url = f"/api/v1/menus/{menu_id}/submenus/{submenu_id}"
+    response = await client.patch(url, json={"title": "First", "description": "First edit", "version": 1})
+    assert response.json()["version"] == 2
+    response = await client.patch(url, json={"title": "Second", "description": "Second edit", "version": 1})
+    assert response.status_code == 409
+    response = await client.patch(url, json={"title": "Second", "description": "Second edit", "version": 2})
+    assert response.status_code == 200
+    assert response.json()["version"] == 3
+
+
+async def test_submenu_under_wrong_menu_not_found(db: AsyncSession):
+    response = await client.post("/api/v1/menus", json={"title": "Owner Menu", "description": "Owner menu description"})
+    menu_id = response.json()["id"]
+    response = await client.post("/api/v1/menus", json={"title": "Other Menu", "description": "Other menu description"})
+    other_id = response.json()["id"]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json={"title": "Owned Submenu", "description": "Owned submenu description"})
+    submenu_id = response.json()["id"]
+
+    url = f"/api/v1/menus/{other_id}/submenus/{submenu_id}"
+    assert (await client.get(url)).status_code == 404
+    assert (await client.patch(url, json={"title": "Stolen", "description": "Stolen"})).status_code == 404
+    assert (await client.delete(url)).status_code == 404
+
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    assert response.json()["title"] == "Owned Submenu"
+
+
+async def test_create_submenu(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -156,7 +185,7 @@ def test_create_submenu(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
 
     # Fetch the created submenu and verify its attributes
@@ -166,27 +195,33 @@ def test_create_submenu(db: Session):
     assert created_submenu["description"] == submenu_data["description"]
     assert created_submenu["dishes_count"] == 0  # Assuming no dishes are added yet
 
-def test_delete_submenu_not_found(db: Session):
+async def test_create_submenu_menu_not_found(db: AsyncSession):
+    submenu_data = {"title": "Orphan Submenu", "description": "Orphan submenu description"}
+    response = await client.post(f"/api/v1/menus/{uuid4()}/submenus", json=submenu_data)
+    assert response.status_code == 404
+    assert response.json()["detail"] == "menu not found"
+
+async def test_delete_submenu_not_found(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
     # Attempt to delete a submenu that doesn't exist
-    response = client.delete(f"/api/v1/menus/{menu_id}/submenus/{uuid4()}")
+    response = await client.delete(f"/api/v1/menus/{menu_id}/submenus/{uuid4()}")
     assert response.status_code == 404
 
-def test_delete_submenu_found(db: Session):
+async def test_delete_submenu_found(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -195,25 +230,25 @@ def test_delete_submenu_found(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
     submenu_id = response.json()["id"]
 
     # Delete the created submenu
-    response = client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    response = await client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
     assert response.status_code == 200
 
     # Fetch the deleted submenu and verify it's not found
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
     assert response.status_code == 404
 
-def test_delete_submenu_cascading(db: Session):
+async def test_delete_submenu_cascading(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -222,7 +257,7 @@ def test_delete_submenu_cascading(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
     submenu_id = response.json()["id"]
 
@@ -232,29 +267,29 @@ def test_delete_submenu_cascading(db: Session):
         "description": "My test dish description",
         "price": '9.99'
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
     assert response.status_code == 201
     dish_id = response.json()["id"]
 
     # Delete the submenu
-    response = client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    response = await client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
     assert response.status_code == 200
 
     # Attempt to fetch the deleted submenu and dish and ensure they're not found
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
     assert response.status_code == 404
 
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
     assert response.status_code == 404
 
 
-def test_submenu_when_all_dishes_deleted(db: Session):
+async def test_submenu_when_all_dishes_deleted(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -263,7 +298,7 @@ def test_submenu_when_all_dishes_deleted(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
     submenu_id = response.json()["id"]
 
@@ -278,30 +313,30 @@ def test_submenu_when_all_dishes_deleted(db: Session):
             "submenu_id": submenu_id
 
         }
-        response = client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
         assert response.status_code == 201
         dish_ids.append(response.json()["id"])  # Store the created dish ID
 
     # Delete all dishes from the submenu
     for dish_id in dish_ids:
-        response = client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+        response = await client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
         assert response.status_code == 200
 
     # Fetch the submenu again
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
     assert response.status_code == 200
 
     # Assert that there are no dishes left
     assert response.json()["dishes_count"] == 0
 
 
-def test_submenu_when_one_of_three_dishes_deleted(db: Session):
+async def test_submenu_when_one_of_three_dishes_deleted(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -310,7 +345,7 @@ def test_submenu_when_one_of_three_dishes_deleted(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
     submenu_id = response.json()["id"]
 
@@ -324,29 +359,29 @@ def test_submenu_when_one_of_three_dishes_deleted(db: Session):
             "price": '9.99',
             "submenu_id": submenu_id
         }
-        response = client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
         assert response.status_code == 201
         dish_ids.append(response.json()["id"])  # Store the created dish ID
 
     dish_id = dish_ids[0]
-    response = client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    response = await client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
     assert response.status_code == 200
 
     # Fetch the submenu again
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
     assert response.status_code == 200
 
     # Assert that there are no dishes left
     assert response.json()["dishes_count"] == 2
 
 
-def test_submenu_when_two_of_three_dishes_deleted(db: Session):
+async def test_submenu_when_two_of_three_dishes_deleted(db: AsyncSession):
     # Create a menu
     menu_data = {
         "title": "Test Menu",
         "description": "Test menu description"
     }
-    response = client.post("/api/v1/menus", json=menu_data)
+    response = await client.post("/api/v1/menus", json=menu_data)
     assert response.status_code == 201
     menu_id = response.json()["id"]
 
@@ -355,7 +390,7 @@ def test_submenu_when_two_of_three_dishes_deleted(db: Session):
         "title": "Test Submenu",
         "description": "My test submenu description"
     }
-    response = client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
     assert response.status_code == 201
     submenu_id = response.json()["id"]
 
@@ -369,20 +404,102 @@ def test_submenu_when_two_of_three_dishes_deleted(db: Session):
             "price": '9.99',
             "submenu_id": submenu_id
         }
-        response = client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
         assert response.status_code == 201
         dish_ids.append(response.json()["id"])  # Store the created dish ID
 
     dish_id = dish_ids[0]
-    response = client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    response = await client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
     assert response.status_code == 200
     dish_id = dish_ids[1]
-    response = client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
+    response = await client.delete(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes/{dish_id}")
     assert response.status_code == 200
 
     # Fetch the submenu again
-    response = client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
     assert response.status_code == 200
 
     # Assert that there are no dishes left
     assert response.json()["dishes_count"] == 1
+
+
+async def count_statements(url):
+    # Measure the database work, not the cache
+    await cache.cache.clear()
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not is_transaction_control(statement):
+            statements.append(statement)
+
+    event.listen(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    try:
+        response = await client.get(url)
+    finally:
+        event.remove(engine.sync_engine, "before_cursor_execute", before_cursor_execute)
+    assert response.status_code == 200
+    return len(statements)
+
+
+async def test_get_submenus_statement_count_is_constant(db: AsyncSession):
+    # Create a menu
+    response = await client.post("/api/v1/menus", json={"title": "Test Menu", "description": "Test menu description"})
+    assert response.status_code == 201
+    menu_id = response.json()["id"]
+
+    async def add_submenu_with_dishes(i):
+        submenu_data = {"title": f"Test Submenu {i}", "description": "My test submenu description"}
+        response = await client.post(f"/api/v1/menus/{menu_id}/submenus", json=submenu_data)
+        assert response.status_code == 201
+        submenu_id = response.json()["id"]
+        for j in range(3):
+            dish_data = {"title": f"Test Dish {j}", "description": "My test dish description", "price": '9.99'}
+            response = await client.post(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}/dishes", json=dish_data)
+            assert response.status_code == 201
+        return submenu_id
+
+    submenu_id = await add_submenu_with_dishes(0)
+    list_statements = await count_statements(f"/api/v1/menus/{menu_id}/submenus")
+    detail_statements = await count_statements(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}")
+
+    for i in range(1, 6):
+        await add_submenu_with_dishes(i)
+
+    # Growing the menu must not add queries to the list or the detail endpoint
+    assert await count_statements(f"/api/v1/menus/{menu_id}/submenus") == list_statements
+    assert await count_statements(f"/api/v1/menus/{menu_id}/submenus/{submenu_id}") == detail_statements
+
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus")
+    assert all(submenu["dishes_count"] == 3 for submenu in response.json())
+
+
+async def test_create_submenus_batch(db: AsyncSession):
+    # Create a menu
+    response = await client.post("/api/v1/menus", json={"title": "Test Menu", "description": "Test menu description"})
+    assert response.status_code == 201
+    menu_id = response.json()["id"]
+
+    submenus_data = [{"title": f"Batch Submenu {i}", "description": "My batch submenu description"} for i in range(3)]
+    response = await client.post(f"/api/v1/menus/{menu_id}/submenus:batch", json=submenus_data)
+    assert response.status_code == 201
+    result = response.json()
+    assert result["created"] == 3
+    assert result["failed"] == 0
+
+    response = await client.get(f"/api/v1/menus/{menu_id}/submenus")
+    assert [submenu["title"] for submenu in response.json()] == [submenu["title"] for submenu in submenus_data]
+    response = await client.get(f"/api/v1/menus/{menu_id}")
+    assert response.json()["submenus_count"] == 3
+
+    response = await client.post(f"/api/v1/menus/{uuid4()}/submenus:batch", json=submenus_data)
+    assert response.status_code == 404
+
+
+async def test_create_submenus_batch_checks_the_menu_in_the_insert(db: AsyncSession, monkeypatch):
+    async def no_separate_check(db, menu_id):
+        raise AssertionError("the INSERT checks the menu")
+
+    monkeypatch.setattr(submenu_service.menu_service, "menu_exists", no_separate_check)
+    submenus_data = [{"title": "Late Submenu", "description": "My late submenu description"}]
+    response = await client.post(f"/api/v1/menus/{uuid4()}/submenus:batch", json=submenus_data)
+    assert response.status_code == 404